@@ -0,0 +1,93 @@
+# benchmarks/bench_get_children.py
+"""
+Mide el ahorro de cachear el orden de los hijos en FileSystemNode.get_children.
+
+Construye en memoria (sin tocar el disco) un árbol sintético de ~1M nodos y recorre
+el árbol completo varias veces, como lo harían comandos 'print' o 'search' repetidos,
+comparando la versión anterior (ordenar en cada llamada) con la actual (orden cacheado).
+
+Uso (desde Actividades/Directory-tree):
+    python benchmarks/bench_get_children.py [--nodes 1000000] [--fanout 50] [--passes 3]
+"""
+
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.filesystem_node import FileSystemNode, NodeMetadata
+
+
+def build_synthetic_tree(total_nodes: int, fanout: int, seed: int = 42) -> FileSystemNode:
+    """Árbol en anchura con `fanout` hijos por directorio (10% directorios) y nombres desordenados."""
+    rng = random.Random(seed)
+    root = FileSystemNode(0, "root", "/synthetic", True, NodeMetadata())
+    queue = [root]
+    next_id = 1
+    while next_id < total_nodes and queue:
+        parent = queue.pop(0)
+        for _ in range(fanout):
+            if next_id >= total_nodes:
+                break
+            is_directory = rng.random() < 0.1
+            name = f"{'dir' if is_directory else 'file'}_{rng.randrange(10**9):09d}"
+            child = FileSystemNode(next_id, name, name, is_directory, NodeMetadata(st_size=rng.randrange(1 << 20)))
+            parent.add_child(child)
+            if is_directory:
+                queue.append(child)
+            next_id += 1
+    return root
+
+
+def _walk(root: FileSystemNode, get_children) -> int:
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        if node.is_directory:
+            stack.extend(get_children(node))
+    return count
+
+
+def _uncached_get_children(node: FileSystemNode):
+    # Implementación anterior: ordenar en cada llamada
+    return sorted(node.children, key=lambda child: (not child.is_directory, child.name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, default=1_000_000)
+    parser.add_argument('--fanout', type=int, default=50)
+    parser.add_argument('--passes', type=int, default=3, help='Recorridos completos del árbol (simula comandos repetidos).')
+    args = parser.parse_args()
+
+    print(f"Construyendo árbol sintético de {args.nodes} nodos (fan-out {args.fanout})...")
+    root = build_synthetic_tree(args.nodes, args.fanout)
+
+    results = {}
+    for label, get_children in (("sin caché (ordenar siempre)", _uncached_get_children),
+                                ("con caché (get_children)", FileSystemNode.get_children)):
+        timings = []
+        for _ in range(args.passes):
+            start = time.perf_counter()
+            visited = _walk(root, get_children)
+            timings.append(time.perf_counter() - start)
+        results[label] = timings
+        print(f"{label:<30} nodos={visited}  " + "  ".join(f"{t:.3f}s" for t in timings))
+
+    uncached = results["sin caché (ordenar siempre)"]
+    cached = results["con caché (get_children)"]
+    print(f"Tiempo total: {sum(uncached):.3f}s -> {sum(cached):.3f}s ({sum(uncached) / sum(cached):.1f}x)")
+    if args.passes > 1:
+        # El primer recorrido con caché paga el ordenamiento; los siguientes lo reutilizan
+        repeated_uncached = sum(uncached[1:]) / (args.passes - 1)
+        repeated_cached = sum(cached[1:]) / (args.passes - 1)
+        print(f"Recorridos repetidos: {repeated_uncached:.3f}s -> {repeated_cached:.3f}s ({repeated_uncached / repeated_cached:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
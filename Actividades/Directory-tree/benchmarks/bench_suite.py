@@ -0,0 +1,273 @@
+# benchmarks/bench_suite.py
+"""
+Benchmark de las operaciones principales de DirectoryTree sobre árboles sintéticos en disco.
+
+Genera (una sola vez, de forma determinista a partir de la semilla) un árbol de directorios por
+escala, con fan-out, profundidad, número de archivos, tamaños y nombres configurables, y mide
+scan (secuencial, paralelo y leyendo/indexando contenido), print, save, search por nombre, tamaño
+y contenido, y open. Cada operación se repite --repeat veces y se informa el mínimo y la mediana.
+
+Los árboles se guardan en --tree-dir y se reutilizan mientras los parámetros no cambien, así que
+los escaneos se miden con la caché de páginas caliente (antes de medir se hace un escaneo de
+calentamiento): lo que se compara entre versiones es el coste de la herramienta, no el del disco.
+
+Con --json se guardan los resultados; con --compare se comparan con un JSON anterior y el script
+termina con código 1 si alguna mediana empeora más de --threshold veces (para usarlo en CI).
+
+Uso (desde Actividades/Directory-tree):
+    python benchmarks/bench_suite.py [--scales small,medium] [--repeat 3] [--json actual.json]
+                                     [--compare anterior.json] [--threshold 1.25]
+    python benchmarks/bench_suite.py --scales custom --fanout 12 --depth 3 --files-per-dir 40
+"""
+
+import io
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import contextlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.directory_tree import DirectoryTree
+
+# Escalas predefinidas: (fan-out de directorios, profundidad, archivos por directorio)
+SCALES = {
+    'small': (6, 3, 8), # ~260 directorios, ~2 mil archivos
+    'medium': (8, 4, 10), # ~4.7 mil directorios, ~47 mil archivos
+    'large': (10, 5, 12), # ~111 mil directorios, ~1.3 millones de archivos
+}
+
+# Extensiones con su peso relativo y vocabulario para los nombres (se eligen con una distribución de Zipf)
+EXTENSIONS = [('.txt', 30), ('.py', 15), ('.json', 10), ('.log', 10), ('.md', 8), ('.csv', 8),
+              ('.jpg', 7), ('.bin', 5), ('.html', 4), ('', 3)]
+WORDS = ("data report image backup config notes draft final project music video archive test "
+         "build cache index export summary invoice photo lecture chapter module release").split()
+NEEDLE = "aguja_en_el_pajar" # Texto que contiene una fracción de los archivos (búsqueda por contenido)
+MARKER = ".bench_params.json"
+
+
+def _zipf_choice(rng: random.Random, items: list, s: float = 1.1):
+    weights = [1 / (rank + 1) ** s for rank in range(len(items))]
+    return rng.choices(items, weights)[0]
+
+
+def _file_name(rng: random.Random, name_style: str, index: int) -> str:
+    extension = rng.choices([ext for ext, _ in EXTENSIONS], [weight for _, weight in EXTENSIONS])[0]
+    if name_style == 'numbered':
+        return f"file_{index:06d}{extension}"
+    if name_style == 'random':
+        return f"{rng.getrandbits(48):012x}{extension}"
+    return f"{_zipf_choice(rng, WORDS)}_{_zipf_choice(rng, WORDS)}_{rng.randrange(10000)}{extension}"
+
+
+def _file_size(rng: random.Random, median_size: int, max_size: int) -> int:
+    """Tamaño log-normal (muchos archivos pequeños y unos pocos grandes) acotado a max_size."""
+    if median_size <= 0:
+        return 0
+    return min(max_size, int(rng.lognormvariate(math.log(median_size), 1.5)))
+
+
+def generate_tree(
+    root: Path,
+    fanout: int,
+    depth: int,
+    files_per_dir: int,
+    median_size: int = 512,
+    max_size: int = 32 * 1024,
+    name_style: str = 'words',
+    needle_ratio: float = 0.02,
+    seed: int = 42
+) -> dict:
+    """
+    Crea en root un árbol determinista: cada directorio tiene entre la mitad y 1.5 veces
+    files_per_dir archivos y, hasta la profundidad indicada, fanout subdirectorios. El contenido
+    es texto pseudoaleatorio; una fracción needle_ratio de los archivos contiene NEEDLE.
+    Si root ya contiene un árbol generado con los mismos parámetros, se reutiliza; si no (o si
+    la generación anterior no terminó), se borra y se genera de nuevo.
+
+    Returns:
+        dict: Los parámetros y los totales del árbol (directorios, archivos, bytes).
+    """
+    params = {'fanout': fanout, 'depth': depth, 'files_per_dir': files_per_dir, 'median_size': median_size,
+              'max_size': max_size, 'name_style': name_style, 'needle_ratio': needle_ratio, 'seed': seed}
+    marker = root / MARKER
+    if marker.exists():
+        saved = json.loads(marker.read_text(encoding='utf-8'))
+        if saved.get('params') == params:
+            return saved
+    # Otros parámetros o una generación interrumpida (sin marcador): generar sobre los archivos
+    # que queden cambiaría los nombres por colisiones y el árbol dejaría de ser determinista
+    shutil.rmtree(root, ignore_errors=True)
+
+    rng = random.Random(seed)
+    text = " ".join(rng.choice(WORDS) for _ in range(16 * 1024)).encode() # Bloque del que se toma el contenido
+    totals = {'directories': 0, 'files': 0, 'bytes': 0}
+    file_index = 0
+    stack = [(root, 0)]
+    while stack:
+        directory, level = stack.pop()
+        directory.mkdir(parents=True, exist_ok=True)
+        totals['directories'] += 1
+        for _ in range(rng.randint(files_per_dir // 2, files_per_dir * 3 // 2)):
+            size = _file_size(rng, median_size, max_size)
+            start = rng.randrange(len(text))
+            data = (text[start:] + text)[:size]
+            if rng.random() < needle_ratio:
+                data = NEEDLE.encode() + data
+            path = directory / _file_name(rng, name_style, file_index)
+            if path.exists(): # Colisión de nombres: hacerlo único
+                path = path.with_name(f"{path.stem}_{file_index}{path.suffix}")
+            path.write_bytes(data)
+            file_index += 1
+            totals['files'] += 1
+            totals['bytes'] += len(data)
+        if level < depth:
+            for i in range(fanout):
+                stack.append((directory / f"{_zipf_choice(rng, WORDS)}_{level + 1}_{i}", level + 1))
+
+    info = {'params': params, **totals}
+    marker.write_text(json.dumps(info), encoding='utf-8')
+    return info
+
+
+def _time(operation, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()): # La herramienta informa por consola
+            start = time.perf_counter()
+            operation()
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _scan(path: Path, **options) -> DirectoryTree:
+    tree = DirectoryTree()
+    tree.scan(str(path), **options)
+    return tree
+
+
+def run_scale(name: str, root: Path, repeat: int, workers: int, open_count: int, seed: int) -> list[dict]:
+    """Mide todas las operaciones sobre el árbol de root y devuelve una fila por operación."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        _scan(root) # Calentamiento: la caché de páginas queda con los directorios y metadatos
+        tree = _scan(root, read_content=True, index_content=True)
+    nodes = len(tree.node_index)
+    files = [node for node in tree.node_index.values() if not node.is_directory]
+    open_ids = [node.node_id for node in random.Random(seed).sample(files, min(open_count, len(files)))]
+    save_file = Path(tempfile.mkdtemp(prefix="dtree_bench_")) / "tree.txt"
+
+    operations = {
+        'scan': lambda: _scan(root),
+        f'scan --workers {workers}': lambda: _scan(root, workers=workers),
+        'scan --read-content --index-content': lambda: _scan(root, read_content=True, index_content=True),
+        'print': lambda: tree.print_tree(),
+        'save': lambda: tree.save_tree_printout(str(save_file)),
+        'search name=*.txt': lambda: tree.search_nodes(name='*.txt'),
+        'search min_size=8KB max_size=16KB': lambda: tree.search_nodes(min_size='8KB', max_size='16KB'),
+        f'search content={NEEDLE}': lambda: tree.search_nodes(content=NEEDLE),
+        f'open x{len(open_ids)}': lambda: [tree.display_node_details(node_id) for node_id in open_ids],
+    }
+    rows = []
+    try:
+        for operation, function in operations.items():
+            timings = _time(function, repeat)
+            rows.append({'scale': name, 'operation': operation, 'nodes': nodes, 'runs': timings,
+                         'min': min(timings), 'median': statistics.median(timings)})
+            print(f"  {operation:<40} {rows[-1]['median'] * 1000:10.1f} ms")
+    finally:
+        shutil.rmtree(save_file.parent, ignore_errors=True)
+    return rows
+
+
+def print_table(rows: list[dict], previous: dict[tuple[str, str], dict], threshold: float) -> int:
+    """Imprime la tabla de resultados (comparada con la ejecución anterior, si la hay) y devuelve el número de regresiones."""
+    header = f"{'escala':<8} {'operación':<40} {'nodos':>9} {'mín (ms)':>10} {'mediana (ms)':>13} {'nodos/s':>11}"
+    if previous: header += f" {'anterior (ms)':>14} {'cambio':>8}"
+    print("\n" + header)
+    print("-" * len(header))
+    regressions = 0
+    for row in rows:
+        median = row['median']
+        line = (f"{row['scale']:<8} {row['operation']:<40} {row['nodes']:>9} {row['min'] * 1000:>10.1f} "
+                f"{median * 1000:>13.1f} {row['nodes'] / median if median > 0 else 0:>11.0f}")
+        before = previous.get((row['scale'], row['operation']))
+        if before is not None and before['median'] > 0:
+            ratio = median / before['median']
+            line += f" {before['median'] * 1000:>14.1f} {ratio:>7.2f}x"
+            if ratio > threshold:
+                line += "  REGRESIÓN"
+                regressions += 1
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=str, default='small,medium', help=f"Escalas separadas por comas: {', '.join(SCALES)} o custom.")
+    parser.add_argument('--fanout', type=int, default=8, help='Subdirectorios por directorio (escala custom).')
+    parser.add_argument('--depth', type=int, default=3, help='Niveles de subdirectorios (escala custom).')
+    parser.add_argument('--files-per-dir', type=int, default=10, help='Archivos por directorio en promedio (escala custom).')
+    parser.add_argument('--median-size', type=int, default=512, help='Mediana del tamaño de los archivos en bytes (distribución log-normal).')
+    parser.add_argument('--max-size', type=int, default=32 * 1024, help='Tamaño máximo de un archivo en bytes.')
+    parser.add_argument('--name-style', choices=['words', 'random', 'numbered'], default='words',
+                        help='Nombres de archivo: palabras con frecuencia de Zipf, hexadecimales aleatorios o numerados.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--tree-dir', type=str, default=str(Path(tempfile.gettempdir()) / "dtree_bench"),
+                        help='Dónde generar (y reutilizar) los árboles sintéticos.')
+    parser.add_argument('--repeat', type=int, default=3, help='Repeticiones de cada operación (se informa mínimo y mediana).')
+    parser.add_argument('--workers', type=int, default=4, help='Hilos para el escaneo paralelo.')
+    parser.add_argument('--open-count', type=int, default=200, help='Nodos que se abren en la operación open.')
+    parser.add_argument('--json', type=str, default=None, help='Guardar los resultados en este archivo JSON.')
+    parser.add_argument('--compare', type=str, default=None, help='JSON de una ejecución anterior con el que comparar.')
+    parser.add_argument('--threshold', type=float, default=1.25, help='Cociente de medianas a partir del cual se marca una regresión.')
+    args = parser.parse_args()
+
+    previous = {}
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = {(row['scale'], row['operation']): row for row in json.load(f)['results']}
+
+    rows, trees = [], {}
+    for scale in [name.strip() for name in args.scales.split(',') if name.strip()]:
+        if scale == 'custom':
+            shape = (args.fanout, args.depth, args.files_per_dir)
+        elif scale in SCALES:
+            shape = SCALES[scale]
+        else:
+            parser.error(f"escala desconocida: '{scale}'")
+        root = Path(args.tree_dir) / f"{scale}_{shape[0]}x{shape[1]}x{shape[2]}_{args.name_style}_{args.seed}"
+        print(f"Escala {scale}: generando/reutilizando árbol en {root}...")
+        info = generate_tree(root, *shape, median_size=args.median_size, max_size=args.max_size,
+                             name_style=args.name_style, seed=args.seed)
+        print(f"  {info['directories']} directorios, {info['files']} archivos, {info['bytes'] / (1024 * 1024):.1f} MB")
+        trees[scale] = info
+        rows += run_scale(scale, root, max(1, args.repeat), max(1, args.workers), args.open_count, args.seed)
+
+    regressions = print_table(rows, previous, args.threshold)
+    if args.json:
+        result = {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'repeat': args.repeat,
+            'trees': trees,
+            'results': rows,
+        }
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados guardados en: {args.json}")
+    if regressions:
+        print(f"\n{regressions} operaciones empeoraron más de {args.threshold:g}x respecto a {args.compare}.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
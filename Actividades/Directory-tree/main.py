@@ -1,12 +1,31 @@
 # main.py
 
+import io
 import sys
+import time
 import argparse
 import shlex
+import datetime
+import contextlib
 from pathlib import Path
 
 # Importar la clase DirectoryTree desde el paquete src
 from src.directory_tree import DirectoryTree
+from src.tree_watcher import TreeWatcher
+from src.query import parse_query, QueryError
+
+def parse_byte_size(size_str: str) -> int:
+    """Convierte tamaños como '512MB', '2GB', '64KB' o '1048576' en bytes (tipo para argparse)."""
+    size_str = size_str.strip().upper()
+    multipliers = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+    try:
+        for suffix, multiplier in multipliers.items():
+            if size_str.endswith(suffix):
+                return int(float(size_str[:-2]) * multiplier)
+        return int(size_str)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"tamaño inválido: '{size_str}' (use p. ej. 512MB o 2GB)")
+
 
 # --- Definición de Parsers para cada comando ---
 # Usamos add_help=False para que el main loop maneje la impresión de ayuda
@@ -14,7 +33,7 @@ from src.directory_tree import DirectoryTree
 
 # Parser para el comando 'j-scan' (el configurable)
 j_scan_parser = argparse.ArgumentParser(add_help=False)
-j_scan_parser.add_argument('path', type=str, help='Ruta inicial del directorio a escanear (j-scan)')
+j_scan_parser.add_argument('path', type=str, nargs='?', default=None, help='Ruta inicial del directorio a escanear (j-scan). No hace falta con --resume.')
 j_scan_parser.add_argument('--depth', type=int, default=-1, help='Profundidad máxima (ej: 2). -1 para ilimitado (por defecto). 0 para solo raíz.')
 # Opciones de lectura de contenido: mutuamente excluyentes en cuanto a *qué* se guarda.
 # El usuario puede elegir entre: no leer, previsualizar, leer completo en memoria, o leer completo a disco.
@@ -22,12 +41,30 @@ j_scan_parser.add_argument('--depth', type=int, default=-1, help='Profundidad m
 j_scan_parser.add_argument('--read-content', action='store_true', help='Leer previsualización de contenido de archivos (por defecto si no se especifica otra opción de contenido).')
 j_scan_parser.add_argument('--read-full-content', action='store_true', help='Leer CONTENIDO COMPLETO de los archivos EN MEMORIA (¡PELIGROSO para directorios grandes!).')
 j_scan_parser.add_argument('--save-content-to-disk', type=str, help='Directorio donde guardar copias del CONTENIDO COMPLETO de los archivos en disco.')
+j_scan_parser.add_argument('--compress', choices=['zlib', 'zstd'], default=None, help='Comprimir los blobs guardados con --save-content-to-disk (zstd requiere el paquete opcional zstandard; si falta se usa zlib).')
+j_scan_parser.add_argument('--memory-budget', type=parse_byte_size, default=None, help='Con --read-full-content: memoria máxima para contenido completo (ej: 512MB). Los archivos que no quepan se vuelcan a disco por bloques.')
+j_scan_parser.add_argument('--spill-dir', type=str, default=None, help='Directorio donde volcar el contenido que excede --memory-budget (por defecto, un directorio temporal).')
+j_scan_parser.add_argument('--lazy-preview', action='store_true', help='Con --read-content: no leer las previsualizaciones durante el escaneo, sino al primer acceso (open/search), con una caché LRU.')
+j_scan_parser.add_argument('--prefetch', action='store_true', help='Con --lazy-preview: precargar las previsualizaciones en segundo plano al terminar el escaneo.')
+j_scan_parser.add_argument('--preview-cache', type=parse_byte_size, default=64 * 1024 * 1024, help='Presupuesto de la caché LRU de previsualizaciones bajo demanda (por defecto 64MB).')
 j_scan_parser.add_argument('--preview-bytes', type=int, default=1024, help='Límite de bytes para previsualización de contenido si --read-content se usa (por defecto 1024). Este valor se ignora si se usa --read-full-content o --save-content-to-disk.')
+j_scan_parser.add_argument('--names-only', action='store_true', help='Modo rápido: solo nombres y tipos de las entradas, sin stat() ni lectura de contenido.')
+j_scan_parser.add_argument('--incremental', action='store_true', help='Si el árbol actual es de la misma ruta, volver a listar solo los directorios modificados (st_mtime/inodo) conservando los IDs de los nodos sin cambios.')
+j_scan_parser.add_argument('--index-content', action='store_true', help='Indexar (trigramas) el contenido leído para acelerar search content=. Con --save-content-to-disk el índice se guarda junto al contenido y cubre los archivos completos. Sin otra opción de contenido implica --read-content.')
+j_scan_parser.add_argument('--workers', type=int, default=1, help='Número de hilos para listar directorios en paralelo (por defecto 1 = secuencial). Útil en discos de red (NFS).')
+j_scan_parser.add_argument('--checkpoint', type=str, default=None, help='Guardar periódicamente el progreso del escaneo en este archivo, para poder reanudarlo con --resume si se interrumpe.')
+j_scan_parser.add_argument('--checkpoint-interval', type=float, default=None, help='Segundos entre checkpoints (por defecto 60; al reanudar, el del checkpoint).')
+j_scan_parser.add_argument('--resume', type=str, default=None, help='Continuar el escaneo guardado en este checkpoint (se usan la ruta y las opciones del escaneo original).')
+j_scan_parser.add_argument('--stats', action='store_true', help='Mostrar el progreso durante el escaneo y, al terminar, el tiempo por fase, nodos/s, bytes leídos y escritos y los directorios más lentos.')
+j_scan_parser.add_argument('--stats-json', type=str, default=None, help='Guardar las métricas del escaneo en este archivo JSON.')
+j_scan_parser.add_argument('--stats-interval', type=float, default=2.0, help='Segundos entre líneas de progreso con --stats (por defecto 2).')
 
 
 # Parser para el comando 's-scan' (el simple y completo)
 s_scan_parser = argparse.ArgumentParser(add_help=False)
 s_scan_parser.add_argument('path', type=str, help='Ruta inicial del directorio a escanear (s-scan)')
+s_scan_parser.add_argument('--prefetch', action='store_true', help='Precargar las previsualizaciones en segundo plano al terminar el escaneo.')
+s_scan_parser.add_argument('--preview-cache', type=parse_byte_size, default=64 * 1024 * 1024, help='Presupuesto de la caché LRU de previsualizaciones (por defecto 64MB).')
 
 
 # Parser para el comando 'print'
@@ -38,11 +75,16 @@ print_parser.add_argument('--hide-metadata', action='store_false', dest='show_me
 
 # Parser para el comando 'search'
 search_parser = argparse.ArgumentParser(add_help=False)
+search_parser.add_argument('criteria', nargs='*', help='Criterios key=value (name, type, min_size, max_size, level, content, modified_after, modified_before), combinables con AND, OR, NOT y paréntesis; limit=N limita los resultados.')
 # Los criterios key=value se parsean manualmente después de shlex.split
 
 # Parser para el comando 'open'
 open_parser = argparse.ArgumentParser(add_help=False)
 open_parser.add_argument('node_id', type=int, help='ID del nodo a abrir/mostrar detalles.')
+open_parser.add_argument('--offset', type=int, default=None, help='Byte inicial de la ventana de contenido a mostrar (por defecto 0).')
+open_parser.add_argument('--length', type=int, default=None, help='Número de bytes a mostrar (por defecto 4096).')
+open_parser.add_argument('--head', type=int, nargs='?', const=20, default=None, help='Mostrar las primeras N líneas (por defecto 20).')
+open_parser.add_argument('--tail', type=int, nargs='?', const=20, default=None, help='Mostrar las últimas N líneas (por defecto 20).')
 
 # Parser para el comando 'save'
 save_parser = argparse.ArgumentParser(add_help=False)
@@ -51,36 +93,427 @@ save_parser.add_argument('--depth', type=int, default=-1, help='Profundidad máx
 save_parser.add_argument('--show-metadata', action='store_true', default=True, help='Mostrar metadatos en la salida (por defecto).')
 save_parser.add_metadata = True # Atributo auxiliar para la ayuda de save
 
-# Función de ayuda para parsear argumentos de búsqueda (key=value)
-def parse_search_criteria(criteria_list):
-    """Convierte una lista de strings 'key=value' en un diccionario."""
-    criteria = {}
-    for item in criteria_list:
-        if '=' in item:
-            key, value = item.split('=', 1)
-            criteria[key.lower()] = value # Convertir key a minúsculas
+# Parser para el comando 'dump' (snapshot binario del árbol)
+dump_parser = argparse.ArgumentParser(add_help=False)
+dump_parser.add_argument('filename', type=str, help='Archivo donde guardar el snapshot binario del árbol.')
+
+# Parser para el comando 'load' (recargar un snapshot)
+load_parser = argparse.ArgumentParser(add_help=False)
+load_parser.add_argument('filename', type=str, help='Archivo de snapshot creado con dump.')
+
+# Parser para el comando 'dupes' (archivos duplicados)
+dupes_parser = argparse.ArgumentParser(add_help=False)
+dupes_parser.add_argument('--workers', type=int, default=4, help='Tamaño del pool que calcula los hashes (por defecto 4).')
+dupes_parser.add_argument('--processes', action='store_true', help='Usar un pool de procesos en lugar de hilos (útil si el hash es el cuello de botella).')
+dupes_parser.add_argument('--min-size', type=parse_byte_size, default=1, help='Ignorar archivos más pequeños que este tamaño (por defecto 1 byte: se ignoran los vacíos).')
+
+# Parser para el comando 'top' (subárboles más grandes)
+top_parser = argparse.ArgumentParser(add_help=False)
+top_parser.add_argument('count', type=int, nargs='?', default=10, help='Número de directorios a listar (por defecto 10).')
+
+# Parser para el comando 'diff' (diferencias entre dos árboles)
+diff_parser = argparse.ArgumentParser(add_help=False)
+diff_parser.add_argument('old_snapshot', type=str, help='Snapshot (creado con dump) con el estado antiguo.')
+diff_parser.add_argument('new_snapshot', type=str, nargs='?', default=None, help='Snapshot con el estado nuevo. Si se omite, se usa el árbol actual.')
+diff_parser.add_argument('--output', type=str, default=None, help='Escribir las diferencias en este archivo en lugar de en la consola.')
+
+# Parser para el comando 'watch' (mantener el árbol sincronizado con el disco)
+watch_parser = argparse.ArgumentParser(add_help=False)
+watch_parser.add_argument('action', choices=['start', 'stop', 'status'], help='Iniciar, detener o consultar la vigilancia.')
+watch_parser.add_argument('--debounce', type=float, default=0.5, help='Segundos sin eventos antes de aplicar un lote de cambios (por defecto 0.5).')
+watch_parser.add_argument('--polling', action='store_true', help='Usar sondeo periódico en lugar de inotify.')
+watch_parser.add_argument('--poll-interval', type=float, default=2.0, help='Segundos entre sondeos (por defecto 2; también si inotify no está disponible).')
+
+# Mapeo de comandos a sus parsers
+command_parsers = {
+    'j-scan': j_scan_parser,
+    's-scan': s_scan_parser,
+    'print': print_parser,
+    'search': search_parser,
+    'open': open_parser,
+    'save': save_parser,
+    'dump': dump_parser,
+    'load': load_parser,
+    'dupes': dupes_parser,
+    'top': top_parser,
+    'diff': diff_parser,
+    'watch': watch_parser,
+}
+
+
+class Session:
+    """Estado compartido entre comandos: el árbol actual y la vigilancia de cambios ('watch start')."""
+    def __init__(self):
+        self.directory_tree = DirectoryTree() # Instanciar el gestor del árbol
+        self.watcher: TreeWatcher | None = None
+
+    def close(self):
+        if self.watcher is not None: self.watcher.stop()
+
+
+def print_help(args: list[str]):
+    if args:
+        target_command = args[0].lower()
+        if target_command in command_parsers:
+             print(f"\nAyuda para '{target_command}':")
+             command_parsers[target_command].print_help()
+        elif target_command == 'exit':
+             print("\nAyuda para 'exit':")
+             print("  exit")
+             print("    Sale de la aplicación.")
         else:
-            print(f"Advertencia: Criterio de búsqueda ignorado por formato incorrecto: '{item}'. Usar 'key=value'.")
-    return criteria
-
-
-def main():
-    """Función principal para la interfaz de consola."""
+             print(f"Comando desconocido para ayuda: '{target_command}'.")
+             print("Comandos disponibles: j-scan, s-scan, print, search, open, save, dump, load, dupes, top, diff, watch, exit.")
+    else:
+        # Ayuda general
+        print("\nComandos disponibles:")
+        print("  j-scan <ruta> [--opciones...]")
+        print("    Escanea con opciones configurables (profundidad, lectura de contenido: preview, full-memory, full-disk).") # Update help
+        print("    Con --stats muestra el progreso y las métricas por fase; --stats-json <archivo> las guarda en JSON.")
+        print("  s-scan <ruta> [--prefetch] [--preview-cache <tamaño>]")
+        print("    Escanea completamente con previsualización de contenido (simple).")
+        print("  print [--opciones...]")
+        print("  search <criterio1=valor1> [AND|OR|NOT] [( ... )] [limit=N]")
+        print("    Criterios: name, type, level, min_size, max_size, modified_after, modified_before, content.")
+        print("    Sin operador entre criterios se entiende AND; limit=N detiene la búsqueda al encontrar N nodos.")
+        print("  open <node_id> [--offset <bytes>] [--length <bytes>] [--head [N]] [--tail [N]]")
+        print("    Muestra detalles del nodo y una ventana de su contenido (leída con mmap, sin cargar el archivo entero).")
+        print("  save <filename> [--opciones...]")
+        print("  dump <filename>")
+        print("    Guarda un snapshot binario del árbol para recargarlo sin volver a escanear.")
+        print("  load <filename>")
+        print("    Carga un snapshot creado con 'dump' (carga perezosa, casi instantánea).")
+        print("  dupes [--workers <n>] [--processes] [--min-size <tamaño>]")
+        print("    Busca archivos duplicados: por tamaño, luego hash de los primeros 4 KB y solo al final hash completo.")
+        print("  top [N]")
+        print("    Lista los N directorios (por defecto 10) con mayor tamaño acumulado de su subárbol.")
+        print("  diff <snapshot_antiguo> [<snapshot_nuevo>] [--output <archivo>]")
+        print("    Muestra lo añadido (+), eliminado (-), modificado (~) y movido (>) entre dos snapshots (o un snapshot y el árbol actual).")
+        print("  watch start|stop|status [--debounce <s>] [--polling] [--poll-interval <s>]")
+        print("    Mantiene el árbol al día con los cambios en disco (inotify o sondeo) mientras se siguen usando los demás comandos.")
+        print("  exit")
+        print("\nEscribe 'help <comando>' para ver ayuda específica.")
+
+
+def run_command(session: Session, command: str, args: list[str]) -> bool:
+    """Ejecuta un comando con parser propio. Devuelve False si falló (argumentos inválidos, árbol vacío, error...)."""
+    directory_tree = session.directory_tree
+    command_parser = command_parsers[command]
+    directory_tree.lock.acquire() # El vigilante no aplica cambios mientras se ejecuta un comando
+    try:
+        parsed_args = command_parser.parse_args(args, namespace=argparse.Namespace())
+        if command in ('j-scan', 's-scan', 'load') and session.watcher is not None and session.watcher.is_running():
+             print("Deteniendo la vigilancia de cambios (el árbol se va a reemplazar).")
+             session.watcher.stop()
+
+        # --- Ejecutar el comando ---
+        if command == 'j-scan':
+            if parsed_args.path is None and not parsed_args.resume:
+                 print("Error: Indique la ruta a escanear (o --resume <checkpoint>).")
+                 return False
+            scan_path_cleaned = parsed_args.path.strip('<>') if parsed_args.path else ""
+
+            # Lógica para determinar los flags de lectura/guardado
+            should_read_content = False # Por defecto no se lee nada
+            should_read_full_content = False
+            save_content_dir = None # Por defecto no se guarda en disco
+
+            if parsed_args.resume:
+                 print(f"Modo: Reanudar el escaneo del checkpoint '{parsed_args.resume}' (con sus opciones originales).")
+            elif parsed_args.names_only:
+                 print("Modo: Solo nombres y tipos (sin metadatos ni contenido).")
+            elif parsed_args.save_content_to_disk:
+                 # Si se especifica guardar en disco, esto fuerza lectura completa y a disco
+                 save_content_dir = parsed_args.save_content_to_disk
+                 should_read_content = True
+                 should_read_full_content = True
+                 print(f"Modo: Guardar contenido completo en disco en '{save_content_dir}'.")
+            elif parsed_args.read_full_content:
+                 # Si se pide leer completo en memoria (y no guardar en disco)
+                 should_read_content = True
+                 should_read_full_content = True
+                 print("Modo: Leer contenido completo EN MEMORIA (¡PELIGROSO!).")
+            elif parsed_args.read_content or parsed_args.index_content:
+                # Si solo se pide leer contenido (implica previsualización si no se pide full)
+                 should_read_content = True
+                 should_read_full_content = False # Solo previsualización
+                 print(f"Modo: Leer previsualización de contenido (hasta {parsed_args.preview_bytes} bytes).")
+            else:
+                 print("Modo: No leer contenido de archivos.")
+
+
+            root = directory_tree.scan(
+                scan_path_cleaned,
+                depth=parsed_args.depth,
+                read_content=should_read_content,
+                read_full_content=should_read_full_content,
+                save_content_to_disk_dir=save_content_dir, # <-- Pasar la ruta de guardado (str o None)
+                content_preview_bytes=parsed_args.preview_bytes,
+                workers=max(1, parsed_args.workers),
+                names_only=parsed_args.names_only,
+                incremental=parsed_args.incremental,
+                index_content=parsed_args.index_content,
+                compress=parsed_args.compress,
+                memory_budget=parsed_args.memory_budget,
+                spill_dir=parsed_args.spill_dir,
+                lazy_preview=parsed_args.lazy_preview,
+                prefetch=parsed_args.prefetch,
+                preview_cache_bytes=parsed_args.preview_cache,
+                checkpoint=parsed_args.checkpoint,
+                checkpoint_interval=max(0.0, parsed_args.checkpoint_interval) if parsed_args.checkpoint_interval is not None else None,
+                resume=parsed_args.resume,
+                stats=parsed_args.stats,
+                stats_json=parsed_args.stats_json,
+                stats_interval=max(0.1, parsed_args.stats_interval)
+            )
+            return root is not None
+
+        elif command == 's-scan':
+             # S-scan: ilimitado, previsualización (1024 bytes) bajo demanda, read_full_content=False, save_content_to_disk_dir=None
+             print("Modo: Escaneo simple (completo, previsualización de contenido bajo demanda).")
+             scan_path_cleaned = parsed_args.path.strip('<>')
+             root = directory_tree.scan(
+                  scan_path_cleaned,
+                  depth=-1,
+                  read_content=True, # Previsualización activa por defecto para s-scan
+                  read_full_content=False, # S-scan NO lee contenido completo
+                  save_content_to_disk_dir=None, # S-scan NO guarda en disco
+                  content_preview_bytes=1024,
+                  lazy_preview=True, # La previsualización se lee al usar open/search, no durante el escaneo
+                  prefetch=parsed_args.prefetch,
+                  preview_cache_bytes=parsed_args.preview_cache
+             )
+             return root is not None
+
+        elif command == 'print':
+            if not directory_tree.root:
+                 print("Árbol vacío. Escanee un directorio primero con 'j-scan' o 's-scan'.")
+                 return False
+            return directory_tree.print_tree(
+                depth=parsed_args.depth,
+                show_metadata=parsed_args.show_metadata
+            )
+
+        elif command == 'search':
+             if not directory_tree.root:
+                 print("Árbol vacío. Escanee un directorio primero con 'j-scan' o 's-scan'.")
+                 return False
+             if not parsed_args.criteria:
+                 print("Error: El comando search requiere al menos un criterio. Uso: search <criterio1=valor1> [AND|OR|NOT ...] [limit=N]")
+                 return False
+             try:
+                 query = parse_query(parsed_args.criteria)
+             except QueryError as e:
+                 print(f"Error en la consulta: {e}")
+                 return False
+             return directory_tree.search_nodes(query) is not None
+
+        elif command == 'open':
+             if not directory_tree.root:
+                  print("Árbol vacío. Escanee un directorio primero con 'j-scan' o 's-scan'.")
+                  return False
+             if parsed_args.head is not None and parsed_args.tail is not None:
+                  print("Error: --head y --tail no pueden usarse a la vez.")
+                  return False
+             return directory_tree.display_node_details(
+                 parsed_args.node_id,
+                 offset=parsed_args.offset,
+                 length=parsed_args.length,
+                 head=parsed_args.head,
+                 tail=parsed_args.tail
+             )
+
+        elif command == 'save':
+             if not directory_tree.root:
+                  print("Árbol vacío. Escanee un directorio primero con 'j-scan' o 's-scan'.")
+                  return False
+             return directory_tree.save_tree_printout(
+                parsed_args.filename,
+                depth=parsed_args.depth,
+                show_metadata=parsed_args.show_metadata
+             )
+
+        elif command == 'dump':
+             if not directory_tree.root:
+                  print("Árbol vacío. Escanee un directorio primero con 'j-scan' o 's-scan'.")
+                  return False
+             return directory_tree.save_snapshot(parsed_args.filename)
+
+        elif command == 'load':
+             return directory_tree.load_snapshot(parsed_args.filename) is not None
+
+        elif command == 'dupes':
+             if not directory_tree.root:
+                  print("Árbol vacío. Escanee un directorio primero con 'j-scan' o 's-scan'.")
+                  return False
+             return directory_tree.find_duplicates(
+                 workers=max(1, parsed_args.workers),
+                 use_processes=parsed_args.processes,
+                 min_size=parsed_args.min_size
+             ) is not None
+
+        elif command == 'top':
+             if not directory_tree.root:
+                  print("Árbol vacío. Escanee un directorio primero con 'j-scan' o 's-scan'.")
+                  return False
+             return directory_tree.top_subtrees(max(1, parsed_args.count)) is not None
+
+        elif command == 'diff':
+             old_tree = DirectoryTree()
+             if old_tree.load_snapshot(parsed_args.old_snapshot) is None:
+                  return False
+             if parsed_args.new_snapshot is not None:
+                  new_tree = DirectoryTree()
+                  if new_tree.load_snapshot(parsed_args.new_snapshot) is None:
+                       return False
+             elif directory_tree.root:
+                  new_tree = directory_tree
+             else:
+                  print("Árbol vacío. Escanee un directorio o indique un segundo snapshot.")
+                  return False
+             return old_tree.diff(new_tree, parsed_args.output) is not None
+
+        elif command == 'watch':
+             if parsed_args.action == 'start':
+                  if session.watcher is not None and session.watcher.is_running():
+                       print("La vigilancia ya está activa. Use 'watch stop' para detenerla.")
+                       return True
+                  session.watcher = TreeWatcher(
+                      directory_tree,
+                      debounce=max(0.0, parsed_args.debounce),
+                      use_polling=parsed_args.polling,
+                      poll_interval=max(0.1, parsed_args.poll_interval)
+                  )
+                  if not session.watcher.start():
+                       return False
+                  print(f"Vigilando {session.watcher.watched_directories()} directorios ({session.watcher.backend_name}); "
+                        f"los cambios se aplican tras {session.watcher.debounce:g} s sin eventos.")
+             elif session.watcher is None or not session.watcher.is_running():
+                  print("La vigilancia no está activa. Use 'watch start'.")
+             elif parsed_args.action == 'stop':
+                  session.watcher.stop()
+                  print(f"Vigilancia detenida ({session.watcher.batches_applied} lotes aplicados).")
+             else:
+                  print(f"Vigilancia activa ({session.watcher.backend_name}): {session.watcher.watched_directories()} directorios vigilados.")
+                  print(f"Lotes aplicados: {session.watcher.batches_applied} ({session.watcher.directories_refreshed} directorios re-listados, "
+                        f"{session.watcher.full_rescans} re-escaneos completos)")
+                  print(f"Nodos añadidos: {session.watcher.nodes_added}, eliminados: {session.watcher.nodes_removed}; "
+                        f"directorios pendientes: {session.watcher.pending_directories}")
+                  if session.watcher.last_batch_at is not None:
+                       print(f"Último lote: {datetime.datetime.fromtimestamp(session.watcher.last_batch_at):%Y-%m-%d %H:%M:%S}")
+
+        return True
+    except SystemExit:
+        return False
+    except Exception as e:
+        print(f"Error al ejecutar el comando '{command}': {e}")
+        return False
+    finally:
+        directory_tree.lock.release()
+
+
+def execute(session: Session, parts: list[str]) -> bool:
+    """Ejecuta un comando ya dividido en argumentos (sin contar 'exit', que gestiona quien llama)."""
+    command, args = parts[0].lower(), parts[1:]
+    if command == 'help':
+        print_help(args)
+        return True
+    if command in command_parsers:
+        return run_command(session, command, args)
+    print(f"Comando desconocido: '{command}'. Escribe 'help' para ver los comandos.")
+    return False
+
+
+def split_commands(text: str) -> list[list[str]]:
+    """
+    Divide texto con uno o varios comandos separados por ';' (como en -c "j-scan /x; top 5")
+    en listas de argumentos, con las mismas reglas de comillas que la consola (shlex).
+    Un ';' entre comillas forma parte del argumento.
+    """
+    lexer = shlex.shlex(text, posix=True, punctuation_chars=';')
+    lexer.whitespace_split = True
+    lexer.commenters = ''
+    commands, current = [], []
+    for token in lexer:
+        if token and set(token) == {';'}:
+            if current: commands.append(current)
+            current = []
+        else:
+            current.append(token)
+    if current: commands.append(current)
+    return commands
+
+
+def read_script(filename: str) -> list[list[str]]:
+    """Lee un script de comandos: uno por línea (o varios separados por ';'); se ignoran las líneas vacías y las que empiezan por '#'. '-' lee la entrada estándar."""
+    with (contextlib.nullcontext(sys.stdin) if filename == '-' else open(filename, encoding='utf-8')) as f:
+        commands = []
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                commands += split_commands(line)
+    return commands
+
+
+@contextlib.contextmanager
+def buffered_stdout(buffer_size: int = 1024 * 1024):
+    """
+    Sustituye sys.stdout por un flujo con un búfer grande sobre el mismo descriptor, de modo que
+    los miles de print de un comando (search, print...) se escriben en pocas llamadas al sistema.
+    El búfer se vacía al terminar cada comando (ver run_batch) y al salir.
+    """
+    original = sys.stdout
+    try:
+        fd = original.fileno()
+    except (AttributeError, ValueError, io.UnsupportedOperation): # p. ej. stdout redirigido a un StringIO
+        yield
+        return
+    original.flush()
+    sys.stdout = io.TextIOWrapper(open(fd, 'wb', buffering=buffer_size, closefd=False),
+                                  encoding=original.encoding, errors='replace')
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stdout = original
+
+
+def run_batch(commands: list[list[str]], keep_going: bool = False) -> int:
+    """
+    Ejecuta los comandos seguidos, sin consola interactiva, con la salida en un búfer. Tras cada
+    comando escribe en stderr si terminó bien y cuánto tardó. Se detiene en el primer comando que
+    falla (salvo keep_going) o en 'exit'. Devuelve el código de salida: 0 si todo fue bien, 1 si no.
+    """
+    session = Session()
+    failures = executed = 0
+    batch_started = time.perf_counter()
+    try:
+        with buffered_stdout():
+            for number, parts in enumerate(commands, 1):
+                if parts[0].lower() == 'exit':
+                    break
+                started = time.perf_counter()
+                ok = execute(session, parts)
+                elapsed = time.perf_counter() - started
+                executed += 1
+                sys.stdout.flush() # Que la salida del comando aparezca antes que su línea de tiempo
+                print(f"[{number}/{len(commands)}] {'OK' if ok else 'ERROR'} {elapsed:.3f} s  {shlex.join(parts)}", file=sys.stderr)
+                if not ok:
+                    failures += 1
+                    if not keep_going: break
+    finally:
+        session.close()
+    print(f"{executed} comandos ejecutados, {failures} con error, en {time.perf_counter() - batch_started:.3f} s.", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def interactive():
+    """Bucle de comandos de la consola interactiva."""
 
     print("--- Herramienta de Gestión de Estructura de Directorios ---")
     print("Escribe 'help' para ver los comandos disponibles.")
 
-    directory_tree = DirectoryTree() # Instanciar el gestor del árbol
-
-    # Mapeo de comandos a sus parsers
-    command_parsers = {
-        'j-scan': j_scan_parser,
-        's-scan': s_scan_parser,
-        'print': print_parser,
-        'search': search_parser,
-        'open': open_parser,
-        'save': save_parser,
-    }
+    session = Session()
 
     # Bucle principal de comandos
     while True:
@@ -92,157 +525,55 @@ def main():
             try:
                 parts = shlex.split(command_line)
                 if not parts: continue
-                command = parts[0].lower()
-                args = parts[1:]
 
             except ValueError as e:
                 print(f"Error al parsear la línea de comando: {e}")
                 continue
 
-
-            if command == 'help':
-                if args:
-                    target_command = args[0].lower()
-                    if target_command in command_parsers:
-                         print(f"\nAyuda para '{target_command}':")
-                         command_parsers[target_command].print_help()
-                    elif target_command == 'exit':
-                         print("\nAyuda para 'exit':")
-                         print("  exit")
-                         print("    Sale de la aplicación.")
-                    else:
-                         print(f"Comando desconocido para ayuda: '{target_command}'.")
-                         print("Comandos disponibles: j-scan, s-scan, print, search, open, save, exit.")
-                else:
-                    # Ayuda general
-                    print("\nComandos disponibles:")
-                    print("  j-scan <ruta> [--opciones...]")
-                    print("    Escanea con opciones configurables (profundidad, lectura de contenido: preview, full-memory, full-disk).") # Update help
-                    print("  s-scan <ruta>")
-                    print("    Escanea completamente con previsualización de contenido (simple).")
-                    print("  print [--opciones...]")
-                    print("  search <criterio1=valor1> [...]")
-                    print("  open <node_id>")
-                    print("  save <filename> [--opciones...]")
-                    print("  exit")
-                    print("\nEscribe 'help <comando>' para ver ayuda específica.")
-
-
-            # --- Bloque de ejecución de comandos ---
-            elif command in command_parsers:
-                command_parser = command_parsers[command]
-                try:
-                    parsed_args = command_parser.parse_args(args, namespace=argparse.Namespace())
-
-                    # --- Ejecutar el comando ---
-                    if command == 'j-scan':
-                        scan_path_cleaned = parsed_args.path.strip('<>')
-
-                        # Lógica para determinar los flags de lectura/guardado
-                        should_read_content = False # Por defecto no se lee nada
-                        should_read_full_content = False
-                        save_content_dir = None # Por defecto no se guarda en disco
-
-                        if parsed_args.save_content_to_disk:
-                             # Si se especifica guardar en disco, esto fuerza lectura completa y a disco
-                             save_content_dir = parsed_args.save_content_to_disk
-                             should_read_content = True
-                             should_read_full_content = True
-                             print(f"Modo: Guardar contenido completo en disco en '{save_content_dir}'.")
-                        elif parsed_args.read_full_content:
-                             # Si se pide leer completo en memoria (y no guardar en disco)
-                             should_read_content = True
-                             should_read_full_content = True
-                             print("Modo: Leer contenido completo EN MEMORIA (¡PELIGROSO!).")
-                        elif parsed_args.read_content:
-                            # Si solo se pide leer contenido (implica previsualización si no se pide full)
-                             should_read_content = True
-                             should_read_full_content = False # Solo previsualización
-                             print(f"Modo: Leer previsualización de contenido (hasta {parsed_args.preview_bytes} bytes).")
-                        else:
-                             print("Modo: No leer contenido de archivos.")
-
-
-                        directory_tree.scan(
-                            scan_path_cleaned,
-                            depth=parsed_args.depth,
-                            read_content=should_read_content,
-                            read_full_content=should_read_full_content,
-                            save_content_to_disk_dir=save_content_dir, # <-- Pasar la ruta de guardado (str o None)
-                            content_preview_bytes=parsed_args.preview_bytes
-                        )
-
-                    elif command == 's-scan':
-                         # S-scan: ilimitado, read_content=True (preview), read_full_content=False, save_content_to_disk_dir=None, preview=1024
-                         print("Modo: Escaneo simple (completo, previsualización de contenido).")
-                         scan_path_cleaned = parsed_args.path.strip('<>')
-                         directory_tree.scan(
-                              scan_path_cleaned,
-                              depth=-1,
-                              read_content=True, # Previsualización activa por defecto para s-scan
-                              read_full_content=False, # S-scan NO lee contenido completo
-                              save_content_to_disk_dir=None, # S-scan NO guarda en disco
-                              content_preview_bytes=1024
-                         )
-
-                    elif command == 'print':
-                        if not directory_tree.root:
-                             print("Árbol vacío. Escanee un directorio primero con 'j-scan' o 's-scan'.")
-                             continue
-                        directory_tree.print_tree(
-                            depth=parsed_args.depth,
-                            show_metadata=parsed_args.show_metadata
-                        )
-
-                    elif command == 'search':
-                         if not directory_tree.root:
-                             print("Árbol vacío. Escanee un directorio primero con 'j-scan' o 's-scan'.")
-                             continue
-                         if not args:
-                             print("Error: El comando search requiere al menos un criterio. Uso: search <criterio1=valor1> ...")
-                             continue
-                         search_criteria = parse_search_criteria(args)
-                         if search_criteria:
-                              directory_tree.search_nodes(**search_criteria)
-                         else:
-                             print("No se pudieron parsear criterios de búsqueda válidos.")
-
-                    elif command == 'open':
-                         if not directory_tree.root:
-                              print("Árbol vacío. Escanee un directorio primero con 'j-scan' o 's-scan'.")
-                              continue
-                         directory_tree.display_node_details(parsed_args.node_id)
-
-                    elif command == 'save':
-                         if not directory_tree.root:
-                              print("Árbol vacío. Escanee un directorio primero con 'j-scan' o 's-scan'.")
-                              continue
-                         directory_tree.save_tree_printout(
-                            parsed_args.filename,
-                            depth=parsed_args.depth,
-                            show_metadata=parsed_args.show_metadata
-                         )
-
-                except SystemExit:
-                    pass
-                except Exception as e:
-                    print(f"Error al ejecutar el comando '{command}': {e}")
-            # --- Fin del Bloque de ejecución de comandos ---
-
-
-            elif command == 'exit':
+            if parts[0].lower() == 'exit':
+                session.close()
                 print("Saliendo...")
                 break
-
-            else:
-                print(f"Comando desconocido: '{command}'. Escribe 'help' para ver los comandos.")
+            execute(session, parts)
 
         except EOFError:
+             session.close()
              print("\nSaliendo (EOF)...")
              break
         except Exception as e:
             print(f"Ocurrió un error inesperado en el bucle principal: {e}")
 
 
+def main(argv: list[str] | None = None) -> int:
+    """
+    Sin argumentos abre la consola interactiva. Para trabajos programados (cron):
+        python main.py run script.txt      (un comando por línea; '-' lee la entrada estándar)
+        python main.py -c "j-scan /datos; search name=*.log; save salida.txt"
+    """
+    cli_parser = argparse.ArgumentParser(prog='main.py', description=main.__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    cli_parser.add_argument('mode', nargs='?', choices=['run'], help="'run <script>': ejecutar los comandos de un archivo.")
+    cli_parser.add_argument('script', nargs='?', default=None, help='Archivo con los comandos (con run).')
+    cli_parser.add_argument('-c', dest='commands', default=None, help='Comandos a ejecutar, separados por ";".')
+    cli_parser.add_argument('--keep-going', action='store_true', help='Seguir con los demás comandos aunque uno falle (el código de salida sigue siendo 1).')
+    cli_args = cli_parser.parse_args(argv)
+
+    if cli_args.commands is not None:
+        try:
+            commands = split_commands(cli_args.commands)
+        except ValueError as e:
+            print(f"Error al parsear los comandos: {e}", file=sys.stderr) ; return 2
+        return run_batch(commands, cli_args.keep_going)
+    if cli_args.mode == 'run':
+        if cli_args.script is None:
+            cli_parser.error("run requiere el archivo de comandos")
+        try:
+            commands = read_script(cli_args.script)
+        except (OSError, ValueError) as e:
+            print(f"Error al leer el script '{cli_args.script}': {e}", file=sys.stderr) ; return 2
+        return run_batch(commands, cli_args.keep_going)
+    interactive()
+    return 0
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
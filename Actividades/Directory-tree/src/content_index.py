@@ -0,0 +1,189 @@
+# src/content_index.py
+
+import os
+import re
+import json
+import uuid
+import codecs
+from pathlib import Path
+
+from .content_store import open_blob
+
+CONTENT_INDEX_FILENAME = "content_index_{index_id}.json" # Un archivo por versión del índice (ver ContentIndex.save)
+CONTENT_INDEX_VERSION = 1
+_BINARY_SNIFF_BYTES = 8192 # Bytes iniciales donde buscar un NUL para descartar archivos binarios
+
+
+def content_trigrams(content_bytes: bytes) -> set[str] | None:
+    """
+    Trigramas (en minúsculas) del texto de un archivo, o None si parece binario
+    (contiene un byte NUL al principio), en cuyo caso no se indexa.
+    Se usa desde el escáner, en los hilos de listado, justo después de leer el contenido.
+    """
+    if b'\x00' in content_bytes[:_BINARY_SNIFF_BYTES]:
+        return None
+    text = content_bytes.decode('utf-8', errors='replace').lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramAccumulator:
+    """
+    Calcula los mismos trigramas que content_trigrams, pero a partir de bloques sucesivos,
+    para indexar archivos que se copian por bloques sin tenerlos enteros en memoria.
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._grams: set[str] = set()
+        self._tail = "" # Últimos 2 caracteres del bloque anterior (trigramas que cruzan el borde)
+        self._sniffed = 0
+        self._binary = False
+
+    def feed(self, chunk: bytes):
+        if self._binary:
+            return
+        if self._sniffed < _BINARY_SNIFF_BYTES:
+            if b'\x00' in chunk[:_BINARY_SNIFF_BYTES - self._sniffed]:
+                self._binary = True
+                return
+            self._sniffed += len(chunk)
+        text = self._tail + self._decoder.decode(chunk).lower()
+        self._grams.update(text[i:i + 3] for i in range(len(text) - 2))
+        self._tail = text[-2:]
+
+    def result(self) -> set[str] | None:
+        """Trigramas acumulados, o None si el contenido parece binario."""
+        if self._binary:
+            return None
+        text = self._tail + self._decoder.decode(b"", final=True).lower()
+        self._grams.update(text[i:i + 3] for i in range(len(text) - 2))
+        return self._grams
+
+
+def file_contains(path: str | Path, pattern: re.Pattern, overlap: int, chunk_size: int = 1 << 20) -> bool:
+    """
+    Busca pattern en un blob de texto (comprimido o no) leyéndolo por bloques, sin cargarlo entero en memoria.
+    overlap es el número de caracteres que se arrastran entre bloques (longitud del texto
+    buscado - 1) para no perder coincidencias que crucen el borde de un bloque.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    tail = ""
+    with open_blob(path) as f:
+        while True:
+            chunk = f.read(chunk_size)
+            text = tail + decoder.decode(chunk, final=not chunk)
+            if pattern.search(text):
+                return True
+            if not chunk:
+                return False
+            tail = text[-overlap:] if overlap > 0 else ""
+
+
+class ContentIndex:
+    """
+    Índice invertido de trigramas sobre el contenido de los archivos, para search content=...
+
+    Cubre tanto la previsualización en memoria como el contenido completo guardado en disco,
+    así que una búsqueda solo verifica (y, si hace falta, lee del disco) los archivos cuyos
+    trigramas incluyen todos los de la consulta, en lugar de todos los archivos.
+
+    Las bajas solo quitan el ID del conjunto de nodos indexados; sus entradas en los
+    trigramas se quedan y, como las de un archivo cuyo contenido cambió, solo producen
+    candidatos de más que la verificación descarta. Los IDs nunca se reutilizan.
+
+    Varios escaneos pueden compartir el mismo directorio de guardado (el almacén deduplica entre
+    escaneos), así que cada versión guardada del índice tiene su propio index_id y su propio
+    archivo; el snapshot registra el index_id y load solo acepta el índice con ese mismo ID.
+    """
+
+    def __init__(self):
+        self._ids_by_gram: dict[str, set[int]] = {}
+        self._indexed_ids: set[int] = set()
+        self.index_id = uuid.uuid4().hex
+        self._persisted = False # Ya hay un archivo guardado con este index_id
+        self._modified = False # Cambió desde que se guardó
+
+    @property
+    def needs_save(self) -> bool:
+        return not self._persisted or self._modified
+
+    def __len__(self) -> int:
+        return len(self._indexed_ids)
+
+    def add(self, node_id: int, grams: set[str]):
+        for gram in grams:
+            ids = self._ids_by_gram.get(gram)
+            if ids is None:
+                ids = self._ids_by_gram[gram] = set()
+            ids.add(node_id)
+        self._indexed_ids.add(node_id)
+        self._modified = True
+
+    def discard(self, node_id: int):
+        self._indexed_ids.discard(node_id)
+        self._modified = True
+
+    def candidate_ids(self, query: str) -> set[int]:
+        """
+        IDs que pueden contener query (sin distinguir mayúsculas). Con consultas de menos de
+        tres caracteres no hay trigramas que cruzar y se devuelven todos los nodos indexados.
+        """
+        query = query.lower()
+        grams = {query[i:i + 3] for i in range(len(query) - 2)}
+        if not grams:
+            return set(self._indexed_ids)
+        postings = sorted((self._ids_by_gram.get(gram, set()) for gram in grams), key=len)
+        result = postings[0] & self._indexed_ids
+        for posting in postings[1:]:
+            if not result:
+                break
+            result &= posting
+        return result
+
+    def save(self, directory: str | Path) -> Path:
+        """
+        Guarda el índice como content_index_<index_id>.json en el directorio indicado (escritura atómica).
+        Si el índice cambió desde que se guardó, recibe un index_id nuevo: el archivo anterior puede
+        pertenecer a un snapshot ya guardado y no debe cambiar bajo el mismo nombre.
+        """
+        if self._persisted and self._modified:
+            self.index_id = uuid.uuid4().hex
+        path = self.path_in(directory)
+        tmp_path = path.with_name(path.name + ".tmp")
+        data = {
+            'version': CONTENT_INDEX_VERSION,
+            'index_id': self.index_id,
+            'ids': sorted(self._indexed_ids),
+            'grams': {gram: sorted(ids & self._indexed_ids) for gram, ids in self._ids_by_gram.items() if ids & self._indexed_ids},
+        }
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        self._persisted, self._modified = True, False
+        return path
+
+    def path_in(self, directory: str | Path) -> Path:
+        return index_path(directory, self.index_id)
+
+    @classmethod
+    def load(cls, directory: str | Path, index_id: str) -> "ContentIndex | None":
+        """Carga el índice index_id desde el directorio indicado, o None si no existe, no es válido o es otro índice."""
+        try:
+            with open(index_path(directory, index_id), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != CONTENT_INDEX_VERSION or data.get('index_id') != index_id:
+            return None
+        index = cls()
+        index._indexed_ids = set(data.get('ids', ()))
+        index._ids_by_gram = {gram: set(ids) for gram, ids in data.get('grams', {}).items()}
+        index.index_id, index._persisted = index_id, True
+        return index
+
+
+def index_path(directory: str | Path, index_id: str) -> Path:
+    """Archivo del índice index_id dentro de un directorio de guardado."""
+    if not all(c in "0123456789abcdef" for c in index_id): # Viene del META de un snapshot: no admitir rutas
+        raise ValueError(f"ID de índice de contenido inválido: '{index_id}'")
+    return Path(directory) / CONTENT_INDEX_FILENAME.format(index_id=index_id)
@@ -0,0 +1,288 @@
+# src/content_store.py
+
+import io
+import os
+import gzip
+import hashlib
+import itertools
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Callable
+
+try:
+    import zstandard # Opcional: compresión zstd (pip install zstandard)
+except ImportError:
+    zstandard = None
+
+# Extensión del blob según su compresión; al leer, la extensión indica cómo descomprimir
+_EXTENSIONS = {None: "", 'zlib': ".gz", 'zstd': ".zst"}
+COMPRESSION_CHOICES = ('zlib', 'zstd')
+
+# Tamaño de bloque para leer, hashear y copiar contenido: la memoria por archivo queda acotada
+CHUNK_SIZE = 1 << 20
+
+# next() sobre itertools.count es atómico en CPython: nombres temporales únicos entre hilos
+_temp_counter = itertools.count()
+
+
+def is_compressed_blob(path: str | Path) -> bool:
+    """True si la extensión del blob indica compresión (zlib/gzip o zstd)."""
+    return str(path).endswith((_EXTENSIONS['zlib'], _EXTENSIONS['zstd']))
+
+
+def open_blob(path: str | Path) -> BinaryIO:
+    """Abre un blob para lectura secuencial, descomprimiéndolo según su extensión."""
+    path = str(path)
+    if path.endswith(_EXTENSIONS['zlib']):
+        return gzip.open(path, 'rb')
+    if path.endswith(_EXTENSIONS['zstd']):
+        if zstandard is None:
+            raise IOError(f"El blob '{path}' está comprimido con zstd y el módulo 'zstandard' no está instalado.")
+        # BufferedReader añade readline/iteración por líneas sobre el lector de zstandard
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True), CHUNK_SIZE)
+    return open(path, 'rb')
+
+
+def blob_digest(path: str | Path) -> str | None:
+    """sha256 del contenido (sin comprimir) de un blob del ContentStore, leído de su nombre; None si path no es un blob."""
+    path = Path(path)
+    digest = path.name.split('.', 1)[0]
+    if (len(digest) == 64 and path.parent.name == digest[:2] and path.parent.parent.name == "objects"
+            and all(c in "0123456789abcdef" for c in digest)):
+        return digest
+    return None
+
+
+def read_blob(path: str | Path) -> bytes:
+    """Lee (y descomprime si hace falta) el contenido completo de un blob."""
+    with open_blob(path) as f:
+        return f.read()
+
+
+class ContentStore:
+    """
+    Almacén direccionado por contenido para --save-content-to-disk.
+
+    Cada contenido se guarda una sola vez en objects/<2 primeros hex>/<sha256>[.gz|.zst],
+    y todos los nodos con los mismos bytes comparten el mismo blob (saved_content_path).
+    Un contenido ya presente no se vuelve a escribir; uno nuevo se escribe en un archivo
+    temporal y se publica con os.replace, así que nunca queda un blob a medio escribir con
+    su nombre definitivo. Es seguro usarlo desde los hilos del escaneo paralelo.
+
+    put_file nunca carga un archivo grande entero en memoria: lo recorre por bloques para
+    calcular su hash y, solo si el contenido es nuevo, lo copia por bloques al blob.
+    """
+
+    def __init__(self, root: str | Path, compression: str | None = None):
+        """
+        Args:
+            root (str | Path): Directorio del almacén (se crea objects/ dentro).
+            compression (str | None, optional): None, 'zlib' o 'zstd'. Si se pide zstd y el módulo
+                'zstandard' no está instalado, se usa zlib. Defaults to None.
+        """
+        if compression == 'zstd' and zstandard is None:
+            print("Advertencia: el módulo 'zstandard' no está instalado; se usará compresión zlib.")
+            compression = 'zlib'
+        self.root = Path(root)
+        self.compression = compression
+        self.objects_dir = self.root / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._known: dict[str, str] = {} # sha256 -> ruta del blob (ya escrito o escribiéndose)
+        # Estadísticas del escaneo actual
+        self.blobs_written = 0
+        self.duplicates = 0
+        self.bytes_written = 0
+        self.write_seconds = 0.0 # Tiempo escribiendo blobs nuevos (sumado entre hilos)
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / (digest + _EXTENSIONS[self.compression])
+
+    def _existing_blob(self, digest: str) -> Path | None:
+        """Devuelve el blob de ese hash si ya existe en disco (con cualquier compresión)."""
+        candidates = [self._blob_path(digest)] # Primero con la compresión actual (lo más habitual)
+        candidates += [self.objects_dir / digest[:2] / (digest + ext) for ext in _EXTENSIONS.values() if ext != _EXTENSIONS[self.compression]]
+        for candidate in candidates:
+            if candidate.exists():
+                return candidate
+        return None
+
+    def _lookup(self, digest: str) -> str | None:
+        """
+        Ruta del blob si el contenido ya está en el almacén (o lo está escribiendo otro hilo);
+        si no, reserva el hash para que lo escriba quien llama y devuelve None.
+        """
+        with self._lock:
+            known = self._known.get(digest)
+        if known is None:
+            existing = self._existing_blob(digest) # stat() fuera del lock
+            with self._lock:
+                known = self._known.get(digest)
+                if known is None:
+                    if existing is None:
+                        self._known[digest] = str(self._blob_path(digest)) # Reserva
+                        return None
+                    known = self._known[digest] = str(existing)
+        with self._lock:
+            self.duplicates += 1
+        return known
+
+    def _publish(self, digest: str, copy_into: Callable[[BinaryIO], str]) -> str:
+        """
+        Escribe un blob nuevo (archivo temporal + os.replace) y devuelve su ruta.
+        copy_into recibe el stream de destino (ya envuelto en el compresor, si hay compresión) y
+        devuelve el sha256 de los bytes que escribió realmente. Si no coincide con digest (el archivo
+        cambió mientras se copiaba), el blob se publica con el hash de lo escrito, o se descarta si
+        ese contenido ya estaba en el almacén: el nombre de un blob siempre es el hash de sus bytes.
+        """
+        started = time.perf_counter()
+        blob_path = self._blob_path(digest)
+        tmp_path = blob_path.with_name(f".tmp_{os.getpid()}_{next(_temp_counter)}")
+        reserved = digest
+        try:
+            blob_path.parent.mkdir(exist_ok=True)
+            with open(tmp_path, 'w+b') as raw_f: # w+b: la copia con sendfile vuelve a leer lo escrito para hashearlo
+                if self.compression == 'zlib':
+                    with gzip.GzipFile(filename='', mode='wb', fileobj=raw_f, compresslevel=6, mtime=0) as out_f:
+                        written_digest = copy_into(out_f)
+                elif self.compression == 'zstd':
+                    with zstandard.ZstdCompressor().stream_writer(raw_f, closefd=False) as out_f:
+                        written_digest = copy_into(out_f)
+                else:
+                    written_digest = copy_into(raw_f)
+            if written_digest != digest:
+                with self._lock:
+                    self._known.pop(digest, None) # Este contenido no es el que se escribió
+                reserved = None
+                known = self._lookup(written_digest)
+                if known is not None:
+                    tmp_path.unlink(missing_ok=True)
+                    return known
+                reserved = written_digest
+                blob_path = self._blob_path(written_digest)
+                blob_path.parent.mkdir(exist_ok=True)
+            written = os.path.getsize(tmp_path)
+            os.replace(tmp_path, blob_path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            if reserved is not None:
+                with self._lock:
+                    self._known.pop(reserved, None) # Liberar la reserva para que otro intento pueda escribirlo
+            raise
+        with self._lock:
+            self.blobs_written += 1
+            self.bytes_written += written
+            self.write_seconds += time.perf_counter() - started
+        return str(blob_path)
+
+    def put_bytes(self, data: bytes) -> str:
+        """Guarda data (si no estaba ya) y devuelve la ruta de su blob."""
+        digest = hashlib.sha256(data).hexdigest()
+        known = self._lookup(digest)
+        if known is not None:
+            return known
+
+        def _write(out_f: BinaryIO) -> str:
+            out_f.write(data)
+            return digest
+
+        return self._publish(digest, _write)
+
+    def put_file(self, src_f: BinaryIO, on_chunk: Callable[[bytes], None] | None = None) -> str:
+        """
+        Guarda el contenido de un archivo abierto en modo binario y devuelve la ruta de su blob.
+
+        Los archivos de hasta CHUNK_SIZE se leen de una vez (put_bytes). Los mayores se recorren
+        dos veces por bloques: la primera calcula el hash (y entrega cada bloque a on_chunk, p. ej.
+        para el índice de contenido) y, si el contenido ya existe, termina sin escribir nada; la
+        segunda copia el archivo al blob. Hace falta conocer el hash antes de escribir para no
+        copiar duplicados; sin compresión, la copia puede hacerla el kernel con os.sendfile, sin
+        pasar los datos por Python. Como el archivo puede cambiar entre las dos pasadas, la copia
+        vuelve a calcular el hash de lo que escribe y el blob se publica con ese hash (ver _publish).
+
+        Args:
+            src_f (BinaryIO): Archivo de origen abierto en 'rb' y posicionado al principio.
+            on_chunk (Callable[[bytes], None] | None, optional): Recibe cada bloque leído en la primera pasada.
+        """
+        first = src_f.read(CHUNK_SIZE + 1)
+        if len(first) <= CHUNK_SIZE:
+            if on_chunk: on_chunk(first)
+            return self.put_bytes(first)
+
+        hasher = hashlib.sha256()
+        chunk = first
+        while chunk:
+            hasher.update(chunk)
+            if on_chunk: on_chunk(chunk)
+            chunk = src_f.read(CHUNK_SIZE)
+        digest = hasher.hexdigest()
+        known = self._lookup(digest)
+        if known is not None:
+            return known
+
+        def _copy(out_f: BinaryIO) -> str:
+            src_f.seek(0)
+            if self.compression is None and hasattr(os, 'sendfile'):
+                try:
+                    _sendfile_all(src_f, out_f)
+                    # Los bytes copiados por el kernel no pasaron por Python: hashear lo escrito (en caché)
+                    out_f.seek(0)
+                    return _hash_stream(out_f)
+                except OSError:
+                    # sendfile entre estos archivos no está soportado: copiar por bloques
+                    src_f.seek(0)
+                    out_f.seek(0)
+                    out_f.truncate()
+            copy_hasher = hashlib.sha256()
+            while chunk := src_f.read(CHUNK_SIZE):
+                copy_hasher.update(chunk)
+                out_f.write(chunk)
+            return copy_hasher.hexdigest()
+
+        return self._publish(digest, _copy)
+
+
+def _hash_stream(f: BinaryIO) -> str:
+    """sha256 del resto de f, leído por bloques."""
+    hasher = hashlib.sha256()
+    while chunk := f.read(CHUNK_SIZE):
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _sendfile_all(src_f: BinaryIO, out_f: BinaryIO):
+    """Copia src_f completo a out_f con os.sendfile (copia dentro del kernel, sin buffers de Python)."""
+    out_f.flush()
+    in_fd, out_fd = src_f.fileno(), out_f.fileno()
+    offset = 0
+    while True:
+        sent = os.sendfile(out_fd, in_fd, offset, CHUNK_SIZE * 8)
+        if sent == 0:
+            break
+        offset += sent
+
+
+class MemoryBudget:
+    """
+    Presupuesto de memoria para --read-full-content. Cada archivo reserva su tamaño antes
+    de leerse en memoria; cuando ya no cabe, su contenido se vuelca (por bloques) al
+    almacén de desbordamiento en disco, de modo que la memoria usada por el contenido
+    leído no supera el límite. Es seguro usarlo desde los hilos del escaneo paralelo.
+    """
+
+    def __init__(self, limit_bytes: int, spill_store: ContentStore):
+        self.limit_bytes = limit_bytes
+        self.spill_store = spill_store
+        self.used_bytes = 0
+        self.spilled_files = 0
+        self._lock = threading.Lock()
+
+    def try_reserve(self, size: int) -> bool:
+        """Reserva size bytes si caben en el presupuesto; si no, cuenta el archivo como volcado a disco."""
+        with self._lock:
+            if self.used_bytes + size <= self.limit_bytes:
+                self.used_bytes += size
+                return True
+            self.spilled_files += 1
+            return False
@@ -0,0 +1,115 @@
+# src/content_view.py
+"""
+Acceso perezoso por rangos al contenido de un archivo (el original o un blob guardado),
+usado por 'open'. Los archivos sin comprimir se mapean en memoria, de modo que mostrar una
+ventana de un archivo de 10 GB solo lee las páginas de esa ventana. compressed=True indica un
+blob comprimido del ContentStore, que solo admite lectura secuencial.
+"""
+
+import mmap
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from .content_store import open_blob, CHUNK_SIZE
+
+DEFAULT_PAGE_BYTES = 4096 # Ventana que muestra 'open' si no se indica --offset/--length/--head/--tail
+MAX_LINES_BYTES = 256 * 1024 # Máximo que devuelven --head/--tail (un archivo sin saltos de línea es una sola línea)
+
+
+@contextmanager
+def _mapped(path: str | Path) -> Iterator[mmap.mmap | bytes]:
+    """
+    Mapea un archivo sin comprimir en memoria (solo lectura). Nada se lee hasta que se
+    accede a un rango, y entonces el sistema solo carga las páginas de ese rango.
+    Los archivos vacíos no pueden mapearse: se devuelve b"".
+    """
+    with open(path, 'rb') as f:
+        try:
+            view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # Archivo vacío
+            yield b""
+            return
+        try:
+            yield view
+        finally:
+            view.close()
+
+
+def _skip(f, count: int) -> bool:
+    """Avanza count bytes en un stream leyendo y descartando (un blob zstd no admite seek). False si se acabó antes."""
+    while count > 0:
+        skipped = len(f.read(min(count, CHUNK_SIZE)))
+        if not skipped:
+            return False
+        count -= skipped
+    return True
+
+
+def read_range(path: str | Path, offset: int, length: int, compressed: bool = False) -> bytes:
+    """Bytes [offset, offset + length) de un archivo o blob. Los blobs comprimidos se descomprimen hasta offset + length."""
+    if compressed:
+        with open_blob(path) as f:
+            # Avanzar en un stream comprimido implica descomprimir hasta offset
+            return f.read(length) if _skip(f, offset) else b""
+    with _mapped(path) as view:
+        return view[offset:offset + length]
+
+
+def _head(view: mmap.mmap | bytes, count: int, limit: int, more: bool) -> tuple[bytes, bool]:
+    """Primeras count líneas dentro de view[:limit]; more indica que hay datos después de limit."""
+    end = 0
+    for _ in range(count):
+        newline = view.find(b"\n", end, limit)
+        if newline < 0:
+            return view[:limit], more
+        end = newline + 1
+    return view[:end], False
+
+
+def _tail(view: mmap.mmap | bytes, count: int, max_bytes: int, dropped: bool) -> tuple[bytes, bool]:
+    """Últimas count líneas dentro de los últimos max_bytes de view; dropped indica que hay datos antes de view."""
+    end = len(view)
+    floor = max(0, end - max_bytes)
+    # Un salto de línea final no cuenta como inicio de otra línea
+    start = end - 1 if end and view[end - 1:end] == b"\n" else end
+    for _ in range(count):
+        newline = view.rfind(b"\n", floor, start)
+        if newline < 0:
+            return view[floor:end], floor > 0 or dropped
+        start = newline
+    return view[start + 1:end], False
+
+
+def read_head_lines(path: str | Path, count: int, compressed: bool = False, max_bytes: int = MAX_LINES_BYTES) -> tuple[bytes, bool]:
+    """
+    Las primeras count líneas, como mucho max_bytes: solo se tocan las páginas hasta el
+    count-ésimo salto de línea. Devuelve (bytes, truncado).
+    """
+    if compressed:
+        with open_blob(path) as f:
+            data = f.read(max_bytes + 1)
+        return _head(data, count, min(len(data), max_bytes), len(data) > max_bytes)
+    with _mapped(path) as view:
+        return _head(view, count, min(len(view), max_bytes), len(view) > max_bytes)
+
+
+def read_tail_lines(path: str | Path, count: int, compressed: bool = False, max_bytes: int = MAX_LINES_BYTES) -> tuple[bytes, bool]:
+    """
+    Las últimas count líneas, como mucho max_bytes. Devuelve (bytes, truncado). Con un archivo
+    mapeado se buscan los saltos de línea hacia atrás desde el final, así que solo se tocan las
+    últimas páginas. Un blob comprimido no permite acceso aleatorio: se descomprime entero por
+    bloques conservando solo los últimos max_bytes.
+    """
+    if compressed:
+        buffer, dropped = bytearray(), False
+        with open_blob(path) as f:
+            while chunk := f.read(CHUNK_SIZE):
+                buffer += chunk
+                if len(buffer) > max_bytes:
+                    del buffer[:len(buffer) - max_bytes]
+                    dropped = True
+        window, truncated = _tail(buffer, count, max_bytes, dropped)
+        return bytes(window), truncated
+    with _mapped(path) as view:
+        return _tail(view, count, max_bytes, False)
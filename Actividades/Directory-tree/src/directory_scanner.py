@@ -2,176 +2,715 @@
 
 import os
 import stat
+import time
+import asyncio
 import datetime
+from concurrent.futures import Executor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import aclosing
 from pathlib import Path
-from typing import Callable
+from typing import AsyncIterator, Callable, Iterable, NamedTuple
 
 # Importar la clase FileSystemNode del mismo directorio src
-from .filesystem_node import FileSystemNode
+from .filesystem_node import FileSystemNode, NodeMetadata
+from .content_index import content_trigrams, TrigramAccumulator
+from .content_store import ContentStore, MemoryBudget
+from .scan_stats import ScanStats, DirectoryTally
+
+
+class ScanProgress(NamedTuple):
+    """Evento de progreso de un escaneo asíncrono (scan_directory_async / DirectoryTree.scan_async)."""
+    phase: str # 'listing' (listando directorios), 'linking' (enlazando nodos y asignando IDs) o 'done'
+    directories_listed: int
+    nodes_scanned: int # Entradas listadas (en 'listing') o nodos enlazados (en 'linking' y 'done')
+    bytes_read: int # Bytes de contenido leídos de los archivos
+    elapsed: float # Segundos desde el inicio del escaneo
+
+
+class _ScanContext:
+    """
+    Opciones de un escaneo y operaciones por entrada/directorio compartidas por
+    el escaneo completo (secuencial o paralelo) y el re-escaneo incremental.
+    """
+    def __init__(
+        self,
+        max_depth: int,
+        read_content: bool,
+        read_full_content: bool,
+        content_store: ContentStore | None,
+        content_preview_bytes: int,
+        on_node_created: Callable[[FileSystemNode], None] | None,
+        names_only: bool,
+        on_content_indexed: Callable[[int, set[str]], None] | None = None,
+        memory_budget: MemoryBudget | None = None,
+        stats: ScanStats | None = None
+    ):
+        self.max_depth = max_depth
+        self.read_content = read_content
+        self.read_full_content = read_full_content
+        self.content_store = content_store
+        self.memory_budget = memory_budget # Límite de contenido completo en memoria (None = sin límite)
+        self.content_preview_bytes = content_preview_bytes
+        self.on_node_created = on_node_created
+        self.names_only = names_only
+        # Si se indexa el contenido, los trigramas se calculan al leer cada archivo (en el
+        # hilo de listado) y se entregan a on_content_indexed cuando el nodo ya tiene ID.
+        self.on_content_indexed = on_content_indexed
+        self.pending_content_grams: dict[FileSystemNode, set[str]] = {}
+        self.stats = stats # Métricas por fase (j-scan --stats); None = sin medir
+
+    def build_child_node(
+        self,
+        entry_obj: os.DirEntry,
+        previous: FileSystemNode | None = None,
+        tally: DirectoryTally | None = None # Acumula tiempos y bytes si se miden métricas
+    ) -> FileSystemNode:
+        """
+        Crea el nodo (sin ID ni padre) de una entrada, leyendo su contenido si corresponde.
+        Usa la información de tipo cacheada en DirEntry (is_dir/is_symlink no hacen syscalls
+        en la mayoría de sistemas) y solo llama a stat() si se necesitan metadatos.
+        Si se indica el nodo previo de la misma entrada (re-escaneo incremental) y el archivo
+        no cambió de tamaño ni de fecha, se reutiliza su contenido en lugar de volver a leerlo.
+        """
+        try:
+            is_directory = entry_obj.is_dir()
+            if self.names_only:
+                # Modo rápido: solo nombre y tipo, sin stat ni contenido
+                return FileSystemNode(-1, entry_obj.name, entry_obj.path, is_directory, None)
+
+            if tally is not None:
+                stat_started = time.perf_counter()
+                entry_metadata = entry_obj.stat()
+                tally.stat_seconds += time.perf_counter() - stat_started
+            else:
+                entry_metadata = entry_obj.stat()
+            content = None
+            saved_content_path = None # Inicializar el nuevo atributo
+            content_grams = None # Trigramas para el índice de contenido (si está activado)
+
+            if (previous is not None and not is_directory and not previous.is_directory
+                    and _same_file_version(previous.metadata, entry_metadata)
+                    and (previous.content is not None or not self.read_content)):
+                # Archivo sin cambios: conservar el contenido ya leído
+                content = previous.content
+                saved_content_path = previous.saved_content_path
+
+            # Leer contenido solo si la lectura está activada y es un archivo regular: ni un enlace
+            # simbólico ni una FIFO, socket o dispositivo (abrirlos puede bloquear el escaneo).
+            # is_file(follow_symlinks=False) usa el tipo cacheado en DirEntry, sin syscall.
+            elif not is_directory and self.read_content and entry_obj.is_file(follow_symlinks=False):
+                read_started = time.perf_counter() if tally is not None else 0.0
+                try:
+                    with open(entry_obj, 'rb') as f:
+                        content_bytes = b"" # Inicializar antes del read
+
+                        if self.read_full_content:
+                            # Destino del contenido completo: el almacén en disco (--save-content-to-disk),
+                            # el de desbordamiento si el archivo ya no cabe en el presupuesto de memoria,
+                            # o la memoria.
+                            target_store = self.content_store
+                            if (target_store is None and self.memory_budget is not None
+                                    and not self.memory_budget.try_reserve(entry_metadata.st_size)):
+                                target_store = self.memory_budget.spill_store
+
+                            # --- LOGICA DE GUARDADO EN DISCO ---
+                            if target_store:
+                                # El archivo se copia por bloques (nunca entero en memoria). El almacén
+                                # nombra el blob por el hash del contenido: si ya existe (archivo
+                                # duplicado), no se escribe nada y se comparte el mismo blob.
+                                try:
+                                    accumulator = TrigramAccumulator() if self.on_content_indexed else None
+                                    saved_content_path = target_store.put_file(f, on_chunk=accumulator.feed if accumulator else None)
+                                    if accumulator: content_grams = accumulator.result()
+                                    # El atributo content en el nodo tendrá un marcador
+                                    content = f"<Content saved to disk at {Path(saved_content_path).name}>" # Indicar dónde se guardó
+
+                                except IOError as e:
+                                    content = f"<Error saving content to disk: {e}>"
+                                    saved_content_path = None
+                                except Exception as e: # Otros errores al guardar
+                                    content = f"<Unexpected error saving content to disk: {e}>"
+                                    saved_content_path = None
+
+                            else:
+                                # Si no se guarda en disco, almacenar el contenido completo en memoria (peligroso sin --memory-budget).
+                                # Con presupuesto, leer como mucho lo reservado: si el archivo creció desde el stat, se trunca.
+                                if self.memory_budget is not None:
+                                    content_bytes = f.read(entry_metadata.st_size)
+                                    truncated = bool(f.read(1))
+                                else:
+                                    content_bytes = f.read()
+                                    truncated = False
+                                if self.on_content_indexed: content_grams = content_trigrams(content_bytes)
+                                try:
+                                    content = content_bytes.decode('utf-8', errors='replace') # Decodificar contenido completo en memoria
+                                except Exception: # Falló decodificación, marcar como binario
+                                     content = f"<Binary content or decoding error, {len(content_bytes)} bytes read>"
+                                if truncated and not content.startswith('<'):
+                                    content += "..."
+                                saved_content_path = None # Asegurarse de que sea None
+
+
+                        else: # read_full_content es False, solo previsualización
+                            content_bytes = f.read(self.content_preview_bytes)
+                            if self.on_content_indexed: content_grams = content_trigrams(content_bytes)
+                            try:
+                                content = content_bytes.decode('utf-8', errors='replace')
+                            except Exception:
+                                 content = f"<Binary content or decoding error, first {len(content_bytes)} bytes read>"
+
+                            # Añadir puntos suspensivos si es solo una previsualización y el archivo es más grande
+                            if entry_metadata.st_size > self.content_preview_bytes:
+                                if isinstance(content, str) and not content.startswith('<'):
+                                    content += "..."
+                            saved_content_path = None # Asegurarse de que sea None
+
+
+                except IOError as e:
+                    content = f"<Error reading file: {e}>"
+                    saved_content_path = None
+                except Exception as e: # Capturar otros posibles errores de lectura
+                     content = f"<Error processing file content: {e}>"
+                     saved_content_path = None
+                if tally is not None:
+                    tally.read_seconds += time.perf_counter() - read_started
+                    tally.files_read += 1
+                    tally.bytes_read += entry_metadata.st_size if self.read_full_content else min(entry_metadata.st_size, self.content_preview_bytes)
+
+            # Crear el nodo FileSystemNode
+            child_node = FileSystemNode(
+                -1, # ID temporal
+                entry_obj.name,
+                entry_obj.path,
+                is_directory,
+                entry_metadata,
+                content=content # content ahora puede ser preview, marcador de guardado, o marcador de error/binario
+            )
+            child_node.saved_content_path = saved_content_path # <-- Asignar la ruta de guardado
+            if content_grams is not None:
+                self.pending_content_grams[child_node] = content_grams # Asignación atómica, segura entre hilos
+            return child_node
+
+        except PermissionError:
+             if tally is not None: tally.errors += 1
+             dummy_metadata = NodeMetadata() # Metadatos vacíos (tamaño 0, fechas 0)
+             return FileSystemNode(-1, entry_obj.name, entry_obj.path, entry_obj.is_dir(), dummy_metadata, content="<Permission Denied>")
+        except Exception as e:
+             if tally is not None: tally.errors += 1
+             dummy_metadata = NodeMetadata() # Metadatos vacíos (tamaño 0, fechas 0)
+             return FileSystemNode(-1, entry_obj.name, entry_obj.path, entry_obj.is_dir(), dummy_metadata, content=f"<Processing Error: {e}>")
+
+    def list_children(self, current_path: str | Path, previous_children: dict[str, FileSystemNode] | None = None) -> list[FileSystemNode]:
+        """Lista un directorio con os.scandir y devuelve sus hijos sin enlazar. Seguro para ejecutarse en hilos."""
+        children = []
+        tally = DirectoryTally() if self.stats is not None else None
+        started = time.perf_counter() if tally is not None else 0.0
+        try:
+            with os.scandir(current_path) as entries:
+                for entry_obj in entries:
+                    previous = previous_children.get(entry_obj.name) if previous_children else None
+                    children.append(self.build_child_node(entry_obj, previous, tally))
+        except PermissionError:
+            if tally is not None: tally.errors += 1
+        except Exception as e:
+            if tally is not None: tally.errors += 1
+        if tally is not None:
+            self.stats.record_directory(str(current_path), time.perf_counter() - started, len(children), tally)
+        return children
+
+    def attach_child(self, parent_node: FileSystemNode, child_node: FileSystemNode):
+        """Enlaza el hijo al padre, le asigna ID real e indexa su contenido. Solo en el hilo principal."""
+        started = time.perf_counter() if self.stats is not None else 0.0
+        # Agregar al padre y establecer la referencia de padre
+        parent_node.add_child(child_node)
+
+        # Asignar ID real y indexar usando el callback
+        if self.on_node_created:
+             self.on_node_created(child_node)
+
+        self.index_content_of(child_node, child_node)
+        if self.stats is not None:
+            self.stats.record_indexing(time.perf_counter() - started)
+
+    def index_content_of(self, built_node: FileSystemNode, indexed_node: FileSystemNode):
+        """Entrega los trigramas leídos para built_node al índice de contenido, bajo el ID de indexed_node."""
+        content_grams = self.pending_content_grams.pop(built_node, None)
+        if content_grams is not None and self.on_content_indexed:
+            self.on_content_indexed(indexed_node.node_id, content_grams)
+
+    def content_bytes_read(self, nodes: list[FileSystemNode]) -> int:
+        """Bytes de contenido que se leyeron al construir estos nodos (archivo completo o previsualización)."""
+        if not self.read_content:
+            return 0
+        total = 0
+        for node in nodes:
+            if not node.is_directory and node.content is not None and node.metadata is not None:
+                size = node.metadata.st_size
+                total += size if self.read_full_content else min(size, self.content_preview_bytes)
+        return total
+
+    def should_list(self, node: FileSystemNode, current_depth: int) -> bool:
+        return node.is_directory and not (self.max_depth >= 0 and current_depth > self.max_depth)
+
+    def scan_recursive(self, current_path: str | Path, parent_node: FileSystemNode, current_depth: int):
+        if not self.should_list(parent_node, current_depth):
+            return
+
+        for child_node in self.list_children(current_path):
+            self.attach_child(parent_node, child_node)
+
+            # Llamada recursiva si es un directorio
+            if child_node.is_directory:
+                self.scan_recursive(child_node.path, child_node, current_depth + 1)
+
+    def scan_parallel(self, start_path: str | Path, root_node: FileSystemNode, current_depth: int, workers: int):
+        # Fase 1: listar directorios en paralelo. Cada directorio terminado encola a sus subdirectorios.
+        listings: dict[FileSystemNode, list[FileSystemNode]] = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {executor.submit(self.list_children, start_path): (root_node, current_depth)}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    parent_node, depth = pending.pop(future)
+                    children = future.result()
+                    listings[parent_node] = children
+                    for child_node in children:
+                        if self.should_list(child_node, depth + 1):
+                            pending[executor.submit(self.list_children, child_node.path)] = (child_node, depth + 1)
+
+        # Fase 2: enlazar en pre-orden (igual que scan_recursive) para obtener los mismos IDs.
+        stack = [(root_node, iter(listings.get(root_node, ())))]
+        while stack:
+            parent_node, children_iter = stack[-1]
+            child_node = next(children_iter, None)
+            if child_node is None:
+                stack.pop()
+                continue
+            self.attach_child(parent_node, child_node)
+            if child_node in listings:
+                stack.append((child_node, iter(listings[child_node])))
+
+
+    def scan_frontier(
+        self,
+        frontier: list[FileSystemNode],
+        on_checkpoint: Callable[[list[FileSystemNode]], None] | None = None,
+        checkpoint_interval: float = 60.0
+    ):
+        """
+        Escaneo secuencial reanudable: frontier es una pila de directorios ya enlazados cuyos
+        hijos aún no se han listado. Cada directorio se lista y enlaza completo (todos sus hijos
+        reciben ID seguidos) antes de pasar al siguiente, así que entre dos directorios el estado
+        del escaneo es exactamente el árbol enlazado más la pila pendiente. Cada checkpoint_interval
+        segundos se entrega esa pila a on_checkpoint para que la guarde.
+
+        Nota: los IDs siguen un orden distinto al de scan_recursive (que numera en pre-orden),
+        pero reanudar desde un checkpoint da los mismos IDs que no haberse interrumpido.
+        """
+        stack = list(frontier)
+        last_checkpoint = time.monotonic()
+        while stack:
+            dir_node = stack.pop()
+            subdirs = []
+            for child_node in self.list_children(dir_node.path):
+                self.attach_child(dir_node, child_node)
+                if self.should_list(child_node, child_node.depth + 1):
+                    subdirs.append(child_node)
+            stack.extend(reversed(subdirs)) # El primer subdirectorio listado queda en la cima
+            if on_checkpoint and time.monotonic() - last_checkpoint >= checkpoint_interval:
+                on_checkpoint(stack)
+                last_checkpoint = time.monotonic()
+
+
+    def relist(
+        self,
+        dir_node: FileSystemNode,
+        current_depth: int,
+        counters: dict[str, int],
+        on_node_removed: Callable[[FileSystemNode], None] | None
+    ) -> list[FileSystemNode]:
+        """
+        Vuelve a listar un directorio ya enlazado y aplica las diferencias: las entradas que siguen
+        existiendo conservan su nodo (y su ID), las nuevas se crean y se escanean completas, y las
+        desaparecidas se desenlazan con todo su subárbol (notificando cada nodo a on_node_removed).
+        Actualiza counters ('added', 'removed') y devuelve los hijos nuevos.
+        """
+        previous_children = {child.name: child for child in dir_node.children}
+        fresh_children = self.list_children(dir_node.path, previous_children)
+
+        kept_names = set()
+        added_children = []
+        for fresh in fresh_children:
+            previous = previous_children.get(fresh.name)
+            if previous is not None and previous.is_directory == fresh.is_directory:
+                # Misma entrada: conservar el nodo (y su ID), actualizando metadatos y contenido.
+                # Los directorios conservan su metadata anterior hasta que se visiten, para poder comparar su st_mtime.
+                kept_names.add(fresh.name)
+                if not previous.is_directory:
+                    previous.metadata = fresh.metadata
+                    previous.content = fresh.content
+                    previous.saved_content_path = fresh.saved_content_path
+                    self.index_content_of(fresh, previous)
+            else:
+                added_children.append(fresh)
+
+        vanished = [previous for name, previous in previous_children.items() if name not in kept_names]
+        if vanished:
+            dir_node.remove_children(vanished)
+            for previous in vanished:
+                for removed in _walk_subtree(previous):
+                    counters['removed'] += 1
+                    if on_node_removed:
+                        on_node_removed(removed)
+
+        for fresh in added_children:
+            self.attach_child(dir_node, fresh)
+            if fresh.is_directory:
+                self.scan_recursive(fresh.path, fresh, current_depth + 1)
+            counters['added'] += sum(1 for _ in _walk_subtree(fresh))
+        return added_children
+
+    async def scan_parallel_async(
+        self,
+        start_path: str | Path,
+        root_node: FileSystemNode,
+        current_depth: int,
+        executor: Executor,
+        progress_interval: float = 0.5
+    ) -> AsyncIterator[ScanProgress]:
+        """
+        Versión asíncrona de scan_parallel: el listado de directorios se hace en executor y el
+        bucle de eventos solo espera resultados, así que nunca se bloquea en el sistema de archivos.
+        El enlazado (y la asignación de IDs) se hace en el hilo del bucle, en pre-orden como
+        scan_parallel, cediendo el control cada pocos miles de nodos. Se emite un ScanProgress
+        como mucho cada progress_interval segundos. Si se cancela, los listados pendientes se descartan.
+        """
+        loop = asyncio.get_running_loop()
+        started = last_event = time.monotonic()
+        directories_listed = entries_listed = bytes_read = 0
+
+        # Fase 1: listar directorios en el executor. Cada directorio terminado encola a sus subdirectorios.
+        listings: dict[FileSystemNode, list[FileSystemNode]] = {}
+        pending = {loop.run_in_executor(executor, self.list_children, start_path): (root_node, current_depth)}
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    parent_node, depth = pending.pop(future)
+                    children = future.result()
+                    listings[parent_node] = children
+                    directories_listed += 1
+                    entries_listed += len(children)
+                    bytes_read += self.content_bytes_read(children)
+                    for child_node in children:
+                        if self.should_list(child_node, depth + 1):
+                            pending[loop.run_in_executor(executor, self.list_children, child_node.path)] = (child_node, depth + 1)
+                if time.monotonic() - last_event >= progress_interval:
+                    last_event = time.monotonic()
+                    yield ScanProgress('listing', directories_listed, entries_listed, bytes_read, last_event - started)
+        finally:
+            for future in pending: # Cancelación: no empezar los listados que aún esperan en el executor
+                future.cancel()
+
+        # Fase 2: enlazar en pre-orden (igual que scan_recursive) para obtener los mismos IDs.
+        linked = 0
+        stack = [(root_node, iter(listings.get(root_node, ())))]
+        while stack:
+            parent_node, children_iter = stack[-1]
+            child_node = next(children_iter, None)
+            if child_node is None:
+                stack.pop()
+                continue
+            self.attach_child(parent_node, child_node)
+            linked += 1
+            if child_node in listings:
+                stack.append((child_node, iter(listings[child_node])))
+            if linked % 4096 == 0:
+                await asyncio.sleep(0) # Dejar que el bucle atienda otras tareas
+                if time.monotonic() - last_event >= progress_interval:
+                    last_event = time.monotonic()
+                    yield ScanProgress('linking', directories_listed, linked, bytes_read, last_event - started)
+        yield ScanProgress('done', directories_listed, linked + 1, bytes_read, time.monotonic() - started) # + la raíz
+
+
+def _walk_subtree(node: FileSystemNode):
+    """Recorre (iterativamente) un nodo y todos sus descendientes."""
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        yield current
+        if current.is_directory:
+            stack.extend(current.children)
+
+
+def _same_file_version(old_metadata, new_metadata) -> bool:
+    """True si dos metadatos describen la misma versión de un archivo (mismo tamaño, fecha e inodo)."""
+    if old_metadata is None or new_metadata is None:
+        return False
+    return (old_metadata.st_size == new_metadata.st_size
+            and old_metadata.st_mtime == new_metadata.st_mtime
+            and getattr(old_metadata, 'st_ino', 0) == getattr(new_metadata, 'st_ino', 0))
+
 
 def scan_directory(
     start_path: Path,
     max_depth: int = -1,
     read_content: bool = False, # True si se debe leer *algún* contenido (preview o full)
     read_full_content: bool = False, # True si se debe leer el contenido COMPLETO
-    save_full_content_to_disk_path: Path | None = None, # <-- NUEVO PARAMETRO: Si no es None, guardar contenido COMPLETO aquí
+    content_store: ContentStore | None = None, # Si no es None, guardar aquí el contenido COMPLETO (deduplicado por hash)
     content_preview_bytes: int = 1024,
-    on_node_created: Callable[[FileSystemNode], None] = None
+    on_node_created: Callable[[FileSystemNode], None] = None,
+    workers: int = 1, # Número de hilos para listar directorios (1 = escaneo secuencial)
+    names_only: bool = False, # Modo rápido: solo nombres y tipos (sin stat ni contenido; metadata = None)
+    on_content_indexed: Callable[[int, set[str]], None] | None = None, # Recibe (ID, trigramas) de cada archivo leído
+    memory_budget: MemoryBudget | None = None, # Límite de contenido completo en memoria; el resto se vuelca a disco
+    on_checkpoint: Callable[[list[FileSystemNode]], None] | None = None, # Recibe periódicamente la pila de directorios pendientes
+    checkpoint_interval: float = 60.0, # Segundos entre llamadas a on_checkpoint
+    stats: ScanStats | None = None # Si se indica, acumula métricas por fase (ver scan_stats.py)
 ) -> FileSystemNode | None:
     """
     Escanea un directorio de forma recursiva construyendo una estructura de FileSystemNode.
-    Permite leer contenido (previsualización o completo) y guardar contenido completo en disco.
-    """
+    Permite leer contenido (previsualización o completo) y guardar contenido completo en disco,
+    en un ContentStore que guarda una sola vez cada contenido distinto.
 
-    if not start_path.exists():
-        return None
+    Con workers > 1 los directorios se listan en paralelo con un pool de hilos, y el
+    árbol se ensambla al final en el mismo orden (pre-orden) que el escaneo secuencial,
+    por lo que la estructura y los IDs asignados por on_node_created son idénticos.
 
-    try:
-        metadata = start_path.stat()
-        is_directory_root = start_path.is_dir()
-        root_name = start_path.name if start_path.name else str(start_path)
+    El listado se hace con os.scandir reutilizando el tipo cacheado de cada DirEntry,
+    de modo que cada entrada cuesta como máximo un stat(), y ninguno con names_only=True.
+
+    Si se indica on_content_indexed, se llama con (ID, trigramas del contenido leído) para cada
+    archivo de texto cuyo contenido (previsualización o completo) se haya leído.
+
+    El contenido que va a disco (content_store, o el almacén de desbordamiento de memory_budget
+    cuando el contenido completo en memoria supera el presupuesto) se copia por bloques, así que
+    ningún archivo se carga entero en memoria por grande que sea.
+
+    Con on_checkpoint el escaneo es secuencial y reanudable (ver _ScanContext.scan_frontier y
+    continue_scan): workers se ignora.
 
-        # ID temporal -1, se asignará real por el callback
-        root_node = FileSystemNode(-1, root_name, str(start_path), is_directory_root, metadata)
+    Con stats, cada directorio listado entrega a ScanStats sus tiempos de stat() y de lectura de
+    contenido, y cada nodo enlazado el tiempo de on_node_created (ver scan_stats.py).
+    """
+
+    try:
+        root_node = build_root_node(start_path)
+        if root_node is None:
+            return None
         if on_node_created:
             on_node_created(root_node) # Asignar ID real y indexar
 
-        def _scan_recursive(current_path_obj: Path, parent_node: FileSystemNode, current_depth: int):
-            if not parent_node.is_directory or (max_depth >= 0 and current_depth > max_depth):
-                return
-
-            try:
-                for entry_obj in current_path_obj.iterdir():
-                    try:
-                        entry_metadata = entry_obj.stat()
-                        is_directory = entry_obj.is_dir()
-                        content = None
-                        saved_content_path = None # Inicializar el nuevo atributo
-
-                        # Leer contenido solo si es un archivo, la lectura está activada,
-                        # y no es un enlace simbólico a directorio.
-                        if not is_directory and read_content and not entry_obj.is_symlink():
-                            try:
-                                with open(entry_obj, 'rb') as f:
-                                    content_bytes = b"" # Inicializar antes del read
-
-                                    if read_full_content:
-                                        # Leer el archivo completo
-                                        content_bytes = f.read()
-
-                                        # --- LOGICA DE GUARDADO EN DISCO ---
-                                        if save_full_content_to_disk_path:
-                                            # Generar nombre de archivo único para la copia
-                                            # Usamos un nombre simple basado en ID (que se asignará luego)
-                                            # La ruta completa se construirá después de crear el nodo
-                                            saved_file_name = f"temp_node_content_{id(entry_obj)}_{entry_metadata.st_size}.dat" # Nombre temporal
-                                            saved_file_path_obj = save_full_content_to_disk_path / saved_file_name # Ruta completa temporal
-
-                                            try:
-                                                with open(saved_file_path_obj, 'wb') as out_f:
-                                                    out_f.write(content_bytes)
-                                                # Almacenar la ruta donde se guardó
-                                                saved_content_path = str(saved_file_path_obj)
-                                                # El atributo content en el nodo tendrá un marcador
-                                                content = f"<Content saved to disk at {saved_file_path_obj.name}>" # Indicar dónde se guardó
-                                                # Limpiar content_bytes de la memoria si ya se guardó en disco
-                                                content_bytes = b"" # Liberar memoria lo antes posible
-
-                                            except IOError as e:
-                                                content = f"<Error saving content to disk: {e}>"
-                                                saved_content_path = None
-                                            except Exception as e: # Otros errores al guardar
-                                                content = f"<Unexpected error saving content to disk: {e}>"
-                                                saved_content_path = None
-
-                                        else:
-                                            # Si no se guarda en disco, almacenar el contenido completo en memoria (peligroso)
-                                            try:
-                                                content = content_bytes.decode('utf-8', errors='replace') # Decodificar contenido completo en memoria
-                                            except Exception: # Falló decodificación, marcar como binario
-                                                 content = f"<Binary content or decoding error, {len(content_bytes)} bytes read>"
-                                            saved_content_path = None # Asegurarse de que sea None
-
-
-                                    else: # read_full_content es False, solo previsualización
-                                        content_bytes = f.read(content_preview_bytes)
-                                        try:
-                                            content = content_bytes.decode('utf-8', errors='replace')
-                                        except Exception:
-                                             content = f"<Binary content or decoding error, first {len(content_bytes)} bytes read>"
-
-                                        # Añadir puntos suspensivos si es solo una previsualización y el archivo es más grande
-                                        if entry_metadata.st_size > content_preview_bytes:
-                                            if isinstance(content, str) and not content.startswith('<'):
-                                                content += "..."
-                                        saved_content_path = None # Asegurarse de que sea None
-
-
-                            except IOError as e:
-                                content = f"<Error reading file: {e}>"
-                                saved_content_path = None
-                            except Exception as e: # Capturar otros posibles errores de lectura
-                                 content = f"<Error processing file content: {e}>"
-                                 saved_content_path = None
-
-                        # Crear el nodo FileSystemNode
-                        child_node = FileSystemNode(
-                            -1, # ID temporal
-                            entry_obj.name,
-                            str(entry_obj),
-                            is_directory,
-                            entry_metadata,
-                            content=content # content ahora puede ser preview, marcador de guardado, o marcador de error/binario
-                        )
-                        child_node.saved_content_path = saved_content_path # <-- Asignar la ruta de guardado
-
-
-                        # Agregar al padre y establecer la referencia de padre
-                        parent_node.add_child(child_node)
-
-                        # Asignar ID real y indexar usando el callback
-                        if on_node_created:
-                             # Si el contenido se guardó con un nombre temporal, renombrarlo ahora que tenemos el ID
-                             if child_node.saved_content_path and "temp_node_content_" in child_node.saved_content_path:
-                                 old_path_obj = Path(child_node.saved_content_path)
-                                 new_name = f"node_content_{child_node.node_id}.dat" # Nombre final usando el ID real
-                                 new_path_obj = old_path_obj.parent / new_name
-                                 try:
-                                     old_path_obj.rename(new_path_obj)
-                                     child_node.saved_content_path = str(new_path_obj)
-                                     # Actualizar el marcador en content si existe
-                                     if isinstance(child_node.content, str) and child_node.content.startswith("<Content saved to disk at"):
-                                         child_node.content = f"<Content saved to disk at {new_name}>"
-
-                                 except Exception as e:
-                                     print(f"Advertencia: No se pudo renombrar archivo de contenido guardado para nodo {child_node.node_id}: {e}")
-                                     # Dejar la ruta temporal o marcar como error? Dejar temporal por ahora.
-
-                             on_node_created(child_node)
-
-
-                        # Llamada recursiva si es un directorio
-                        if is_directory:
-                            _scan_recursive(entry_obj, child_node, current_depth + 1)
-
-                    except PermissionError:
-                         dummy_metadata = type('obj', (object,), {'st_size': 0, 'st_mode': 0, 'st_mtime': 0, 'st_ctime': 0})()
-                         child_node = FileSystemNode(-1, entry_obj.name, str(entry_obj), entry_obj.is_dir(), dummy_metadata, content="<Permission Denied>")
-                         parent_node.add_child(child_node)
-                         if on_node_created: on_node_created(child_node)
-                    except Exception as e:
-                         dummy_metadata = type('obj', (object,), {'st_size': 0, 'st_mode': 0, 'st_mtime': 0, 'st_ctime': 0})()
-                         child_node = FileSystemNode(-1, entry_obj.name, str(entry_obj), entry_obj.is_dir(), dummy_metadata, content=f"<Processing Error: {e}>")
-                         parent_node.add_child(child_node)
-                         if on_node_created: on_node_created(child_node)
-
-            except PermissionError: pass
-            except Exception as e: pass
+        context = _ScanContext(
+            max_depth, read_content, read_full_content, content_store,
+            content_preview_bytes, on_node_created, names_only, on_content_indexed, memory_budget, stats
+        )
 
         if root_node.is_directory and (max_depth != 0):
-             _scan_recursive(start_path, root_node, 1)
+             if on_checkpoint:
+                 context.scan_frontier([root_node], on_checkpoint, checkpoint_interval)
+             elif workers > 1:
+                 context.scan_parallel(start_path, root_node, 1, workers)
+             else:
+                 context.scan_recursive(start_path, root_node, 1)
 
         return root_node
 
     except PermissionError: return None
-    except Exception as e: return None
\ No newline at end of file
+    except Exception as e: return None
+
+
+def build_root_node(start_path: Path) -> FileSystemNode | None:
+    """Crea el nodo raíz (sin ID) de un escaneo, o None si la ruta no existe."""
+    if not start_path.exists():
+        return None
+    metadata = start_path.stat()
+    root_name = start_path.name if start_path.name else str(start_path)
+    # ID temporal -1, se asignará real por el callback
+    return FileSystemNode(-1, root_name, str(start_path), start_path.is_dir(), metadata)
+
+
+async def scan_directory_async(
+    root_node: FileSystemNode,
+    executor: Executor,
+    max_depth: int = -1,
+    read_content: bool = False,
+    read_full_content: bool = False,
+    content_store: ContentStore | None = None,
+    content_preview_bytes: int = 1024,
+    on_node_created: Callable[[FileSystemNode], None] = None,
+    names_only: bool = False,
+    on_content_indexed: Callable[[int, set[str]], None] | None = None,
+    memory_budget: MemoryBudget | None = None,
+    progress_interval: float = 0.5,
+    stats: ScanStats | None = None
+) -> AsyncIterator[ScanProgress]:
+    """
+    Equivalente asíncrono de scan_directory con workers > 1 (mismo árbol y mismos IDs), a partir
+    de un nodo raíz ya creado con build_root_node y notificado con on_node_created. Los directorios
+    se listan en executor (cuyo tamaño limita los listados simultáneos); ver _ScanContext.scan_parallel_async.
+    """
+    context = _ScanContext(
+        max_depth, read_content, read_full_content, content_store,
+        content_preview_bytes, on_node_created, names_only, on_content_indexed, memory_budget, stats
+    )
+    if root_node.is_directory and max_depth != 0:
+        async with aclosing(context.scan_parallel_async(root_node.path, root_node, 1, executor, progress_interval)) as events:
+            async for event in events:
+                yield event
+    else:
+        yield ScanProgress('done', 0, 1, 0, 0.0)
+
+
+def continue_scan(
+    frontier: list[FileSystemNode],
+    max_depth: int = -1,
+    read_content: bool = False,
+    read_full_content: bool = False,
+    content_store: ContentStore | None = None,
+    content_preview_bytes: int = 1024,
+    on_node_created: Callable[[FileSystemNode], None] = None,
+    names_only: bool = False,
+    on_content_indexed: Callable[[int, set[str]], None] | None = None,
+    memory_budget: MemoryBudget | None = None,
+    on_checkpoint: Callable[[list[FileSystemNode]], None] | None = None,
+    checkpoint_interval: float = 60.0,
+    stats: ScanStats | None = None
+):
+    """
+    Continúa un escaneo interrumpido (scan_directory con on_checkpoint) a partir de la pila
+    de directorios pendientes guardada en su último checkpoint. Los nodos de frontier ya están
+    enlazados al árbol recuperado; sus hijos se crean y se notifican con on_node_created.
+    """
+    context = _ScanContext(
+        max_depth, read_content, read_full_content, content_store,
+        content_preview_bytes, on_node_created, names_only, on_content_indexed, memory_budget, stats
+    )
+    context.scan_frontier(frontier, on_checkpoint, checkpoint_interval)
+
+
+def rescan_directory(
+    root_node: FileSystemNode,
+    max_depth: int = -1,
+    read_content: bool = False,
+    read_full_content: bool = False,
+    content_store: ContentStore | None = None,
+    content_preview_bytes: int = 1024,
+    on_node_created: Callable[[FileSystemNode], None] = None,
+    on_node_removed: Callable[[FileSystemNode], None] = None,
+    names_only: bool = False,
+    on_content_indexed: Callable[[int, set[str]], None] | None = None,
+    memory_budget: MemoryBudget | None = None,
+    stats: ScanStats | None = None
+) -> dict[str, int] | None:
+    """
+    Actualiza en el sitio un árbol escaneado previamente con scan_directory.
+
+    Solo se vuelven a listar los directorios cuyo st_mtime o inodo cambió desde el escaneo
+    anterior; el resto conserva sus hijos tal cual y solo se desciende a sus subdirectorios.
+    Las entradas que siguen existiendo conservan su nodo (y su ID); las nuevas se crean y se
+    notifican con on_node_created, y las eliminadas (con todo su subárbol) con on_node_removed.
+
+    Nota: modificar un archivo en el sitio no cambia el st_mtime de su directorio, así que
+    esos cambios solo se detectan si el directorio se vuelve a listar por otro motivo.
+
+    Returns:
+        dict[str, int] | None: Contadores del re-escaneo ('relisted', 'skipped', 'added', 'removed'),
+        o None si la raíz ya no existe o fue reemplazada (hace falta un escaneo completo).
+    """
+    try:
+        root_metadata = os.stat(root_node.path)
+    except OSError:
+        return None
+    if root_node.metadata is not None and getattr(root_node.metadata, 'st_ino', 0) != root_metadata.st_ino:
+        return None
+
+    context = _ScanContext(
+        max_depth, read_content, read_full_content, content_store,
+        content_preview_bytes, on_node_created, names_only, on_content_indexed, memory_budget, stats
+    )
+    counters = {'relisted': 0, 'skipped': 0, 'added': 0, 'removed': 0}
+
+    def _refresh(dir_node: FileSystemNode, current_metadata, current_depth: int):
+        previous_metadata = dir_node.metadata
+        if not names_only:
+            dir_node.metadata = NodeMetadata.from_stat(current_metadata)
+        if not context.should_list(dir_node, current_depth):
+            return
+
+        added_children = set()
+        if (previous_metadata is None
+                or previous_metadata.st_mtime != current_metadata.st_mtime
+                or getattr(previous_metadata, 'st_ino', 0) != current_metadata.st_ino):
+            counters['relisted'] += 1
+            added_children = set(context.relist(dir_node, current_depth, counters, on_node_removed))
+        else:
+            counters['skipped'] += 1
+
+        for child in list(dir_node.children):
+            if not child.is_directory or child in added_children:
+                continue # Los subárboles nuevos ya se escanearon completos en _relist
+            try:
+                child_metadata = os.stat(child.path)
+            except OSError:
+                continue # Desapareció después del listado; se detectará en el próximo re-escaneo
+            _refresh(child, child_metadata, current_depth + 1)
+
+    if root_node.is_directory and max_depth != 0:
+        _refresh(root_node, root_metadata, 1)
+    return counters
+
+
+def refresh_directories(
+    dir_nodes: Iterable[FileSystemNode],
+    max_depth: int = -1,
+    read_content: bool = False,
+    read_full_content: bool = False,
+    content_store: ContentStore | None = None,
+    content_preview_bytes: int = 1024,
+    on_node_created: Callable[[FileSystemNode], None] = None,
+    on_node_removed: Callable[[FileSystemNode], None] = None,
+    names_only: bool = False,
+    on_content_indexed: Callable[[int, set[str]], None] | None = None,
+    memory_budget: MemoryBudget | None = None,
+    stats: ScanStats | None = None
+) -> dict[str, int]:
+    """
+    Vuelve a listar exactamente los directorios indicados (p. ej. los que notificó el vigilante
+    de cambios), sin comparar ni recorrer el resto del árbol como hace rescan_directory.
+    Cada directorio se procesa como en el re-escaneo incremental (ver _ScanContext.relist).
+
+    Se procesan de menos a más profundo, de modo que un directorio que desapareció con el
+    listado de un ancestro (y ya se desenlazó) se omite; también los que ya no existen en disco,
+    cuya baja se aplica al listar su padre.
+
+    Returns:
+        dict[str, int]: Contadores ('relisted', 'skipped', 'added', 'removed').
+    """
+    context = _ScanContext(
+        max_depth, read_content, read_full_content, content_store,
+        content_preview_bytes, on_node_created, names_only, on_content_indexed, memory_budget, stats
+    )
+    counters = {'relisted': 0, 'skipped': 0, 'added': 0, 'removed': 0}
+    removed_nodes: set[FileSystemNode] = set()
+
+    def _on_removed(node: FileSystemNode):
+        removed_nodes.add(node)
+        if on_node_removed:
+            on_node_removed(node)
+
+    for dir_node in sorted(dir_nodes, key=lambda node: node.depth):
+        if dir_node in removed_nodes or not dir_node.is_directory:
+            continue
+        try:
+            current_metadata = os.stat(dir_node.path)
+        except OSError:
+            counters['skipped'] += 1
+            continue
+        if not names_only:
+            dir_node.metadata = NodeMetadata.from_stat(current_metadata)
+        if not context.should_list(dir_node, dir_node.depth + 1):
+            counters['skipped'] += 1
+            continue
+        counters['relisted'] += 1
+        context.relist(dir_node, dir_node.depth + 1, counters, _on_removed)
+    return counters
@@ -5,13 +5,44 @@ import os
 import stat
 import datetime
 from pathlib import Path # Asegúrate de tener Path importado
+import sys
 import json
-import re
+import heapq
+import shlex
+import asyncio
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from typing import AsyncIterator, Callable, NamedTuple
 
 # Importar las clases y funciones necesarias
-from .filesystem_node import FileSystemNode # FileSystemNode ahora tiene saved_content_path
-from .directory_scanner import scan_directory # scan_directory ahora toma save_full_content_to_disk_path
-from .tree_printer import build_tree_string
+from .filesystem_node import FileSystemNode, SubtreeStats # FileSystemNode ahora tiene saved_content_path
+from .directory_scanner import scan_directory, rescan_directory, refresh_directories, continue_scan, scan_directory_async, build_root_node, ScanProgress # scan_directory ahora toma un ContentStore
+from .tree_printer import write_tree, format_size
+from .tree_snapshot import write_snapshot, SnapshotReader, SnapshotNodeIndex
+from .name_index import NameIndex
+from .sorted_index import SortedAttributeIndex
+from .content_index import ContentIndex, file_contains, index_path
+from .content_store import ContentStore, MemoryBudget, is_compressed_blob
+from .preview_cache import PreviewCache
+from .duplicates import find_duplicate_groups
+from .tree_diff import diff_trees
+from .query import (Query, QueryError, Predicate, NamePredicate, LevelPredicate, SizePredicate, TimePredicate, ContentPredicate,
+                    IndexLookup, parse_query, query_from_criteria, predicates_of, candidate_ids, order_predicates)
+from .scan_stats import ScanStats
+from .content_view import read_range, read_head_lines, read_tail_lines, DEFAULT_PAGE_BYTES, MAX_LINES_BYTES
+
+
+class _ContentPlan(NamedTuple):
+    """Opciones de contenido ya resueltas para un escaneo (ver DirectoryTree._plan_content)."""
+    read_content: bool
+    read_full_content: bool
+    index_content: bool
+    save_path_obj: Path | None
+    content_store: ContentStore | None
+    budget: MemoryBudget | None
+    use_lazy_preview: bool
 
 
 class DirectoryTree:
@@ -23,9 +54,35 @@ class DirectoryTree:
         self.root: FileSystemNode | None = None
         self.node_index: dict[int, FileSystemNode] = {}
         self._next_node_id = 0
-        # Opcional: Podríamos almacenar la ruta donde se guardaron los archivos
-        # si necesitamos limpiarlos más tarde, pero no se pidió explícitamente.
-        # self._saved_content_dir: Path | None = None
+        # Índices secundarios. Se mantienen al crear/eliminar nodos; si valen None
+        # (p. ej. tras cargar un snapshot) se reconstruyen la primera vez que se usan.
+        self._level_index: dict[int, dict[int, FileSystemNode]] | None = {} # nivel -> {ID: nodo}
+        self._name_index: NameIndex | None = NameIndex() # nombre/extensión/trigramas -> IDs
+        # Índices ordenados para consultas de rango. Cambian con cualquier alta/baja o
+        # actualización de metadatos, así que no se mantienen: se descartan y se
+        # reconstruyen (una ordenación) la próxima vez que una búsqueda los necesita.
+        self._size_index: SortedAttributeIndex | None = None # st_size de archivos -> IDs
+        self._mtime_index: SortedAttributeIndex | None = None # st_mtime -> IDs
+        # Totales por directorio (tamaño acumulado, nº de archivos, st_mtime máximo). Igual que los
+        # índices de rango, se descartan con cualquier cambio y se recalculan en un solo recorrido.
+        self._subtree_stats: dict[int, SubtreeStats] | None = None # ID de directorio -> totales
+        # Índice de trigramas del contenido (j-scan --index-content). A diferencia de los
+        # anteriores no puede reconstruirse sin releer los archivos: None = no disponible.
+        self._content_index: ContentIndex | None = None
+        # Directorio donde se guardó el contenido completo (y content_index_<id>.json), si se usó --save-content-to-disk
+        self._saved_content_dir: Path | None = None
+        # index_id del índice guardado por el último checkpoint (se borra al guardar el siguiente)
+        self._checkpoint_index_id: str | None = None
+        # Directorio de desbordamiento de --read-full-content con --memory-budget (contenido "en memoria" volcado a disco)
+        self._spill_dir: Path | None = None
+        # Previsualizaciones cargadas bajo demanda (s-scan / --lazy-preview); None si se leyeron al escanear
+        self._preview_cache: PreviewCache | None = None
+        # Opciones con que se escaneó el árbol (ver scan); el vigilante de cambios las reutiliza
+        self._scan_options: dict | None = None
+        # Lo toma quien modifica el árbol desde otro hilo (TreeWatcher) y quien lo consulta mientras tanto
+        self.lock = threading.RLock()
+        # Métricas del último escaneo hecho con stats o stats_json (ver scan); as_dict() las da como dict
+        self.scan_stats: ScanStats | None = None
 
 
     def _assign_id_and_index(self, node: FileSystemNode):
@@ -33,11 +90,123 @@ class DirectoryTree:
         node.node_id = self._next_node_id
         self.node_index[self._next_node_id] = node
         self._next_node_id += 1
+        self._add_to_secondary_indexes(node)
         if node.is_directory:
             for child in node.children: # Iterar sobre la lista interna para indexar
                 self._assign_id_and_index(child)
 
 
+    def _remove_from_index(self, node: FileSystemNode):
+        """Quita del índice un nodo eliminado por un re-escaneo incremental."""
+        self.node_index.pop(node.node_id, None)
+        if self._level_index is not None:
+            self._level_index.get(node.depth, {}).pop(node.node_id, None)
+        if self._name_index is not None:
+            self._name_index.remove(node.node_id, node.name)
+        if self._content_index is not None:
+            self._content_index.discard(node.node_id)
+        if self._preview_cache is not None:
+            self._preview_cache.discard(node.node_id)
+        self._invalidate_derived_data()
+
+
+    def _add_to_secondary_indexes(self, node: FileSystemNode):
+        if self._level_index is not None:
+            self._level_index.setdefault(node.depth, {})[node.node_id] = node
+        if self._name_index is not None:
+            self._name_index.add(node.node_id, node.name)
+        self._invalidate_derived_data()
+
+
+    def _invalidate_derived_data(self):
+        """Descarta los índices de rango y los totales por subárbol; se recalculan en su próximo uso."""
+        self._size_index = None
+        self._mtime_index = None
+        self._subtree_stats = None
+
+
+    def _reset_secondary_indexes(self, lazy: bool = False):
+        """Vacía los índices secundarios; con lazy=True se reconstruirán en su primer uso."""
+        self._level_index = None if lazy else {}
+        self._name_index = None if lazy else NameIndex()
+        self._invalidate_derived_data()
+
+
+    def get_nodes_at_level(self, level: int) -> list[FileSystemNode]:
+        """Devuelve los nodos de un nivel dado usando el índice por nivel (sin recorrer el árbol)."""
+        if self._level_index is None:
+            self._level_index = {}
+            for node in self.node_index.values():
+                self._level_index.setdefault(node.depth, {})[node.node_id] = node
+        return list(self._level_index.get(level, {}).values())
+
+
+    def _get_name_index(self) -> NameIndex:
+        if self._name_index is None:
+            self._name_index = NameIndex()
+            for node in self.node_index.values():
+                self._name_index.add(node.node_id, node.name)
+        return self._name_index
+
+
+    def _get_size_index(self) -> SortedAttributeIndex:
+        if self._size_index is None:
+            self._size_index = SortedAttributeIndex(
+                (node.metadata.st_size, node.node_id) for node in self.node_index.values()
+                if not node.is_directory and node.metadata is not None
+            )
+        return self._size_index
+
+
+    def _get_mtime_index(self) -> SortedAttributeIndex:
+        if self._mtime_index is None:
+            self._mtime_index = SortedAttributeIndex(
+                (node.metadata.st_mtime, node.node_id) for node in self.node_index.values()
+                if node.metadata is not None
+            )
+        return self._mtime_index
+
+
+    def get_subtree_stats(self) -> dict[int, SubtreeStats]:
+        """
+        Totales acumulados de cada directorio del árbol (ID -> SubtreeStats).
+
+        Se calculan en un único recorrido iterativo: se lista el árbol en pre-orden y se procesa
+        esa lista al revés, de modo que cada directorio se visita después de todos sus hijos
+        (post-orden) y sus totales son la suma de los de sus hijos. El resultado se guarda hasta
+        que el árbol cambie (escaneo, re-escaneo incremental o carga de un snapshot).
+        El tamaño de un subárbol con archivos sin metadatos (escaneo --names-only) es None:
+        se desconoce, no es 0.
+        """
+        if self._subtree_stats is None:
+            stats: dict[int, SubtreeStats] = {}
+            order = []
+            stack = [self.root] if self.root is not None else []
+            while stack:
+                node = stack.pop()
+                order.append(node)
+                if node.is_directory:
+                    stack.extend(node.children)
+            for node in reversed(order):
+                if not node.is_directory:
+                    continue
+                total_size, file_count = 0, 0
+                max_mtime = node.metadata.st_mtime if node.metadata is not None else 0.0
+                for child in node.children:
+                    if child.is_directory:
+                        child_size, child_count, child_mtime = stats[child.node_id]
+                    elif child.metadata is not None:
+                        child_size, child_count, child_mtime = child.metadata.st_size, 1, child.metadata.st_mtime
+                    else: # Escaneo --names-only: se cuenta el archivo, sin tamaño ni fecha
+                        child_size, child_count, child_mtime = None, 1, 0.0
+                    total_size = total_size + child_size if total_size is not None and child_size is not None else None
+                    file_count += child_count
+                    if child_mtime > max_mtime: max_mtime = child_mtime
+                stats[node.node_id] = SubtreeStats(total_size, file_count, max_mtime)
+            self._subtree_stats = stats
+        return self._subtree_stats
+
+
     def scan(
         self,
         path: str,
@@ -45,30 +214,489 @@ class DirectoryTree:
         read_content: bool = False,
         read_full_content: bool = False,
         save_content_to_disk_dir: str | None = None, # <-- NUEVO PARAMETRO: Directorio donde guardar contenido completo
-        content_preview_bytes: int = 1024
+        content_preview_bytes: int = 1024,
+        workers: int = 1, # Hilos para listar directorios en paralelo (1 = secuencial)
+        names_only: bool = False, # Modo rápido: solo nombres y tipos, sin metadatos ni contenido
+        incremental: bool = False, # Reutilizar el árbol previo de la misma ruta y re-listar solo directorios modificados
+        index_content: bool = False, # Construir el índice de trigramas del contenido leído (para search content=)
+        compress: str | None = None, # Compresión de los blobs guardados en disco: None, 'zlib' o 'zstd'
+        memory_budget: int | None = None, # Bytes máximos de contenido completo en memoria (None = sin límite)
+        spill_dir: str | None = None, # Dónde volcar el contenido que no cabe en memory_budget (por defecto, un directorio temporal)
+        lazy_preview: bool = False, # Leer las previsualizaciones bajo demanda (open/search) en lugar de durante el escaneo
+        prefetch: bool = False, # Con lazy_preview: precargar previsualizaciones en segundo plano tras el escaneo
+        preview_cache_bytes: int = 64 * 1024 * 1024, # Presupuesto de la caché LRU de previsualizaciones
+        checkpoint: str | None = None, # Guardar periódicamente el progreso en este archivo (snapshot reanudable)
+        checkpoint_interval: float | None = None, # Segundos entre checkpoints (None: 60, o el del checkpoint al reanudar)
+        resume: str | None = None, # Continuar el escaneo de este checkpoint, con las opciones guardadas en él
+        stats: bool = False, # Informar del progreso durante el escaneo y mostrar las métricas por fase al terminar
+        stats_json: str | None = None, # Guardar las métricas del escaneo en este archivo JSON
+        stats_interval: float = 2.0 # Segundos entre líneas de progreso con stats
     ) -> FileSystemNode | None:
         """
         Escanea el directorio especificado y construye el árbol.
         Sobrescribe cualquier árbol escaneado previamente.
         Permite leer contenido (previsualización o completo) y guardar contenido completo en disco.
+        El contenido guardado va a un almacén direccionado por contenido (objects/ab/<sha256>):
+        los archivos idénticos comparten un único blob, opcionalmente comprimido (compress).
+        Con workers > 1 el listado de directorios se reparte entre varios hilos; el árbol
+        y los IDs resultantes son los mismos que en el escaneo secuencial.
+        Con names_only=True no se llama a stat() por entrada: los nodos quedan con metadata = None
+        y se ignoran las opciones de contenido.
+        Con incremental=True, si el árbol actual corresponde a la misma ruta, solo se vuelven a
+        listar los directorios cuyo st_mtime/inodo cambió y los nodos sin cambios conservan su ID.
+        Con index_content=True se indexan los trigramas del contenido leído (previsualización
+        o completo); si además se guarda en disco, el índice se persiste junto al contenido.
+        Con read_full_content (sin guardar en disco) y memory_budget, el contenido completo se
+        mantiene en memoria hasta agotar el presupuesto; los archivos que ya no caben se vuelcan
+        por bloques a spill_dir y siguen siendo accesibles con open y search content=.
+        Con lazy_preview (solo previsualización, sin índice de contenido) el escaneo no lee ningún
+        archivo: cada previsualización se lee la primera vez que open o search content= la piden y
+        se guarda en una caché LRU de preview_cache_bytes; prefetch la va llenando en segundo plano.
+        Con checkpoint, el escaneo (secuencial) guarda cada checkpoint_interval segundos un snapshot
+        con los nodos creados y la pila de directorios pendientes; resume carga ese snapshot y
+        continúa desde allí con las mismas opciones. Al terminar, el checkpoint contiene el árbol
+        completo y puede cargarse con load_snapshot.
+        Con stats o stats_json se miden el tiempo de cada fase (listado, stat, lectura de contenido,
+        escritura en disco, indexado), los bytes leídos y escritos y los directorios más lentos;
+        quedan en self.scan_stats. Con stats se imprime además una línea de progreso cada
+        stats_interval segundos y un resumen al terminar.
         """
-        self.root = None
-        self.node_index = {}
-        self._next_node_id = 0
-        # self._saved_content_dir = None # Resetear la ruta de guardado si se almacenara aquí
-
+        resume_frontier: list[FileSystemNode] | None = None
+        if resume:
+            checkpoint_state = self._load_checkpoint(resume)
+            if checkpoint_state is None:
+                return None
+            options, resume_frontier = checkpoint_state
+            path, depth = options['path'], options['depth']
+            read_content, read_full_content = options['read_content'], options['read_full_content']
+            save_content_to_disk_dir, compress = options['save_content_to_disk_dir'], options['compress']
+            content_preview_bytes, names_only = options['content_preview_bytes'], options['names_only']
+            index_content, lazy_preview = options['index_content'], options['lazy_preview']
+            memory_budget, spill_dir = options['memory_budget'], options['spill_dir']
+            if checkpoint_interval is None: checkpoint_interval = options.get('checkpoint_interval')
+            checkpoint = checkpoint or resume # Seguir guardando el progreso en el mismo archivo
+            incremental = False
+        if checkpoint_interval is None: checkpoint_interval = 60.0
+        # Opciones tal como se pidieron, para poder reanudar el escaneo desde un checkpoint
+        scan_options = {
+            'path': path, 'depth': depth, 'read_content': read_content, 'read_full_content': read_full_content,
+            'save_content_to_disk_dir': save_content_to_disk_dir, 'compress': compress,
+            'content_preview_bytes': content_preview_bytes, 'names_only': names_only, 'index_content': index_content,
+            'lazy_preview': lazy_preview, 'memory_budget': memory_budget, 'spill_dir': spill_dir,
+        }
         start_path_obj = Path(path.strip().strip('"\''))
+        if self._preview_cache is not None:
+            self._preview_cache.stop_prefetch() # La precarga recorre el árbol que se va a modificar
+        if incremental and not (self.root is not None and Path(self.root.path) == start_path_obj):
+            print("No hay un árbol previo de esta ruta; se realizará un escaneo completo.")
+            incremental = False
+        if incremental and index_content and self._content_index is None:
+            print("El árbol previo no tiene índice de contenido; se realizará un escaneo completo.")
+            incremental = False
 
         print(f"Iniciando escaneo de: {start_path_obj}")
         if depth >= 0: print(f"Profundidad máxima de escaneo: {depth}")
+        if checkpoint and incremental:
+            print("Advertencia: --checkpoint no se aplica al re-escaneo incremental.")
+            checkpoint = None
+        if checkpoint and workers > 1:
+            print("Advertencia: el escaneo con checkpoints es secuencial; se ignora --workers.")
+            workers = 1
+        if workers > 1: print(f"Escaneo paralelo con {workers} hilos.")
+
+        plan = self._plan_content(
+            read_content, read_full_content, save_content_to_disk_dir, content_preview_bytes, names_only,
+            index_content, compress, memory_budget, spill_dir, lazy_preview, preview_cache_bytes
+        )
+        if plan is None:
+            return None
+        read_content, read_full_content, index_content, save_path_obj, content_store, budget, use_lazy_preview = plan
+        if budget is not None:
+            scan_options['spill_dir'] = str(budget.spill_store.root) # Al reanudar se vuelca en el mismo directorio
+            if resume: budget.used_bytes = options.get('memory_used', 0)
+
+        self.scan_stats = None
+        collector: ScanStats | None = None
+        if stats or stats_json:
+            collector = ScanStats()
+            collector.watch_store(content_store)
+            collector.watch_store(budget.spill_store if budget is not None else None)
+            if stats: collector.start_reporter(stats_interval)
+
+
+        # Las métricas se cierran en el finally también si el re-escaneo incremental falla
+        try:
+            if incremental:
+                print(f"Re-escaneo incremental de: {start_path_obj}")
+                counters = rescan_directory(
+                    self.root,
+                    max_depth=depth,
+                    read_content=read_content,
+                    read_full_content=read_full_content,
+                    content_store=content_store,
+                    content_preview_bytes=content_preview_bytes,
+                    on_node_created=self._assign_id_and_index,
+                    on_node_removed=self._remove_from_index,
+                    names_only=names_only,
+                    on_content_indexed=self._content_index.add if index_content else None,
+                    memory_budget=budget,
+                    stats=collector
+                )
+                self._invalidate_derived_data() # El re-escaneo actualiza metadatos de nodos existentes
+                if counters is not None:
+                    print("Re-escaneo incremental completado.")
+                    print(f"Directorios re-listados: {counters['relisted']}, sin cambios: {counters['skipped']}")
+                    print(f"Nodos añadidos: {counters['added']}, eliminados: {counters['removed']}")
+                    print(f"Total de nodos en el árbol: {len(self.node_index)}")
+                    if not index_content: self._content_index = None # El índice previo ya no refleja el contenido
+                    self._finish_content_index(save_path_obj)
+                    self._report_content_store(content_store)
+                    self._report_memory_budget(budget)
+                    self._finish_preview_cache(use_lazy_preview, content_preview_bytes, preview_cache_bytes, prefetch)
+                    self._scan_options = scan_options
+                    return self.root
+                print("La raíz cambió o ya no existe; se realizará un escaneo completo.")
+
+            if resume_frontier is None:
+                self.root = None
+                self.node_index = {}
+                self._next_node_id = 0
+                self._reset_secondary_indexes()
+                self._content_index = ContentIndex() if index_content else None
+            elif index_content and self._content_index is None:
+                # Sin el índice guardado en el último checkpoint, uno nuevo solo cubriría los nodos que faltan
+                print("Advertencia: el checkpoint no tiene un índice de contenido guardado; se omitirá el índice.")
+                index_content = False
+            elif not index_content:
+                self._content_index = None
+            self._preview_cache = None
+
+            on_checkpoint = None
+            if checkpoint:
+                print(f"Guardando el progreso cada {checkpoint_interval:g} s en: {checkpoint}")
+                self._checkpoint_index_id = self._content_index.index_id if resume_frontier is not None and self._content_index is not None else None
+                # Los checkpoints registran dónde está el contenido guardado o volcado
+                self._saved_content_dir = save_path_obj
+                self._spill_dir = budget.spill_store.root if budget is not None else None
+                on_checkpoint = lambda frontier: self._write_checkpoint(checkpoint, frontier, scan_options, budget, checkpoint_interval)
+
+            if resume_frontier is not None:
+                print(f"Reanudando el escaneo: {len(self.node_index)} nodos recuperados, {len(resume_frontier)} directorios pendientes.")
+                continue_scan(
+                    resume_frontier,
+                    max_depth=depth,
+                    read_content=read_content,
+                    read_full_content=read_full_content,
+                    content_store=content_store,
+                    content_preview_bytes=content_preview_bytes,
+                    on_node_created=self._assign_id_and_index,
+                    names_only=names_only,
+                    on_content_indexed=self._content_index.add if index_content else None,
+                    memory_budget=budget,
+                    on_checkpoint=on_checkpoint,
+                    checkpoint_interval=checkpoint_interval,
+                    stats=collector
+                )
+            else:
+                # Usar la función de escaneo, pasando todos los parámetros
+                self.root = scan_directory(
+                    start_path_obj,
+                    max_depth=depth,
+                    read_content=read_content,
+                    read_full_content=read_full_content,
+                    content_store=content_store, # <-- Pasar el almacén de contenido (o None)
+                    content_preview_bytes=content_preview_bytes,
+                    on_node_created=self._assign_id_and_index,
+                    workers=workers,
+                    names_only=names_only,
+                    on_content_indexed=self._content_index.add if index_content else None,
+                    memory_budget=budget,
+                    on_checkpoint=on_checkpoint,
+                    checkpoint_interval=checkpoint_interval,
+                    stats=collector
+                )
+
+            if self.root:
+                print("Escaneo completado.")
+                print(f"Total de nodos escaneados: {len(self.node_index)}")
+                self._finish_content_index(save_path_obj)
+                self._report_content_store(content_store)
+                self._report_memory_budget(budget)
+                self._finish_preview_cache(use_lazy_preview, content_preview_bytes, preview_cache_bytes, prefetch)
+                self._scan_options = scan_options
+                if checkpoint:
+                    # Checkpoint final sin directorios pendientes: es un snapshot completo del árbol
+                    self._write_checkpoint(checkpoint, [], scan_options, budget, checkpoint_interval)
+                    print(f"El checkpoint '{checkpoint}' contiene el árbol completo (puede cargarse con load).")
+            else:
+                print(f"Error: No se pudo escanear la ruta '{path}'.")
+
+            return self.root
+
+        except Exception as e:
+            print(f"Ocurrió un error inesperado durante el escaneo: {e}")
+            return None
+        finally:
+            self._finish_scan_stats(collector, stats, stats_json)
+
+
+    def refresh_directories(
+        self,
+        dir_nodes,
+        on_directory_added=None,
+        on_directory_removed=None,
+        rescan_all: bool = False
+    ) -> dict[str, int]:
+        """
+        Vuelve a listar los directorios indicados (p. ej. los que notificó TreeWatcher) y aplica
+        las altas, bajas y cambios de metadatos a los índices, con las mismas opciones de contenido
+        del último escaneo (sin mensajes por consola: se llama desde el hilo del vigilante).
+        on_directory_added / on_directory_removed reciben cada directorio que entra o sale del árbol.
+
+        Con rescan_all se ignora dir_nodes y se compara todo el árbol con el disco como en el
+        re-escaneo incremental (rescan_directory): solo se re-listan los directorios cuyo st_mtime
+        o inodo cambió. Es lo que usa el vigilante cuando se perdieron eventos.
+
+        Returns:
+            dict[str, int]: Contadores ('relisted', 'skipped', 'added', 'removed').
+        """
+        options = self._scan_options or {}
+        names_only = options.get('names_only', False) or (self.root is not None and self.root.metadata is None)
+        read_content = options.get('read_content', False) and not options.get('lazy_preview', False)
+        read_full_content = options.get('read_full_content', False)
+        content_store: ContentStore | None = None
+        budget: MemoryBudget | None = None
+        if names_only:
+            read_content = read_full_content = False
+        elif self._saved_content_dir is not None:
+            content_store = ContentStore(self._saved_content_dir, compression=options.get('compress'))
+            read_content = read_full_content = True
+        elif read_full_content and self._spill_dir is not None and options.get('memory_budget') is not None:
+            # Se desconoce cuánto del presupuesto sigue ocupado: el contenido nuevo va directo a disco
+            budget = MemoryBudget(options['memory_budget'], ContentStore(self._spill_dir))
+            budget.used_bytes = budget.limit_bytes
+
+        def _on_created(node: FileSystemNode):
+            self._assign_id_and_index(node)
+            if on_directory_added is not None and node.is_directory:
+                on_directory_added(node)
+
+        def _on_removed(node: FileSystemNode):
+            self._remove_from_index(node)
+            if on_directory_removed is not None and node.is_directory:
+                on_directory_removed(node)
+
+        context_options = dict(
+            max_depth=options.get('depth', -1),
+            read_content=read_content,
+            read_full_content=read_full_content,
+            content_store=content_store,
+            content_preview_bytes=options.get('content_preview_bytes', 1024),
+            on_node_created=_on_created,
+            on_node_removed=_on_removed,
+            names_only=names_only,
+            on_content_indexed=self._content_index.add if self._content_index is not None and read_content else None,
+            memory_budget=budget
+        )
+        if rescan_all:
+            counters = rescan_directory(self.root, **context_options) if self.root is not None else None
+            # None: la raíz desapareció o se reemplazó; no hay nada que re-listar hasta un nuevo j-scan
+            counters = counters or {'relisted': 0, 'skipped': 0, 'added': 0, 'removed': 0}
+        else:
+            counters = refresh_directories(dir_nodes, **context_options)
+        self._invalidate_derived_data() # Los directorios re-listados cambian de metadatos
+        return counters
+
+
+    def _finish_scan_stats(self, collector: ScanStats | None, report: bool, json_filename: str | None):
+        """Cierra las métricas de un escaneo, las muestra (report) y las guarda en JSON si se pidió."""
+        if collector is None:
+            return
+        collector.stop()
+        self.scan_stats = collector
+        if report: collector.print_report()
+        if json_filename:
+            try:
+                collector.save_json(json_filename)
+                print(f"Métricas del escaneo guardadas en: {json_filename}")
+            except (IOError, OSError) as e:
+                print(f"Advertencia: No se pudieron guardar las métricas en '{json_filename}': {e}")
+
+
+    def _finish_content_index(self, save_path_obj: Path | None):
+        """Recuerda el directorio de guardado y persiste allí el índice de contenido, si lo hay."""
+        self._saved_content_dir = save_path_obj
+        if self._content_index is None:
+            return
+        print(f"Archivos con contenido indexado: {len(self._content_index)}")
+        if save_path_obj is not None:
+            try:
+                index_path = self._content_index.save(save_path_obj)
+                print(f"Índice de contenido guardado en: {index_path}")
+            except OSError as e:
+                print(f"Advertencia: No se pudo guardar el índice de contenido: {e}")
+
+
+    async def scan_async(
+        self,
+        path: str,
+        depth: int = -1,
+        read_content: bool = False,
+        read_full_content: bool = False,
+        save_content_to_disk_dir: str | None = None,
+        content_preview_bytes: int = 1024,
+        workers: int = 4, # Listados de directorio simultáneos (tamaño del executor)
+        names_only: bool = False,
+        index_content: bool = False,
+        compress: str | None = None,
+        memory_budget: int | None = None,
+        spill_dir: str | None = None,
+        lazy_preview: bool = False,
+        prefetch: bool = False,
+        preview_cache_bytes: int = 64 * 1024 * 1024,
+        progress_interval: float = 0.5 # Segundos mínimos entre eventos de progreso
+    ) -> AsyncIterator[ScanProgress]:
+        """
+        Versión asyncio de scan para usar DirectoryTree dentro de un servicio sin bloquear el
+        bucle de eventos. Es un iterador asíncrono de eventos ScanProgress (fase, directorios
+        listados, nodos, bytes de contenido leídos, segundos transcurridos):
+
+            async for progress in tree.scan_async("/datos", workers=8):
+                print(progress.phase, progress.nodes_scanned)
+
+        Los directorios se listan (y su contenido se lee) en un pool de workers hilos, y el árbol
+        se enlaza en el hilo del bucle con el mismo orden que scan, así que el árbol y los IDs son
+        los mismos que con scan. Admite las mismas opciones de contenido que scan, pero no el
+        re-escaneo incremental ni los checkpoints.
+
+        El árbol nuevo se construye aparte y reemplaza al actual solo al terminar: mientras tanto
+        las consultas (search, get_node_by_id...) siguen respondiendo con el árbol anterior. Si la
+        tarea se cancela (o se cierra el iterador), los listados pendientes se descartan y el árbol
+        actual queda intacto.
+        """
+        start_path_obj = Path(path.strip().strip('"\''))
+        print(f"Iniciando escaneo asíncrono de: {start_path_obj}")
+        if depth >= 0: print(f"Profundidad máxima de escaneo: {depth}")
+        staging = DirectoryTree()
+        plan = staging._plan_content(
+            read_content, read_full_content, save_content_to_disk_dir, content_preview_bytes, names_only,
+            index_content, compress, memory_budget, spill_dir, lazy_preview, preview_cache_bytes
+        )
+        if plan is None:
+            return
+        staging._content_index = ContentIndex() if plan.index_content else None
+
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="dtree-scan")
+        swapped = False
+        try:
+            root_node = await loop.run_in_executor(executor, build_root_node, start_path_obj)
+            if root_node is None:
+                print(f"Error: No se pudo escanear la ruta '{path}'.")
+                return
+            staging._assign_id_and_index(root_node)
+            last_event = None
+            async with aclosing(scan_directory_async(
+                root_node,
+                executor,
+                max_depth=depth,
+                read_content=plan.read_content,
+                read_full_content=plan.read_full_content,
+                content_store=plan.content_store,
+                content_preview_bytes=content_preview_bytes,
+                on_node_created=staging._assign_id_and_index,
+                names_only=names_only,
+                on_content_indexed=staging._content_index.add if plan.index_content else None,
+                memory_budget=plan.budget,
+                progress_interval=progress_interval
+            )) as events:
+                async for last_event in events:
+                    if last_event.phase != 'done': yield last_event
+
+            # Sustituir el árbol actual por el nuevo (y detener la precarga que recorre el anterior)
+            if self._preview_cache is not None: self._preview_cache.stop_prefetch()
+            staging.root = root_node
+            staging._scan_options = {
+                'path': path, 'depth': depth, 'read_content': read_content, 'read_full_content': read_full_content,
+                'save_content_to_disk_dir': save_content_to_disk_dir, 'compress': compress,
+                'content_preview_bytes': content_preview_bytes, 'names_only': names_only, 'index_content': index_content,
+                'lazy_preview': lazy_preview, 'memory_budget': memory_budget, 'spill_dir': spill_dir,
+            }
+            self._adopt_tree(staging)
+            swapped = True
+            print("Escaneo completado.")
+            print(f"Total de nodos escaneados: {len(self.node_index)}")
+            self._finish_content_index(plan.save_path_obj)
+            self._report_content_store(plan.content_store)
+            self._report_memory_budget(plan.budget)
+            self._finish_preview_cache(plan.use_lazy_preview, content_preview_bytes, preview_cache_bytes, prefetch)
+            yield last_event
+        except (asyncio.CancelledError, GeneratorExit):
+            if swapped: print("Escaneo asíncrono cancelado después de reemplazar el árbol.")
+            else: print("Escaneo asíncrono cancelado; el árbol actual no se modificó.")
+            raise
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+    def _adopt_tree(self, staging: "DirectoryTree"):
+        """
+        Reemplaza el árbol por el construido en staging (scan_async), con el lock tomado. Solo se
+        copian el árbol y sus índices; el lock, las métricas y el resto del estado siguen siendo
+        los de self, y los directorios de contenido y la caché de previsualizaciones los fijan
+        después _finish_content_index, _report_memory_budget y _finish_preview_cache, como en scan.
+        """
+        with self.lock:
+            self.root = staging.root
+            self.node_index = staging.node_index
+            self._next_node_id = staging._next_node_id
+            self._level_index = staging._level_index
+            self._name_index = staging._name_index
+            self._size_index = staging._size_index
+            self._mtime_index = staging._mtime_index
+            self._subtree_stats = staging._subtree_stats
+            self._content_index = staging._content_index
+            self._scan_options = staging._scan_options
+            self._checkpoint_index_id = None
+            self._preview_cache = None
+            self.scan_stats = None
+
 
+    def _plan_content(
+        self,
+        read_content: bool,
+        read_full_content: bool,
+        save_content_to_disk_dir: str | None,
+        content_preview_bytes: int,
+        names_only: bool,
+        index_content: bool,
+        compress: str | None,
+        memory_budget: int | None,
+        spill_dir: str | None,
+        lazy_preview: bool,
+        preview_cache_bytes: int
+    ) -> _ContentPlan | None:
+        """
+        Resuelve las opciones de contenido de un escaneo (scan o scan_async): qué se lee, dónde se
+        guarda y si se indexa, creando el almacén de contenido o el presupuesto de memoria que
+        correspondan. Informa de cada decisión por consola. None si no se puede escanear.
+        """
         save_path_obj: Path | None = None
-        if save_content_to_disk_dir:
+        content_store: ContentStore | None = None
+        budget: MemoryBudget | None = None
+        use_lazy_preview = False
+        if names_only:
+            print("Modo rápido: solo nombres y tipos (sin metadatos ni contenido).")
+            read_content = False
+            read_full_content = False
+            index_content = False
+        elif save_content_to_disk_dir:
             try:
                 save_path_obj = Path(save_content_to_disk_dir).expanduser().resolve() # Expandir ~ y resolver ruta absoluta
                 save_path_obj.mkdir(parents=True, exist_ok=True) # Crear el directorio si no existe
-                # self._saved_content_dir = save_path_obj # Almacenar la ruta si fuera necesario
+                content_store = ContentStore(save_path_obj, compression=compress)
                 print(f"Guardando contenido completo de archivos en disco en: {save_path_obj}")
+                if content_store.compression: print(f"Compresión de contenido: {content_store.compression}")
                 # Si se pide guardar en disco, read_content y read_full_content se fuerzan a True
                 read_content = True
                 read_full_content = True
@@ -76,65 +704,227 @@ class DirectoryTree:
             except Exception as e:
                  print(f"Error: No se pudo crear o acceder al directorio de guardado '{save_content_to_disk_dir}': {e}")
                  save_path_obj = None # No se podrá guardar
+                 content_store = None
 
         # --- ADVERTENCIA DE USO DE MEMORIA SI read_full_content es True Y NO se guarda en disco ---
         # Esta advertencia es importante para el caso donde se pide --read-full-content pero SIN --save-content-to-disk
+        elif read_full_content and memory_budget is not None:
+             try:
+                 spill_path_obj = Path(spill_dir).expanduser().resolve() if spill_dir else Path(tempfile.mkdtemp(prefix="dtree_spill_"))
+                 budget = MemoryBudget(memory_budget, ContentStore(spill_path_obj))
+                 print(f"Leyendo el contenido completo en memoria hasta {memory_budget / (1024 * 1024):.2f} MB; "
+                       f"el resto se volcará a disco en: {spill_path_obj}")
+             except Exception as e:
+                 print(f"Error: No se pudo crear el directorio de desbordamiento '{spill_dir}': {e}")
+                 return None # Sin el directorio de desbordamiento no se puede respetar el presupuesto
         elif read_full_content:
              print("!!! ADVERTENCIA !!! Leyendo el CONTENIDO COMPLETO de los archivos EN MEMORIA.")
              print("    Esto puede consumir una ENORME cantidad de memoria y colapsar el sistema en directorios grandes.")
-             print("    Considere usar la opción --save-content-to-disk <directorio> para guardar en disco.")
+             print("    Considere usar la opción --save-content-to-disk <directorio> para guardar en disco,")
+             print("    o --memory-budget <tamaño> para volcar a disco lo que exceda ese límite.")
+        elif read_content and lazy_preview and not index_content:
+             print(f"Previsualizaciones bajo demanda (hasta {content_preview_bytes} bytes por archivo, caché de "
+                   f"{preview_cache_bytes / (1024 * 1024):.0f} MB); el escaneo no lee el contenido de los archivos.")
+             read_content = False # El escáner no lee nada; PreviewCache lo hará al primer acceso
+             use_lazy_preview = True
         elif read_content:
              print(f"Leyendo previsualización del contenido de los archivos (hasta {content_preview_bytes} bytes por archivo).")
         else:
              print("No se leerá el contenido de los archivos.")
+        if index_content and not read_content:
+            print("Advertencia: --index-content requiere leer contenido; se omitirá el índice de contenido.")
+            index_content = False
+        elif index_content:
+            print("Indexando el contenido leído (trigramas) para búsquedas content=.")
+        return _ContentPlan(read_content, read_full_content, index_content, save_path_obj, content_store, budget, use_lazy_preview)
 
 
+    def _write_checkpoint(self, filename: str, frontier: list[FileSystemNode], scan_options: dict, budget: MemoryBudget | None,
+                          checkpoint_interval: float):
+        """
+        Guarda el progreso de un escaneo: un snapshot de los nodos creados hasta ahora con la pila de
+        directorios pendientes (por ID) y las opciones del escaneo en su bloque META. Si hay índice
+        de contenido y el contenido se guarda en disco, el índice se guarda también junto a él (y se
+        borra el que guardó el checkpoint anterior, al que ya no apunta ningún snapshot).
+        """
         try:
-            # Usar la función de escaneo, pasando todos los parámetros
-            self.root = scan_directory(
-                start_path_obj,
-                max_depth=depth,
-                read_content=read_content,
-                read_full_content=read_full_content,
-                save_full_content_to_disk_path=save_path_obj, # <-- Pasar la ruta de guardado (Path obj o None)
-                content_preview_bytes=content_preview_bytes,
-                on_node_created=self._assign_id_and_index
-            )
-
-            if self.root:
-                print("Escaneo completado.")
-                print(f"Total de nodos escaneados: {len(self.node_index)}")
-            else:
-                print(f"Error: No se pudo escanear la ruta '{path}'.")
+            meta = self._snapshot_meta()
+            meta['scan_checkpoint'] = {
+                'frontier': [node.node_id for node in frontier],
+                'options': dict(scan_options, memory_used=budget.used_bytes if budget is not None else 0, checkpoint_interval=checkpoint_interval),
+            }
+            # En un escaneo nuevo self.root se asigna al terminar; la raíz es el primer nodo creado (ID 0)
+            root = self.root if self.root is not None else self.node_index[0]
+            count = write_snapshot(filename, root, self.node_index, meta=meta)
+            previous_index_id, self._checkpoint_index_id = self._checkpoint_index_id, meta['content_index_id']
+            if previous_index_id is not None and previous_index_id != meta['content_index_id']:
+                index_path(self._saved_content_dir, previous_index_id).unlink(missing_ok=True)
+            if frontier: print(f"Checkpoint guardado en '{filename}': {count} nodos, {len(frontier)} directorios pendientes.")
+        except (IOError, OSError) as e:
+            print(f"Advertencia: No se pudo guardar el checkpoint '{filename}': {e}")
 
-            return self.root
 
-        except Exception as e:
-            print(f"Ocurrió un error inesperado durante el escaneo: {e}")
+    def _load_checkpoint(self, filename: str) -> tuple[dict, list[FileSystemNode]] | None:
+        """Carga el árbol parcial de un checkpoint y devuelve (opciones del escaneo, directorios pendientes)."""
+        try:
+            state = SnapshotReader(filename).meta.get('scan_checkpoint')
+        except (IOError, ValueError) as e:
+            print(f"Error al leer el checkpoint '{filename}': {e}") ; return None
+        if state is None:
+            print(f"Error: '{filename}' es un snapshot, pero no un checkpoint de escaneo (j-scan --checkpoint).") ; return None
+        if self._load_snapshot(filename, resuming=True) is None:
             return None
+        return state['options'], [self.node_index[node_id] for node_id in state['frontier']]
 
 
-    def print_tree(self, depth: int = -1, show_metadata: bool = True):
-        # ... (igual) ...
-        if not self.root: print("Árbol vacío. Escanee un directorio primero.") ; return
+    def _report_content_store(self, content_store: ContentStore | None):
+        if content_store is None:
+            return
+        print(f"Contenido guardado: {content_store.blobs_written} blobs nuevos "
+              f"({content_store.bytes_written / (1024 * 1024):.2f} MB escritos), "
+              f"{content_store.duplicates} archivos reutilizaron un blob existente.")
+
+
+    def _finish_preview_cache(self, use_lazy_preview: bool, preview_bytes: int, cache_bytes: int, prefetch: bool):
+        """Prepara la caché de previsualizaciones bajo demanda (o la descarta) y lanza la precarga si se pidió."""
+        if not use_lazy_preview:
+            self._preview_cache = None
+            return
+        if self._preview_cache is None or self._preview_cache.preview_bytes != preview_bytes:
+            self._preview_cache = PreviewCache(preview_bytes, cache_bytes)
+        self._preview_cache.budget_bytes = cache_bytes # Un re-escaneo incremental conserva las entradas válidas
+        if prefetch:
+            self._preview_cache.prefetch(list(self.node_index.values()))
+            print("Precargando previsualizaciones en segundo plano.")
+
+
+    def _report_memory_budget(self, budget: MemoryBudget | None):
+        self._spill_dir = budget.spill_store.root if budget is not None else None
+        if budget is None:
+            return
+        print(f"Contenido completo en memoria: {budget.used_bytes / (1024 * 1024):.2f} MB; "
+              f"{budget.spilled_files} archivos volcados a disco en {budget.spill_store.root}.")
+
+
+    def print_tree(self, depth: int = -1, show_metadata: bool = True) -> bool:
+        # Las líneas se generan y escriben en bloques, sin construir la salida completa en memoria
+        if not self.root: print("Árbol vacío. Escanee un directorio primero.") ; return False
         print("\n--- Estructura del Directorio ---")
         print(f"Mostrando hasta profundidad: {'Ilimitada' if depth < 0 else depth}")
-        tree_lines = build_tree_string(self.root, max_depth=depth, show_metadata=show_metadata)
-        for line in tree_lines: print(line)
+        write_tree(self.root, sys.stdout, max_depth=depth, show_metadata=show_metadata,
+                   subtree_stats=self.get_subtree_stats() if show_metadata else None)
         print("--- Fin de la estructura ---")
+        return True
 
 
-    def save_tree_printout(self, filename: str, depth: int = -1, show_metadata: bool = True):
-        # ... (igual) ...
-        if not self.root: print("Árbol vacío. Escanee un directorio primero.") ; return
+    def save_tree_printout(self, filename: str, depth: int = -1, show_metadata: bool = True) -> bool:
+        # Escritura en streaming con un búfer grande: válido para salidas de cientos de MB
+        if not self.root: print("Árbol vacío. Escanee un directorio primero.") ; return False
         print(f"Generando representación del árbol para guardar en '{filename}'...")
         print(f"Guardando hasta profundidad: {'Ilimitada' if depth < 0 else depth}")
         try:
-            tree_lines = build_tree_string(self.root, max_depth=depth, show_metadata=show_metadata)
-            with open(filename, 'w', encoding='utf-8') as f: f.write('\n'.join(tree_lines))
-            print(f"Representación del árbol guardada exitosamente en '{filename}'.")
+            with open(filename, 'w', encoding='utf-8', buffering=1024 * 1024) as f:
+                line_count = write_tree(self.root, f, max_depth=depth, show_metadata=show_metadata,
+                                        subtree_stats=self.get_subtree_stats() if show_metadata else None)
+            print(f"Representación del árbol guardada exitosamente en '{filename}' ({line_count} líneas).")
+            return True
         except IOError as e: print(f"Error al guardar el archivo '{filename}': {e}")
         except Exception as e: print(f"Ocurrió un error inesperado al guardar: {e}")
+        return False
+
+
+    def save_snapshot(self, filename: str) -> bool:
+        """
+        Guarda el árbol completo (IDs, enlaces padre/hijo, nombres, metadatos y contenido)
+        en un snapshot binario que puede recargarse con load_snapshot sin volver a escanear.
+        """
+        if not self.root: print("Árbol vacío. Escanee un directorio primero.") ; return False
+        print(f"Guardando snapshot del árbol en '{filename}'...")
+        try:
+            count = write_snapshot(filename, self.root, self.node_index, meta=self._snapshot_meta())
+            print(f"Snapshot guardado exitosamente ({count} nodos).")
+            return True
+        except IOError as e: print(f"Error al guardar el snapshot '{filename}': {e}")
+        except Exception as e: print(f"Ocurrió un error inesperado al guardar el snapshot: {e}")
+        return False
+
+
+    def _snapshot_meta(self) -> dict:
+        """
+        Estado del árbol (además de los nodos) que se guarda en el bloque META de un snapshot.
+        Si el índice de contenido cambió desde que se guardó (p. ej. por watch), se guarda antes
+        para que el index_id registrado corresponda a este árbol.
+        """
+        content_index_id = None
+        if self._content_index is not None and self._saved_content_dir is not None:
+            if self._content_index.needs_save:
+                self._content_index.save(self._saved_content_dir)
+            content_index_id = self._content_index.index_id
+        return {
+            'next_node_id': self._next_node_id,
+            'saved_content_dir': str(self._saved_content_dir) if self._saved_content_dir else None,
+            'content_index_id': content_index_id,
+            'spill_dir': str(self._spill_dir) if self._spill_dir else None,
+            'lazy_preview_bytes': self._preview_cache.preview_bytes if self._preview_cache else None,
+            'scan_options': self._scan_options,
+        }
+
+
+    def load_snapshot(self, filename: str) -> FileSystemNode | None:
+        """
+        Carga un snapshot creado con save_snapshot, reemplazando el árbol actual.
+        El archivo se mapea en memoria y los nodos se materializan de forma perezosa,
+        a medida que se accede a ellos (por ID o recorriendo hijos).
+        Rechaza el checkpoint de un escaneo interrumpido: sus directorios pendientes aparecerían
+        vacíos (ese archivo se termina con j-scan --resume).
+        """
+        return self._load_snapshot(filename)
+
+
+    def _load_snapshot(self, filename: str, resuming: bool = False) -> FileSystemNode | None:
+        """load_snapshot; con resuming (desde _load_checkpoint) acepta también un checkpoint incompleto."""
+        print(f"Cargando snapshot desde '{filename}'...")
+        try:
+            reader = SnapshotReader(filename)
+            pending = len(reader.meta.get('scan_checkpoint', {}).get('frontier', []))
+            if pending and not resuming:
+                print(f"Error: '{filename}' es un checkpoint incompleto ({pending} directorios pendientes); "
+                      f"use j-scan --resume '{filename}' para terminar el escaneo.")
+                return None
+            root_position = reader.find(reader.meta.get('root_id', 0))
+            if root_position < 0:
+                print(f"Error: El snapshot '{filename}' no contiene el nodo raíz.")
+                return None
+            self.root = reader.node(root_position)
+            self.node_index = SnapshotNodeIndex(reader)
+            self._reset_secondary_indexes(lazy=True)
+            self._next_node_id = reader.meta.get('next_node_id', reader.count)
+            saved_content_dir = reader.meta.get('saved_content_dir')
+            self._saved_content_dir = Path(saved_content_dir) if saved_content_dir else None
+            spill_dir = reader.meta.get('spill_dir')
+            self._spill_dir = Path(spill_dir) if spill_dir else None
+            lazy_preview_bytes = reader.meta.get('lazy_preview_bytes')
+            if self._preview_cache is not None: self._preview_cache.stop_prefetch()
+            self._preview_cache = PreviewCache(lazy_preview_bytes) if lazy_preview_bytes else None
+            self._scan_options = reader.meta.get('scan_options')
+            # El índice de contenido persistido junto al contenido guardado sigue siendo válido si es
+            # el mismo que registró el snapshot (otro escaneo en el mismo directorio guarda el suyo aparte)
+            content_index_id = reader.meta.get('content_index_id')
+            self._content_index = None
+            if self._saved_content_dir and content_index_id:
+                self._content_index = ContentIndex.load(self._saved_content_dir, content_index_id)
+                if self._content_index is None:
+                    print("Advertencia: No se encontró el índice de contenido de este snapshot; search content= recorrerá el árbol.")
+            print("Snapshot cargado.")
+            if self._content_index is not None:
+                print(f"Índice de contenido cargado desde: {self._saved_content_dir}")
+            print(f"Total de nodos en el snapshot: {reader.count}")
+            return self.root
+        except (IOError, ValueError) as e:
+            print(f"Error al cargar el snapshot '{filename}': {e}")
+        except Exception as e:
+            print(f"Ocurrió un error inesperado al cargar el snapshot: {e}")
+        return None
 
 
     def get_node_by_id(self, node_id: int) -> FileSystemNode | None:
@@ -142,17 +932,29 @@ class DirectoryTree:
          return self.node_index.get(node_id)
 
 
-    def display_node_details(self, node_id: int):
+    def display_node_details(
+        self,
+        node_id: int,
+        offset: int | None = None, # Byte inicial de la ventana de contenido
+        length: int | None = None, # Bytes de la ventana de contenido
+        head: int | None = None, # Mostrar las primeras N líneas
+        tail: int | None = None # Mostrar las últimas N líneas
+    ) -> bool:
         """
-        Muestra la información detallada de un nodo específico.
-        Si el contenido completo fue guardado en disco, lo lee desde allí.
+        Muestra la información detallada de un nodo específico. Devuelve False si el nodo no
+        existe o no se pudo leer la ventana de contenido pedida.
+        Si el contenido completo fue guardado en disco, muestra una ventana de él (por defecto
+        los primeros DEFAULT_PAGE_BYTES bytes) leída de forma perezosa con mmap, de modo que
+        solo se tocan las páginas mostradas. Con offset/length, head o tail se elige la ventana;
+        si no hay contenido guardado, esas opciones se aplican al archivo original.
         De lo contrario, muestra la previsualización o marcador en memoria.
         """
         node = self.get_node_by_id(node_id)
         if not node:
             print(f"Error: No se encontró ningún nodo con ID {node_id}.")
-            return
+            return False
 
+        content_ok = True
         print(f"\n--- Detalles del Nodo [ID: {node.node_id}] ---")
         print(f"  Nombre: {node.name}")
         print(f"  Ruta: {node.path}")
@@ -160,135 +962,329 @@ class DirectoryTree:
         print(f"  Nivel en el árbol: {node.get_level()}")
 
         # Mostrar Metadatos
-        print("  Metadatos:")
         metadata = node.metadata
-        try: mod_time = datetime.datetime.fromtimestamp(metadata.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
-        except Exception: mod_time = "Fecha de modificación desconocida"
-        try: creation_time = datetime.datetime.fromtimestamp(metadata.st_ctime).strftime('%Y-%m-%d %H:%M:%S')
-        except Exception: creation_time = "Fecha de creación/cambio desconocida"
-        print(f"    Tamaño: {metadata.st_size} bytes")
-        print(f"    Modificado: {mod_time}")
-        print(f"    Creado/Cambiado: {creation_time}")
-        print(f"    Permisos (modo): {stat.filemode(metadata.st_mode)}")
+        if metadata is None:
+            print("  Metadatos: No disponibles (escaneo en modo --names-only).")
+        else:
+            print("  Metadatos:")
+            try: mod_time = datetime.datetime.fromtimestamp(metadata.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
+            except Exception: mod_time = "Fecha de modificación desconocida"
+            try: creation_time = datetime.datetime.fromtimestamp(metadata.st_ctime).strftime('%Y-%m-%d %H:%M:%S')
+            except Exception: creation_time = "Fecha de creación/cambio desconocida"
+            print(f"    Tamaño: {metadata.st_size} bytes")
+            print(f"    Modificado: {mod_time}")
+            print(f"    Creado/Cambiado: {creation_time}")
+            print(f"    Permisos (modo): {stat.filemode(metadata.st_mode)}")
 
         # --- LOGICA DE MOSTRAR CONTENIDO (desde disco o memoria) ---
         if not node.is_directory:
              print("  Contenido:")
+             view_requested = offset is not None or length is not None or head is not None or tail is not None
+             node_content = node.content
+             if node_content is None and self._preview_cache is not None and not node.saved_content_path:
+                  node_content = self._preview_cache.get(node) # Previsualización bajo demanda (caché LRU)
              if node.saved_content_path:
-                  # Si la ruta de guardado existe, intentar leer desde allí
+                  # Si la ruta de guardado existe, mostrar una ventana leída desde allí
                   print(f"    (Contenido guardado en disco: {node.saved_content_path})")
-                  try:
-                      saved_file_path = Path(node.saved_content_path)
-                      if saved_file_path.exists():
-                           print("    --------------------")
-                           # Leer y intentar decodificar el contenido guardado
-                           with open(saved_file_path, 'rb') as f:
-                               content_bytes = f.read()
-                           try:
-                               print(content_bytes.decode('utf-8', errors='replace')) # Usar 'replace' para manejar errores de decodificación
-                           except Exception:
-                               print(f"<No se pudo decodificar el contenido (binario?), {len(content_bytes)} bytes>")
-                           print("    --------------------")
-                      else:
-                           print(f"    <Error: Archivo de contenido guardado no encontrado en {node.saved_content_path}>")
-                  except Exception as e:
-                       print(f"    <Error leyendo contenido guardado desde disco: {e}>")
-
-             elif node.content is not None:
+                  content_ok = self._print_content_window(node, node.saved_content_path, is_compressed_blob(node.saved_content_path), offset, length, head, tail)
+
+             elif view_requested:
+                  # Sin contenido guardado: mapear el archivo original (puede haber cambiado desde el escaneo)
+                  print(f"    (Archivo original: {node.path})")
+                  content_ok = self._print_content_window(node, node.path, False, offset, length, head, tail)
+
+             elif node_content is not None:
                   # Si no se guardó en disco, mostrar lo que está en memoria (previsualización o full)
                   print("    (Contenido en memoria):")
-                  if isinstance(node.content, str) and (node.content.startswith('<Binary content') or node.content.startswith('<Error')):
-                       print(f"    {node.content}")
+                  if isinstance(node_content, str) and (node_content.startswith('<Binary content') or node_content.startswith('<Error')):
+                       print(f"    {node_content}")
                   else: # Contenido de texto (posiblemente truncado)
                        print("    --------------------")
-                       print(node.content)
+                       print(node_content)
                        print("    --------------------")
-                       if node.metadata.st_size > 0 and node.content == "":
+                       if node.metadata.st_size > 0 and node_content == "":
                             print("    (Archivo vacío o no se pudo leer el contenido)")
                        # Verificar si el contenido en memoria está truncado (solo relevante si NO es full content)
                        # Esto es complejo de verificar con precisión solo por el string content.
                        # Asumimos que si no se usó --read-full-content y no hay ellipsis, puede estar truncado.
-                       elif node.metadata.st_size > len(str(node.content).encode('utf-8')) and not (isinstance(node.content, str) and node.content.endswith("...")) and not isinstance(node.content, bytes):
+                       elif node.metadata.st_size > len(str(node_content).encode('utf-8')) and not (isinstance(node_content, str) and node_content.endswith("...")) and not isinstance(node_content, bytes):
                             print("    (Contenido en memoria probablemente truncado - use --read-full-content o --save-content-to-disk para leer completo)")
 
 
-             else: # node.content is None
+             else: # node_content is None
                  print("  Contenido: No se leyó el contenido para este archivo (opción read_content/read_full_content/save-content-to-disk fue False).")
 
         elif node.is_directory:
-             print(f"  Contenido: Este es un directorio con {len(node.get_children())} {'hijo' if len(node.get_children()) == 1 else 'hijos'}.")
+             child_count = len(node.children)
+             print(f"  Contenido: Este es un directorio con {child_count} {'hijo' if child_count == 1 else 'hijos'}.")
+             stats = self.get_subtree_stats().get(node.node_id)
+             if stats is not None:
+                  try: last_change = datetime.datetime.fromtimestamp(stats.max_mtime).strftime('%Y-%m-%d %H:%M:%S')
+                  except Exception: last_change = "Fecha desconocida"
+                  size_info = f"{format_size(stats.total_size)} en " if stats.total_size is not None else "" # Sin tamaño en --names-only
+                  print(f"  Subárbol: {size_info}{stats.file_count} {'archivo' if stats.file_count == 1 else 'archivos'}, "
+                        f"última modificación: {last_change}")
 
         print("---------------------------")
+        return content_ok
 
 
-    def search_nodes(self, **criteria) -> list[FileSystemNode]:
-        # ... (igual) ...
-        if not self.root: print("Árbol vacío. Escanee un directorio primero.") ; return []
-        print(f"Buscando nodos con criterios: {criteria}")
+    def _print_content_window(self, node: FileSystemNode, source_path: str, compressed: bool,
+                              offset: int | None, length: int | None, head: int | None, tail: int | None) -> bool:
+        """Imprime la ventana pedida (bytes offset/length, primeras o últimas líneas) del contenido en source_path. False si no pudo leerse."""
+        total_size = node.metadata.st_size if node.metadata is not None else None
+        truncated = False
+        try:
+            if head is not None:
+                window, truncated = read_head_lines(source_path, head, compressed)
+                description = f"primeras {head} líneas"
+            elif tail is not None:
+                window, truncated = read_tail_lines(source_path, tail, compressed)
+                description = f"últimas {tail} líneas"
+            else:
+                start = max(0, offset or 0)
+                window = read_range(source_path, start, length if length is not None else DEFAULT_PAGE_BYTES, compressed)
+                description = f"bytes {start}-{start + len(window) - 1}" if window else f"sin datos a partir del byte {start}"
+        except FileNotFoundError:
+            print(f"    <Error: Archivo de contenido no encontrado en {source_path}>")
+            return False
+        except Exception as e:
+            print(f"    <Error leyendo contenido desde disco: {e}>")
+            return False
+
+        print(f"    ({description}{f' de {total_size} bytes' if total_size is not None else ''})")
+        print("    --------------------")
+        print(window.decode('utf-8', errors='replace')) # Usar 'replace' para manejar errores de decodificación
+        print("    --------------------")
+        if truncated:
+            print(f"    (Líneas recortadas a {MAX_LINES_BYTES // 1024} KB: use --offset/--length para ver el resto)")
+        if head is None and tail is None and total_size is not None and (offset or 0) + len(window) < total_size:
+            print("    (Hay más contenido: use --offset/--length, --head N o --tail N para ver otra parte)")
+        return True
+
+
+    def _is_spilled(self, node: FileSystemNode) -> bool:
+        """True si el contenido completo del nodo se volcó a disco por exceder --memory-budget."""
+        return (self._spill_dir is not None and node.saved_content_path is not None
+                and Path(node.saved_content_path).is_relative_to(self._spill_dir))
+
+
+    def search_nodes(self, query: Query | str | list[str] | None = None, **criteria) -> list[FileSystemNode] | None:
+        """
+        Busca los nodos que cumplen una consulta y los devuelve (en orden de ID si la búsqueda
+        partió de un índice, o en pre-orden si recorrió el árbol).
+
+        La consulta es una Query ya compilada, o un texto o lista de criterios key=value combinables con AND, OR, NOT y
+        paréntesis, más limit=N (ver query.py): search_nodes("( name=*.log OR name=*.txt ) min_size=1MB").
+        También se admiten los criterios como argumentos con nombre, unidos con AND:
+        search_nodes(name='*.py', content='import').
+
+        La consulta se compila una vez: cada AND evalúa primero los predicados baratos y selectivos
+        y se corta en el primero que falla. Si la expresión tiene candidatos en algún índice (nombre,
+        nivel, rangos de tamaño o fecha, contenido), solo se verifican esos nodos; si no, se recorre
+        el árbol. Con limit, la búsqueda se detiene al reunir limit resultados.
+        Devuelve None si el árbol está vacío o la consulta no es válida.
+        """
+        if not self.root: print("Árbol vacío. Escanee un directorio primero.") ; return None
+        try:
+            if isinstance(query, Query):
+                compiled = query
+            elif query is not None:
+                compiled = parse_query(shlex.split(query) if isinstance(query, str) else list(query))
+            else:
+                compiled = query_from_criteria(criteria)
+        except (QueryError, ValueError) as e:
+            print(f"Error en la consulta: {e}") ; return None
+        print(f"Buscando nodos con criterios: {compiled}")
+
+        lookup = self._index_lookup()
+        # order_predicates devuelve una copia: los criterios content= se enlazan con este árbol en ella
+        expression = order_predicates(compiled.expression, len(self.node_index), lookup)
+        for predicate in predicates_of(expression):
+            if isinstance(predicate, ContentPredicate):
+                self._bind_content_predicate(predicate, lookup)
+        test, limit = expression.test, compiled.limit
 
         matching_nodes = []
+        candidates = candidate_ids(expression, lookup)
+        if candidates is not None and candidates[0] < len(self.node_index):
+            # Partir de los candidatos del índice más pequeño y verificar sobre ellos la expresión completa
+            for node_id in sorted(candidates[1]()):
+                node = self.node_index.get(node_id)
+                if node is not None and test(node):
+                    matching_nodes.append(node)
+                    if limit is not None and len(matching_nodes) >= limit: break
+        else:
+            stack = [self.root]
+            while stack:
+                node = stack.pop()
+                if test(node):
+                    matching_nodes.append(node)
+                    if limit is not None and len(matching_nodes) >= limit: break
+                if node.is_directory:
+                    stack.extend(reversed(node.get_children()))
+        limit_note = " (límite alcanzado)" if limit is not None and len(matching_nodes) >= limit else ""
+        print(f"Encontrados {len(matching_nodes)} nodos que coinciden{limit_note}.")
+        return matching_nodes
 
-        def parse_size(size_str):
-            # ... (igual) ...
-            if isinstance(size_str, (int, float)): return size_str
-            size_str = str(size_str).strip().upper()
-            if size_str.endswith("KB"): return float(size_str[:-2]) * 1024
-            if size_str.endswith("MB"): return float(size_str[:-2]) * 1024 * 1024
-            if size_str.endswith("GB"): return float(size_str[:-2]) * 1024 * 1024 * 1024
-            try: return float(size_str)
-            except ValueError: return -1
-
-        min_size = parse_size(criteria.get('min_size', -1))
-        max_size = parse_size(criteria.get('max_size', float('inf')))
-        target_level = criteria.get('level', None)
-
-        name_pattern = criteria.get('name', None)
-        name_regex = None
-        if name_pattern:
-            try:
-                if '*' in name_pattern or '?' in name_pattern: name_regex = re.compile(re.escape(name_pattern).replace(r'\*', '.*').replace(r'\?', '.'))
-                else: name_regex = re.compile(re.escape(name_pattern) + r'$')
-            except re.error as e: print(f"Error en el patrón de nombre (regex): {e}") ; name_regex = None
 
-        content_text = criteria.get('content', None)
-        content_regex = None
-        if content_text:
-             try: content_regex = re.compile(re.escape(content_text), re.IGNORECASE)
-             except re.error as e: print(f"Error en el patrón de contenido (regex): {e}") ; content_regex = None
+    def _bind_content_predicate(self, predicate: ContentPredicate, lookup: IndexLookup):
+        """
+        Conecta un criterio content= con el contenido del árbol.
+
+        Sin índice de contenido, la búsqueda por contenido solo mira el atributo `node.content`
+        (previsualización o contenido completo en memoria): leer del disco cada archivo guardado
+        con saved_content_path sería demasiado lento. Con índice (j-scan --index-content), solo
+        se verifican los candidatos cuyos trigramas incluyen los de la consulta, y para ellos
+        sí se lee (por bloques) el contenido completo guardado en disco. El contenido volcado por
+        --memory-budget se considera contenido en memoria y se lee siempre, igual que las
+        previsualizaciones bajo demanda (--lazy-preview), que se leen al primer acceso.
+        """
+        option = lookup(predicate)
+        content_ids = option[1]() if option is not None else None
+        content_regex, overlap = predicate.regex, len(predicate.text) - 1
+
+        def _content_matches(node: FileSystemNode) -> bool:
+            if content_ids is not None and node.node_id not in content_ids: return False
+            node_content = node.content
+            if node_content is None and self._preview_cache is not None and not node.saved_content_path:
+                node_content = self._preview_cache.get(node) # Previsualización bajo demanda (caché LRU)
+            if isinstance(node_content, str) and not node_content.startswith('<'):
+                return bool(content_regex.search(node_content))
+            if node.saved_content_path and (content_ids is not None or self._is_spilled(node)):
+                try: return file_contains(node.saved_content_path, content_regex, overlap)
+                except OSError: return False
+            return False
+
+        predicate.matcher = _content_matches
+
 
-        # Note: Search by content will only work if content was read (preview or full)
-        # It will NOT automatically read content from disk if saved_content_path is set
-        # Implementing search by content from disk would require significant modifications
-        # to potentially read many files from disk during search, which can be slow.
-        # For now, search by content operates only on the `node.content` attribute.
+    def _index_lookup(self) -> IndexLookup:
+        """
+        Para cada criterio con índice, (nº de candidatos, función que devuelve sus IDs). Los conteos
+        se calculan una vez por consulta; los rangos se cuentan con búsqueda binaria (O(log n)) y solo
+        se materializan si se eligen como punto de partida. La caché usa el valor del criterio (no el
+        objeto), que es el mismo en la expresión original y en la copia ordenada.
+        """
+        cache: dict[object, tuple[int, Callable[[], set[int]]] | None] = {}
 
+        def _lookup(predicate: Predicate):
+            if isinstance(predicate, (SizePredicate, TimePredicate)): key = (type(predicate), predicate.low, predicate.high)
+            else: key = str(predicate)
+            if key not in cache:
+                cache[key] = self._predicate_candidates(predicate)
+            return cache[key]
 
-        def _search_recursive(node: FileSystemNode):
-            matches = True
+        return _lookup
 
-            if name_regex and not name_regex.search(node.name): matches = False
-            node_type_crit = criteria.get('type', None)
-            if node_type_crit:
-                if node_type_crit.lower() == 'file' and node.is_directory: matches = False
-                elif node_type_crit.lower() == 'dir' and not node.is_directory: matches = False
 
-            if not node.is_directory:
-                if node.metadata.st_size < min_size or node.metadata.st_size > max_size: matches = False
-            elif 'min_size' in criteria or 'max_size' in criteria: matches = False
+    def _predicate_candidates(self, predicate: Predicate) -> tuple[int, Callable[[], set[int]]] | None:
+        if isinstance(predicate, LevelPredicate):
+            ids = {node.node_id for node in self.get_nodes_at_level(predicate.level)}
+        elif isinstance(predicate, NamePredicate):
+            ids = self._get_name_index().matching_ids(predicate.pattern, predicate.regex)
+        elif isinstance(predicate, ContentPredicate) and self._content_index is not None:
+            ids = self._content_index.candidate_ids(predicate.text)
+        elif isinstance(predicate, (SizePredicate, TimePredicate)):
+            range_index = self._get_size_index() if isinstance(predicate, SizePredicate) else self._get_mtime_index()
+            low, high = predicate.low, predicate.high
+            return range_index.count_range(low, high), lambda: set(range_index.ids_in_range(low, high))
+        else:
+            return None
+        return len(ids), lambda: ids
 
-            if target_level is not None and node.get_level() != target_level: matches = False
 
-            # Criterio: Contenido (solo para archivos que tienen content en memoria, NO desde saved_content_path)
-            if not node.is_directory and content_regex:
-                 if not isinstance(node.content, str) or node.content.startswith('<'): matches = False
-                 elif not content_regex.search(node.content): matches = False
-            elif node.is_directory and content_regex: matches = False
+    def find_duplicates(self, workers: int = 4, use_processes: bool = False, min_size: int = 1) -> list[list[int]] | None:
+        """
+        Busca archivos duplicados del árbol (agrupando por tamaño, hash del principio y hash
+        completo; ver find_duplicate_groups) e imprime cada grupo con sus IDs y rutas.
 
+        Returns:
+            list[list[int]] | None: Grupos de IDs de nodos con contenido idéntico, o None si el árbol está vacío.
+        """
+        if not self.root: print("Árbol vacío. Escanee un directorio primero.") ; return None
+        print(f"Buscando archivos duplicados (tamaño mínimo {min_size} bytes, {workers} {'procesos' if use_processes else 'hilos'})...")
+        groups, counters = find_duplicate_groups(self.node_index.values(), workers=workers, use_processes=use_processes, min_size=min_size)
+        if counters['files'] == 0:
+            print("No hay archivos con metadatos para comparar (¿escaneo en modo --names-only?).")
+            return []
+        print(f"Archivos considerados: {counters['files']}; hash del principio: {counters['head_hashed']}; "
+              f"hash completo: {counters['full_hashed']} (reutilizados del almacén de contenido: {counters['store_reused']}).")
+        if counters['aliases']:
+            print(f"Omitidas {counters['aliases']} rutas que apuntan a un archivo ya considerado (enlaces duros o directorios enlazados).")
 
-            if matches: matching_nodes.append(node)
-            if node.is_directory:
-                for child in node.get_children(): _search_recursive(child)
+        wasted_bytes = 0
+        for number, (size, node_ids) in enumerate(groups, start=1):
+            wasted_bytes += size * (len(node_ids) - 1)
+            print(f"Grupo {number}: {len(node_ids)} archivos de {size / 1024:.2f} KB -> IDs {node_ids}")
+            for node_id in node_ids:
+                print(f"    [{node_id}] {self.node_index[node_id].path}")
+        print(f"Encontrados {len(groups)} grupos de duplicados ({wasted_bytes / (1024 * 1024):.2f} MB recuperables).")
+        return [node_ids for _, node_ids in groups]
 
-        _search_recursive(self.root)
-        print(f"Encontrados {len(matching_nodes)} nodos que coinciden.")
-        return matching_nodes
\ No newline at end of file
+
+    def top_subtrees(self, count: int = 10) -> list[FileSystemNode] | None:
+        """
+        Imprime y devuelve los count directorios (sin contar la raíz) con mayor tamaño acumulado
+        (None si el árbol está vacío; una lista vacía si no se conocen los tamaños, --names-only).
+        Se eligen con un heap de tamaño count sobre los totales de get_subtree_stats, en
+        O(n log count), sin ordenar todos los directorios.
+        """
+        if not self.root: print("Árbol vacío. Escanee un directorio primero.") ; return None
+        stats = self.get_subtree_stats()
+        if stats[self.root.node_id].total_size is None:
+            print("No hay tamaños de archivo para comparar (¿escaneo en modo --names-only?).")
+            return []
+        largest = heapq.nlargest(
+            count,
+            (node_id for node_id in stats if node_id != self.root.node_id),
+            key=lambda node_id: (stats[node_id].total_size, -node_id) # A igual tamaño, primero el de menor ID
+        )
+        root_stats = stats[self.root.node_id]
+        print(f"Total del árbol: {format_size(root_stats.total_size)} en {root_stats.file_count} archivos.")
+        print(f"Los {len(largest)} subárboles más grandes:")
+        for position, node_id in enumerate(largest, start=1):
+            node_stats = stats[node_id]
+            print(f"  {position:>3}. [{node_id}] {format_size(node_stats.total_size):>10}  {node_stats.file_count:>7} archivos  {self.node_index[node_id].path}")
+        return [self.node_index[node_id] for node_id in largest]
+
+
+    def diff(self, newer: "DirectoryTree", output_filename: str | None = None) -> dict[str, int] | None:
+        """
+        Compara este árbol (el antiguo) con newer y escribe los cambios a medida que se
+        encuentran (ver diff_trees), en la consola o en output_filename, con una línea por cambio:
+        '+' añadido, '-' eliminado, '~' modificado y '>' movido.
+
+        Returns:
+            dict[str, int] | None: Número de cambios de cada tipo, o None si un árbol está vacío o no se pudo escribir la salida.
+        """
+        counts = {'added': 0, 'removed': 0, 'modified': 0, 'moved': 0}
+        if not self.root or not newer.root: print("Árbol vacío. Escanee un directorio o cargue un snapshot primero.") ; return None
+        try:
+            stream = open(output_filename, 'w', encoding='utf-8', buffering=1024 * 1024) if output_filename else sys.stdout
+            try:
+                batch = []
+                for change in diff_trees(self.root, newer.root, self.get_subtree_stats(), newer.get_subtree_stats()):
+                    counts[change.kind] += 1
+                    suffix = "/" if (change.old_node or change.new_node).is_directory else ""
+                    if change.kind == 'added': line = f"+ {change.path}{suffix}"
+                    elif change.kind == 'removed': line = f"- {change.path}{suffix}"
+                    elif change.kind == 'moved': line = f"> {change.path}{suffix} -> {change.new_path}{suffix}"
+                    else:
+                        old_meta, new_meta = change.old_node.metadata, change.new_node.metadata
+                        line = f"~ {change.path} ({format_size(old_meta.st_size)} -> {format_size(new_meta.st_size)})"
+                    batch.append(line)
+                    if len(batch) >= 4096: # Escribir por bloques, como write_tree
+                        stream.write('\n'.join(batch) + '\n')
+                        batch.clear()
+                if batch:
+                    stream.write('\n'.join(batch) + '\n')
+            finally:
+                if output_filename: stream.close()
+        except IOError as e:
+            print(f"Error al escribir las diferencias en '{output_filename}': {e}")
+            return None
+        if output_filename: print(f"Diferencias guardadas en '{output_filename}'.")
+        print(f"Añadidos: {counts['added']}, eliminados: {counts['removed']}, "
+              f"modificados: {counts['modified']}, movidos: {counts['moved']}.")
+        return counts
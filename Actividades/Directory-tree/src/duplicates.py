@@ -0,0 +1,128 @@
+# src/duplicates.py
+
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Executor
+from typing import Iterable
+
+from .filesystem_node import FileSystemNode
+from .content_store import CHUNK_SIZE, blob_digest
+
+HEAD_BYTES = 4096 # Bytes iniciales que se hashean en la segunda etapa
+
+
+def _hash_file(path: str, limit: int | None = None) -> str | None:
+    """sha256 de los primeros limit bytes (o de todo el archivo), o None si no se puede leer."""
+    hasher = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            if limit is not None:
+                hasher.update(f.read(limit))
+            else:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    hasher.update(chunk)
+    except OSError:
+        return None
+    return hasher.hexdigest()
+
+
+def _hash_head(path: str) -> str | None:
+    return _hash_file(path, HEAD_BYTES)
+
+
+def _regroup(groups: Iterable[list[FileSystemNode]], keys: dict[int, str | None]) -> list[list[FileSystemNode]]:
+    """Parte cada grupo según la clave calculada para cada nodo; descarta grupos de un solo nodo y nodos ilegibles."""
+    result = []
+    for group in groups:
+        by_key: dict[str, list[FileSystemNode]] = {}
+        for node in group:
+            key = keys.get(node.node_id)
+            if key is not None:
+                by_key.setdefault(key, []).append(node)
+        result.extend(subgroup for subgroup in by_key.values() if len(subgroup) > 1)
+    return result
+
+
+def _hash_all(executor: Executor, function, nodes: list[FileSystemNode]) -> dict[int, str | None]:
+    paths = [node.path for node in nodes]
+    return {node.node_id: digest for node, digest in zip(nodes, executor.map(function, paths, chunksize=16))}
+
+
+def find_duplicate_groups(
+    nodes: Iterable[FileSystemNode],
+    workers: int = 4,
+    use_processes: bool = False,
+    min_size: int = 1
+) -> tuple[list[tuple[int, list[int]]], dict[str, int]]:
+    """
+    Busca archivos con contenido idéntico con un proceso por etapas, donde cada etapa solo
+    trabaja sobre los archivos que siguen empatados tras la anterior:
+
+      1. Agrupar por tamaño (metadatos ya escaneados, sin leer nada).
+      2. Hashear los primeros HEAD_BYTES de los archivos con tamaño repetido.
+      3. Hashear el contenido completo de los que además coinciden en el principio.
+         Los archivos de hasta HEAD_BYTES ya quedaron hasheados completos en la etapa 2, y
+         los que tienen un blob en el ContentStore reutilizan su sha256 sin leer el archivo.
+
+    Las etapas 2 y 3 se reparten en un pool de hilos (o de procesos con use_processes=True,
+    útil cuando el disco es rápido y el cálculo del hash es el cuello de botella).
+
+    Args:
+        nodes (Iterable[FileSystemNode]): Nodos candidatos (se ignoran directorios y nodos sin metadatos;
+            de varias rutas al mismo archivo, mismo st_dev y st_ino, solo se compara la más corta).
+        workers (int, optional): Tamaño del pool. Defaults to 4.
+        use_processes (bool, optional): Usar procesos en lugar de hilos. Defaults to False.
+        min_size (int, optional): Tamaño mínimo en bytes de los archivos a comparar. Defaults to 1 (ignora vacíos).
+
+    Returns:
+        tuple: (grupos, contadores). Cada grupo es (tamaño, IDs ordenados); los grupos se ordenan
+        por espacio desperdiciado, de mayor a menor. Los contadores indican cuántos archivos
+        llegaron a cada etapa ('files', 'head_hashed', 'full_hashed', 'store_reused') y cuántas
+        rutas se omitieron por ser otro nombre de un archivo ya considerado ('aliases').
+    """
+    # Enlaces duros y rutas a través de un directorio enlazado son el mismo archivo, no una copia:
+    # de cada (st_dev, st_ino) se queda la ruta más corta (st_ino es 0 donde el sistema no lo informa)
+    files: dict[tuple[int, int] | int, FileSystemNode] = {}
+    alias_count = 0
+    for node in nodes:
+        if node.is_directory or node.metadata is None or node.metadata.st_size < min_size:
+            continue
+        inode = getattr(node.metadata, 'st_ino', 0)
+        key = (getattr(node.metadata, 'st_dev', 0), inode) if inode else node.node_id
+        kept = files.get(key)
+        if kept is not None:
+            alias_count += 1
+            if (len(kept.path), kept.path) <= (len(node.path), node.path):
+                continue
+        files[key] = node
+    by_size: dict[int, list[FileSystemNode]] = {}
+    for node in files.values():
+        by_size.setdefault(node.metadata.st_size, []).append(node)
+    groups = [group for group in by_size.values() if len(group) > 1]
+    counters = {'files': len(files), 'aliases': alias_count, 'head_hashed': 0, 'full_hashed': 0, 'store_reused': 0}
+
+    pool_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with pool_class(max_workers=max(1, workers)) as executor:
+        # Etapa 2: principio del archivo
+        head_candidates = [node for group in groups for node in group]
+        counters['head_hashed'] = len(head_candidates)
+        groups = _regroup(groups, _hash_all(executor, _hash_head, head_candidates))
+
+        # Etapa 3: contenido completo, solo para archivos mayores que lo ya hasheado
+        full_keys: dict[int, str | None] = {}
+        to_hash = []
+        for group in groups:
+            for node in group:
+                if node.metadata.st_size <= HEAD_BYTES:
+                    full_keys[node.node_id] = 'head' # El hash del principio ya cubre todo el archivo
+                elif node.saved_content_path and (digest := blob_digest(node.saved_content_path)):
+                    full_keys[node.node_id] = digest
+                    counters['store_reused'] += 1
+                else:
+                    to_hash.append(node)
+        counters['full_hashed'] = len(to_hash)
+        full_keys.update(_hash_all(executor, _hash_file, to_hash))
+        groups = _regroup(groups, full_keys)
+
+    result = [(group[0].metadata.st_size, sorted(node.node_id for node in group)) for group in groups]
+    result.sort(key=lambda item: (-item[0] * (len(item[1]) - 1), item[1][0]))
+    return result, counters
@@ -1,15 +1,26 @@
 # src/filesystem_node.py
 
 import os
+import sys
 import stat
+import struct
 import datetime
 from pathlib import Path
+from typing import NamedTuple
 
 class FileSystemNode:
     """
     Representa un archivo o carpeta en el sistema de archivos.
     Incluye metadatos, contenido (opcional/previsualización) y referencias a hijos.
+
+    Para escaneos de millones de entradas el nodo se mantiene compacto: usa __slots__
+    (sin __dict__), guarda los metadatos como NodeMetadata en lugar del os.stat_result
+    completo, comparte los nombres repetidos (sys.intern) y no almacena la ruta de los
+    nodos enlazados a un padre: se reconstruye bajo demanda como padre.path + nombre.
     """
+    __slots__ = ('node_id', 'name', '_path', 'is_directory', 'metadata', 'content',
+                 'saved_content_path', 'children', 'parent', 'depth', '_sorted_children')
+
     def __init__(self, node_id: int, name: str, path: str, is_directory: bool, metadata: os.stat_result, content=None):
         """
         Inicializa un nodo del sistema de archivos.
@@ -19,40 +30,74 @@ class FileSystemNode:
             name (str): El nombre del archivo o carpeta.
             path (str): La ruta completa (como string) del archivo o carpeta.
             is_directory (bool): True si es una carpeta, False si es un archivo.
-            metadata (os.stat_result): Objeto stat con metadatos del archivo/carpeta.
+            metadata (os.stat_result | NodeMetadata | None): Metadatos del archivo/carpeta (se convierten a NodeMetadata), o None si se escaneó con names_only.
             content (any, optional): Contenido del archivo (bytes, string, o marcador de error/binario/preview). Defaults to None.
         """
         self.node_id = node_id
-        self.name = name
-        self.path = path
+        self.name = sys.intern(name) # Los nombres repetidos (index.js, README.md...) comparten una sola cadena
+        self._path = path # Solo se conserva mientras el nodo no tenga padre (ver add_child)
         self.is_directory = is_directory
-        self.metadata = metadata # Objeto stat con st_size, st_mtime, st_mode, etc.
+        if metadata is not None and not isinstance(metadata, NodeMetadata):
+            metadata = NodeMetadata.from_stat(metadata)
+        self.metadata = metadata # NodeMetadata con st_size, st_mtime, st_mode, etc.
         self.content = content  # Almacena la previsualización o un marcador (si no se guarda completo en disco)
         self.saved_content_path: str | None = None # <-- NUEVO ATRIBUTO: Ruta al archivo guardado en disco si se usó --save-content-to-disk
-        self.children = []
+        self.children = [] if is_directory else () # Los archivos comparten la tupla vacía en lugar de una lista propia
         self.parent = None
+        self.depth = 0 # Nivel en el árbol (0 = raíz); se fija al enlazar el nodo con add_child
+        self._sorted_children: list['FileSystemNode'] | None = None # Caché de get_children (None = hay que reordenar)
+
+    @property
+    def path(self) -> str:
+        """Ruta completa del nodo, reconstruida a partir de los nombres de sus ancestros."""
+        names = []
+        node = self
+        while node._path is None:
+            names.append(node.name)
+            node = node.parent
+        if not names:
+            return node._path
+        names.reverse()
+        return os.path.join(node._path, *names)
+
+    @path.setter
+    def path(self, value: str):
+        self._path = value
 
     def add_child(self, child_node: 'FileSystemNode'):
-        # ... (igual) ...
+         # La ruta de un hijo siempre es padre.path + nombre, así que deja de guardarse.
          if self.is_directory:
              self.children.append(child_node)
+             self._sorted_children = None # Invalidar el orden cacheado
              child_node.parent = self
+             child_node._path = None
+             child_node.depth = self.depth + 1
          else:
              pass
 
+    def remove_children(self, child_nodes: list['FileSystemNode']):
+        """Desenlaza varios hijos de este directorio en una sola pasada (usado por el re-escaneo incremental)."""
+        removed = set(child_nodes)
+        self.children = [child for child in self.children if child not in removed]
+        self._sorted_children = None
+        for child_node in removed:
+            child_node._path = child_node.path # Conservar la ruta antes de perder el padre
+            child_node.parent = None
+
     def get_children(self):
-        # ... (igual) ...
-         return sorted(self.children, key=lambda child: (not child.is_directory, child.name))
+        """
+        Devuelve los hijos ordenados (directorios primero, luego por nombre).
+        El orden se calcula una sola vez y se reutiliza hasta que cambian los hijos, por lo que
+        la lista devuelta es compartida: los llamadores no deben modificarla.
+        """
+        if self._sorted_children is None:
+            self._sorted_children = sorted(self.children, key=lambda child: (not child.is_directory, child.name))
+        return self._sorted_children
 
 
     def get_level(self):
-        # ... (igual) ...
-        level = 0
-        current = self
-        while current.parent:
-            level += 1
-            current = current.parent
-        return level
+        # Profundidad guardada al enlazar el nodo: O(1) en lugar de recorrer la cadena de padres
+        return self.depth
 
 
     def __repr__(self):
@@ -62,4 +107,49 @@ class FileSystemNode:
 
     def __str__(self):
         # ... (igual) ...
-        return f"[{self.node_id}] {self.name} ({'Dir' if self.is_directory else 'File'})"
\ No newline at end of file
+        return f"[{self.node_id}] {self.name} ({'Dir' if self.is_directory else 'File'})"
+
+
+class NodeMetadata(bytes):
+    """
+    Metadatos mínimos de un nodo (subconjunto de os.stat_result).
+    Expone los mismos nombres de atributo (st_size, st_mtime, ...) para que el resto
+    del código pueda usarlo en lugar de un os.stat_result, p. ej. al cargar un snapshot.
+
+    Los campos se empaquetan en un único objeto bytes de 44 bytes: un os.stat_result,
+    con todos sus enteros y flotantes, ocupa más de diez veces eso por nodo.
+    """
+    __slots__ = ()
+    _LAYOUT = struct.Struct('<qddIQQ') # st_size, st_mtime, st_ctime, st_mode, st_ino, st_dev
+
+    def __new__(cls, st_size: int = 0, st_mtime: float = 0, st_ctime: float = 0, st_mode: int = 0, st_ino: int = 0, st_dev: int = 0):
+        return super().__new__(cls, cls._LAYOUT.pack(st_size, st_mtime, st_ctime, st_mode, st_ino, st_dev))
+
+    @classmethod
+    def from_stat(cls, metadata) -> 'NodeMetadata':
+        """Copia los campos relevantes de un os.stat_result (o de un objeto con los mismos atributos)."""
+        return cls(
+            getattr(metadata, 'st_size', 0),
+            getattr(metadata, 'st_mtime', 0),
+            getattr(metadata, 'st_ctime', 0),
+            getattr(metadata, 'st_mode', 0),
+            getattr(metadata, 'st_ino', 0),
+            getattr(metadata, 'st_dev', 0),
+        )
+
+    st_size = property(lambda self: self._LAYOUT.unpack_from(self)[0])
+    st_mtime = property(lambda self: self._LAYOUT.unpack_from(self)[1])
+    st_ctime = property(lambda self: self._LAYOUT.unpack_from(self)[2])
+    st_mode = property(lambda self: self._LAYOUT.unpack_from(self)[3])
+    st_ino = property(lambda self: self._LAYOUT.unpack_from(self)[4])
+    st_dev = property(lambda self: self._LAYOUT.unpack_from(self)[5])
+
+    def __repr__(self):
+        return f"NodeMetadata(st_size={self.st_size}, st_mtime={self.st_mtime}, st_mode={self.st_mode:o})"
+
+
+class SubtreeStats(NamedTuple):
+    """Totales acumulados de un subárbol (calculados por DirectoryTree en un recorrido post-orden)."""
+    total_size: int | None # Suma de st_size de todos los archivos del subárbol (None si alguno no tiene metadatos)
+    file_count: int # Número de archivos del subárbol
+    max_mtime: float # st_mtime más reciente del subárbol (incluido el propio directorio)
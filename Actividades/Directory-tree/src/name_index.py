@@ -0,0 +1,113 @@
+# src/name_index.py
+
+import re
+
+
+class NameIndex:
+    """
+    Índice invertido de nombres de nodo para acelerar search name=...
+
+    Mantiene tres estructuras:
+      * nombre exacto -> IDs de los nodos con ese nombre (hash map).
+      * extensión -> nombres distintos con esa extensión (para patrones como 'name=.mp3').
+      * trigrama -> nombres distintos que lo contienen (para wildcards como '*.mp3' o 'track??').
+
+    Los mapas de extensión y trigramas trabajan sobre nombres *distintos*, no sobre nodos:
+    en un árbol real los nombres se repiten mucho, así que cada nombre candidato se
+    verifica una sola vez contra el patrón y luego se expande a todos sus IDs.
+    El índice de trigramas es el más costoso en memoria, por eso se construye la primera
+    vez que una búsqueda lo necesita y a partir de ahí se mantiene con cada alta/baja.
+    """
+
+    def __init__(self):
+        self._ids_by_name: dict[str, set[int]] = {}
+        self._names_by_extension: dict[str, set[str]] = {}
+        self._names_by_trigram: dict[str, set[str]] | None = None # Se construye bajo demanda
+
+    @staticmethod
+    def _extension(name: str) -> str | None:
+        # Texto tras el último punto ('' si termina en punto); None si el nombre no tiene punto
+        return name.rsplit('.', 1)[1] if '.' in name else None
+
+    @staticmethod
+    def _trigrams(text: str) -> set[str]:
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def add(self, node_id: int, name: str):
+        ids = self._ids_by_name.get(name)
+        if ids is None:
+            # Primer nodo con este nombre: registrarlo en los mapas por nombre distinto
+            ids = self._ids_by_name[name] = set()
+            extension = self._extension(name)
+            if extension is not None:
+                self._names_by_extension.setdefault(extension, set()).add(name)
+            if self._names_by_trigram is not None:
+                for gram in self._trigrams(name):
+                    self._names_by_trigram.setdefault(gram, set()).add(name)
+        ids.add(node_id)
+
+    def remove(self, node_id: int, name: str):
+        ids = self._ids_by_name.get(name)
+        if ids is None:
+            return
+        ids.discard(node_id)
+        if ids:
+            return
+        # Ya no quedan nodos con este nombre: quitarlo de todos los mapas
+        del self._ids_by_name[name]
+        extension = self._extension(name)
+        if extension is not None:
+            names = self._names_by_extension.get(extension)
+            if names is not None:
+                names.discard(name)
+                if not names: del self._names_by_extension[extension]
+        if self._names_by_trigram is not None:
+            for gram in self._trigrams(name):
+                names = self._names_by_trigram.get(gram)
+                if names is not None:
+                    names.discard(name)
+                    if not names: del self._names_by_trigram[gram]
+
+    def _trigram_candidates(self, segments: list[str]) -> set[str] | None:
+        """Nombres que contienen todos los trigramas de los segmentos literales, o None si no hay trigramas."""
+        grams = set()
+        for segment in segments:
+            grams |= self._trigrams(segment)
+        if not grams:
+            return None
+        if self._names_by_trigram is None:
+            self._names_by_trigram = {}
+            for name in self._ids_by_name:
+                for gram in self._trigrams(name):
+                    self._names_by_trigram.setdefault(gram, set()).add(name)
+        postings = sorted((self._names_by_trigram.get(gram, set()) for gram in grams), key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+
+    def matching_ids(self, pattern: str, name_regex: re.Pattern) -> set[int]:
+        """
+        Devuelve los IDs cuyo nombre cumple name_regex (construida a partir de pattern con la
+        misma semántica que search_nodes). Los índices solo reducen los nombres a verificar;
+        el resultado es exacto.
+        """
+        if '*' in pattern or '?' in pattern:
+            segments = [segment for segment in re.split(r'[*?]', pattern) if segment]
+            candidate_names = self._trigram_candidates(segments)
+        elif '.' in pattern:
+            # Sin wildcards el patrón coincide con el final del nombre, así que ambos comparten extensión
+            candidate_names = self._names_by_extension.get(pattern.rsplit('.', 1)[1], set())
+        else:
+            candidate_names = self._trigram_candidates([pattern])
+
+        if candidate_names is None:
+            candidate_names = self._ids_by_name.keys() # Patrón sin literales útiles: verificar cada nombre distinto una vez
+
+        matching = set()
+        for name in candidate_names:
+            if name_regex.search(name):
+                matching |= self._ids_by_name[name]
+        return matching
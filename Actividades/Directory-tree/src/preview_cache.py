@@ -0,0 +1,123 @@
+# src/preview_cache.py
+
+import os
+import stat
+import threading
+from collections import OrderedDict
+from typing import Iterable
+
+from .filesystem_node import FileSystemNode
+
+
+class PreviewCache:
+    """
+    Previsualizaciones de contenido cargadas bajo demanda (s-scan / j-scan --lazy-preview).
+
+    En lugar de leer la previsualización de cada archivo durante el escaneo, se lee la
+    primera vez que 'open' o 'search content=' la necesitan y se guarda en una caché LRU
+    limitada en bytes: al superar el presupuesto se descartan las menos usadas recientemente.
+    Cada entrada recuerda el tamaño y la fecha del archivo con que se leyó, y se vuelve a leer
+    si el nodo cambió (p. ej. tras un re-escaneo incremental).
+
+    prefetch() puede llenar la caché en segundo plano después del escaneo; es seguro usarla
+    desde ese hilo y desde el hilo principal a la vez.
+    """
+
+    def __init__(self, preview_bytes: int = 1024, budget_bytes: int = 64 * 1024 * 1024):
+        self.preview_bytes = preview_bytes
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self._entries: OrderedDict[int, tuple[str | None, int, tuple]] = OrderedDict() # ID -> (texto, bytes, versión)
+        self._lock = threading.Lock()
+        self._prefetch_thread: threading.Thread | None = None
+        self._stop_prefetch = threading.Event()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _version(node: FileSystemNode) -> tuple:
+        metadata = node.metadata
+        return (metadata.st_size, metadata.st_mtime) if metadata is not None else ()
+
+    def _read(self, node: FileSystemNode) -> tuple[str | None, int]:
+        """
+        Lee la previsualización del archivo con el mismo formato que el escaneo con --read-content.
+        Como el escaneo, no sigue enlaces simbólicos ni abre lo que no sea un archivo regular
+        (una FIFO o un dispositivo podrían bloquear la lectura): para ellos devuelve None.
+        """
+        try:
+            if not stat.S_ISREG(os.lstat(node.path).st_mode):
+                return None, 0
+            with open(node.path, 'rb') as f:
+                content_bytes = f.read(self.preview_bytes)
+        except IOError as e:
+            return f"<Error reading file: {e}>", 0
+        content = content_bytes.decode('utf-8', errors='replace')
+        # Añadir puntos suspensivos si el archivo es más grande que la previsualización
+        if node.metadata is not None and node.metadata.st_size > self.preview_bytes:
+            content += "..."
+        return content, len(content_bytes)
+
+    def _store(self, node_id: int, content: str | None, size: int, version: tuple):
+        with self._lock:
+            previous = self._entries.pop(node_id, None)
+            if previous is not None:
+                self.used_bytes -= previous[1]
+            self._entries[node_id] = (content, size, version)
+            self.used_bytes += size
+            while self.used_bytes > self.budget_bytes and len(self._entries) > 1:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False) # La menos usada recientemente
+                self.used_bytes -= evicted_size
+
+    def get(self, node: FileSystemNode) -> str | None:
+        """Previsualización del archivo del nodo (None para directorios), leyéndola del disco si no está en caché."""
+        if node.is_directory:
+            return None
+        version = self._version(node)
+        with self._lock:
+            entry = self._entries.get(node.node_id)
+            if entry is not None and entry[2] == version:
+                self._entries.move_to_end(node.node_id)
+                return entry[0]
+        content, size = self._read(node) # La lectura se hace fuera del lock
+        self._store(node.node_id, content, size, version)
+        return content
+
+    def discard(self, node_id: int):
+        with self._lock:
+            entry = self._entries.pop(node_id, None)
+            if entry is not None:
+                self.used_bytes -= entry[1]
+
+    def prefetch(self, nodes: Iterable[FileSystemNode]):
+        """
+        Carga en segundo plano las previsualizaciones de los nodos indicados, hasta llenar el
+        presupuesto (seguir más allá solo desalojaría las ya cargadas). Devuelve de inmediato.
+        """
+        self.stop_prefetch()
+        self._stop_prefetch.clear()
+
+        def _worker(file_nodes: list[FileSystemNode]):
+            for node in file_nodes:
+                if self._stop_prefetch.is_set() or self.used_bytes + self.preview_bytes > self.budget_bytes:
+                    break
+                with self._lock:
+                    cached = node.node_id in self._entries
+                if not cached:
+                    content, size = self._read(node)
+                    self._store(node.node_id, content, size, self._version(node))
+
+        file_nodes = [node for node in nodes if not node.is_directory]
+        self._prefetch_thread = threading.Thread(target=_worker, args=(file_nodes,), name="preview-prefetch", daemon=True)
+        self._prefetch_thread.start()
+
+    def prefetch_running(self) -> bool:
+        return self._prefetch_thread is not None and self._prefetch_thread.is_alive()
+
+    def stop_prefetch(self):
+        """Detiene (y espera) la precarga en segundo plano, si hay una en curso."""
+        if self._prefetch_thread is not None:
+            self._stop_prefetch.set()
+            self._prefetch_thread.join()
+            self._prefetch_thread = None
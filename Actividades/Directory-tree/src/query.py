@@ -0,0 +1,439 @@
+# src/query.py
+"""
+Consultas de search compiladas: los criterios key=value se combinan con AND, OR, NOT y
+paréntesis, y se compilan una sola vez en un árbol de predicados.
+
+    name=*.py type=file                         (criterios seguidos = AND)
+    ( name=*.log OR name=*.txt ) AND NOT level=1
+    content=TODO min_size=1KB limit=20          (limit=N: parar al encontrar N resultados)
+
+Cada AND evalúa sus predicados del más barato y selectivo al más caro, y deja de evaluar en
+el primero que falla; así, por ejemplo, el contenido (lo más caro) solo se mira en los nodos que
+ya cumplieron el resto. Los predicados que tienen índice en DirectoryTree (nombre, nivel, tamaño,
+fecha, contenido) pueden aportar la lista de candidatos en lugar de recorrer todo el árbol
+(ver candidate_ids y DirectoryTree.search_nodes).
+"""
+
+import re
+import copy
+import datetime
+from abc import ABC, abstractmethod
+from typing import Callable, Iterator, NamedTuple
+
+from .filesystem_node import FileSystemNode
+
+
+class QueryError(ValueError):
+    """Consulta mal formada (sintaxis, criterio desconocido o valor inválido)."""
+
+
+def parse_size(size_str) -> float:
+    """'512', '4KB', '1.5MB', '2GB' -> bytes."""
+    if isinstance(size_str, (int, float)): return size_str
+    size_str = str(size_str).strip().upper()
+    multipliers = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+    try:
+        for suffix, multiplier in multipliers.items():
+            if size_str.endswith(suffix): return float(size_str[:-2]) * multiplier
+        return float(size_str)
+    except ValueError:
+        raise QueryError(f"tamaño inválido: '{size_str}'")
+
+
+def parse_time(time_str) -> float:
+    """
+    Acepta un timestamp (segundos), una fecha ISO ('2024-01-31', '2024-01-31 18:30')
+    o una antigüedad relativa a ahora ('30d', '12h', '45m').
+    """
+    if isinstance(time_str, (int, float)): return float(time_str)
+    time_str = str(time_str).strip()
+    units = {'d': 86400, 'h': 3600, 'm': 60, 's': 1}
+    if time_str[-1:].lower() in units:
+        try: return datetime.datetime.now().timestamp() - float(time_str[:-1]) * units[time_str[-1].lower()]
+        except ValueError: pass
+    try: return float(time_str)
+    except ValueError: pass
+    try: return datetime.datetime.fromisoformat(time_str).timestamp()
+    except ValueError: raise QueryError(f"fecha inválida: '{time_str}'")
+
+
+# --- Predicados ---
+# cost: coste relativo de evaluar test() en un nodo. selectivity: fracción de nodos que se
+# espera que lo cumplan cuando no hay un índice que permita contarlos.
+
+class Predicate(ABC):
+    cost = 1.0
+    selectivity = 0.5
+
+    @abstractmethod
+    def test(self, node: FileSystemNode) -> bool:
+        """True si el nodo cumple el predicado."""
+
+
+class TypePredicate(Predicate):
+    cost = 1.0
+    selectivity = 0.5
+
+    def __init__(self, value: str):
+        kind = value.lower()
+        if kind not in ('file', 'dir', 'directory'):
+            raise QueryError(f"type debe ser 'file' o 'dir', no '{value}'")
+        self.want_directory = kind != 'file'
+
+    def test(self, node: FileSystemNode) -> bool:
+        return node.is_directory == self.want_directory
+
+    def __str__(self):
+        return f"type={'dir' if self.want_directory else 'file'}"
+
+
+class LevelPredicate(Predicate):
+    cost = 1.0
+    selectivity = 0.2
+
+    def __init__(self, value: str):
+        try: self.level = int(value) # Desde la consola llega como string
+        except ValueError: raise QueryError(f"nivel inválido '{value}'")
+
+    def test(self, node: FileSystemNode) -> bool:
+        return node.depth == self.level
+
+    def __str__(self):
+        return f"level={self.level}"
+
+
+class NamePredicate(Predicate):
+    cost = 3.0
+    selectivity = 0.1
+
+    def __init__(self, pattern: str):
+        # Con wildcards (* y ?) el patrón puede aparecer en cualquier parte del nombre; sin ellos, al final
+        self.pattern = pattern
+        if '*' in pattern or '?' in pattern: self.regex = re.compile(re.escape(pattern).replace(r'\*', '.*').replace(r'\?', '.'))
+        else: self.regex = re.compile(re.escape(pattern) + r'$')
+        self._search = self.regex.search
+
+    def test(self, node: FileSystemNode) -> bool:
+        return self._search(node.name) is not None
+
+    def __str__(self):
+        return f"name={self.pattern}"
+
+
+class RangePredicate(Predicate):
+    """Atributo numérico (tamaño o fecha) entre low y high, ambos incluidos."""
+    cost = 2.0
+    selectivity = 0.3
+    attribute = ''
+
+    def __init__(self, low: float = float('-inf'), high: float = float('inf')):
+        self.low, self.high = low, high
+
+    def intersect(self, other: "RangePredicate") -> "RangePredicate":
+        return type(self)(max(self.low, other.low), min(self.high, other.high))
+
+
+class SizePredicate(RangePredicate):
+    """Archivos con st_size en el rango (los directorios y los nodos sin metadatos nunca lo cumplen)."""
+    attribute = 'size'
+
+    def test(self, node: FileSystemNode) -> bool:
+        metadata = node.metadata
+        return not node.is_directory and metadata is not None and self.low <= metadata.st_size <= self.high
+
+    def __str__(self):
+        bounds = ([f"min_size={self.low:g}"] if self.low > float('-inf') else []) + ([f"max_size={self.high:g}"] if self.high < float('inf') else [])
+        return " AND ".join(bounds) or "min_size=0"
+
+
+class TimePredicate(RangePredicate):
+    """Nodos con st_mtime en el rango (los nodos sin metadatos nunca lo cumplen)."""
+    attribute = 'mtime'
+
+    def test(self, node: FileSystemNode) -> bool:
+        metadata = node.metadata
+        return metadata is not None and self.low <= metadata.st_mtime <= self.high
+
+    def __str__(self):
+        bounds = ([f"modified_after={self.low:.0f}"] if self.low > float('-inf') else []) + ([f"modified_before={self.high:.0f}"] if self.high < float('inf') else [])
+        return " AND ".join(bounds) or "modified_after=0"
+
+
+class ContentPredicate(Predicate):
+    """
+    Archivos cuyo contenido contiene text (sin distinguir mayúsculas). El test por defecto solo
+    mira node.content; DirectoryTree lo sustituye (matcher) por uno que usa el índice de contenido,
+    la caché de previsualizaciones y el contenido guardado en disco.
+    """
+    cost = 100.0
+    selectivity = 0.05
+
+    def __init__(self, text: str):
+        self.text = text
+        self.regex = re.compile(re.escape(text), re.IGNORECASE)
+        self.matcher: Callable[[FileSystemNode], bool] | None = None
+
+    def test(self, node: FileSystemNode) -> bool:
+        if node.is_directory:
+            return False
+        if self.matcher is not None:
+            return self.matcher(node)
+        return isinstance(node.content, str) and not node.content.startswith('<') and self.regex.search(node.content) is not None
+
+    def __str__(self):
+        return f"content={self.text}"
+
+
+# --- Combinadores ---
+
+class And(Predicate):
+    def __init__(self, children: list[Predicate]):
+        self.children = children
+        self.cost = sum(child.cost for child in children)
+        self.selectivity = min((child.selectivity for child in children), default=1.0)
+
+    def test(self, node: FileSystemNode) -> bool:
+        for child in self.children:
+            if not child.test(node):
+                return False
+        return True
+
+    def __str__(self):
+        return " AND ".join(f"({child})" if isinstance(child, Or) else str(child) for child in self.children)
+
+
+class Or(Predicate):
+    def __init__(self, children: list[Predicate]):
+        self.children = children
+        self.cost = sum(child.cost for child in children)
+        self.selectivity = min(1.0, sum(child.selectivity for child in children))
+
+    def test(self, node: FileSystemNode) -> bool:
+        for child in self.children:
+            if child.test(node):
+                return True
+        return False
+
+    def __str__(self):
+        return " OR ".join(str(child) for child in self.children)
+
+
+class Not(Predicate):
+    def __init__(self, child: Predicate):
+        self.child = child
+        self.cost = child.cost
+        self.selectivity = 1.0 - child.selectivity
+
+    def test(self, node: FileSystemNode) -> bool:
+        return not self.child.test(node)
+
+    def __str__(self):
+        return f"NOT ({self.child})" if isinstance(self.child, (And, Or)) else f"NOT {self.child}"
+
+
+_CRITERIA: dict[str, Callable[[str], Predicate]] = {
+    'name': NamePredicate,
+    'type': TypePredicate,
+    'level': LevelPredicate,
+    'content': ContentPredicate,
+    'min_size': lambda value: SizePredicate(low=parse_size(value)),
+    'max_size': lambda value: SizePredicate(high=parse_size(value)),
+    'modified_after': lambda value: TimePredicate(low=parse_time(value)),
+    'modified_before': lambda value: TimePredicate(high=parse_time(value)),
+}
+
+
+def make_predicate(key: str, value) -> Predicate:
+    factory = _CRITERIA.get(key.lower())
+    if factory is None:
+        raise QueryError(f"criterio desconocido '{key}' (use {', '.join(_CRITERIA)} o limit)")
+    if value is None or str(value) == '':
+        raise QueryError(f"el criterio '{key}' necesita un valor")
+    return factory(value)
+
+
+class Query(NamedTuple):
+    """Consulta compilada: la expresión (ya optimizada) y el máximo de resultados (None = todos)."""
+    expression: Predicate
+    limit: int | None
+
+    def __str__(self):
+        return str(self.expression) + (f" limit={self.limit}" if self.limit is not None else "")
+
+
+def _split_parentheses(tokens: list[str]) -> Iterator[str]:
+    """Separa los paréntesis pegados a los criterios ('(name=*.py' -> '(', 'name=*.py')."""
+    for token in tokens:
+        while token.startswith('('):
+            yield '('
+            token = token[1:]
+        closing = 0
+        while token.endswith(')') and token.count(')') > token.count('('): # Un valor puede contener '(...)'
+            token = token[:-1]
+            closing += 1
+        if token: yield token
+        yield from ')' * closing
+
+
+def parse_query(tokens: list[str]) -> Query:
+    """
+    Compila los argumentos de search en una Query. Gramática (sin distinguir mayúsculas en los operadores):
+        expr := and (OR and)* ; and := not (AND? not)* ; not := NOT not | '(' expr ')' | key=value
+    limit=N puede ir en cualquier posición y se aplica a toda la consulta.
+    """
+    limit = None
+    items = []
+    for token in _split_parentheses(tokens):
+        if token.lower().startswith('limit='):
+            try: limit = int(token.split('=', 1)[1])
+            except ValueError: raise QueryError(f"limit inválido: '{token}'")
+            if limit < 1: raise QueryError("limit debe ser mayor que 0")
+        else:
+            items.append(token)
+    if not items:
+        raise QueryError("la consulta no tiene criterios")
+    position = 0
+
+    def _peek() -> str | None:
+        return items[position] if position < len(items) else None
+
+    def _next() -> str:
+        nonlocal position
+        position += 1
+        return items[position - 1]
+
+    def _or() -> Predicate:
+        children = [_and()]
+        while (_peek() or '').upper() == 'OR':
+            _next()
+            children.append(_and())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def _and() -> Predicate:
+        children = [_not()]
+        while _peek() is not None and _peek() != ')' and _peek().upper() != 'OR':
+            if _peek().upper() == 'AND': _next()
+            children.append(_not())
+        return children[0] if len(children) == 1 else And(children)
+
+    def _not() -> Predicate:
+        token = _peek()
+        if token is None:
+            raise QueryError("falta un criterio al final de la consulta")
+        if token.upper() == 'NOT':
+            _next()
+            return Not(_not())
+        if token == '(':
+            _next()
+            inner = _or()
+            if _peek() != ')': raise QueryError("falta ')'")
+            _next()
+            return inner
+        if token == ')' or token.upper() in ('AND', 'OR'):
+            raise QueryError(f"se esperaba un criterio y se encontró '{token}'")
+        _next()
+        if '=' not in token:
+            raise QueryError(f"criterio con formato incorrecto: '{token}' (use key=value)")
+        key, value = token.split('=', 1)
+        return make_predicate(key, value)
+
+    expression = _or()
+    if _peek() is not None:
+        raise QueryError(f"')' sin abrir" if _peek() == ')' else f"token inesperado '{_peek()}'")
+    return Query(optimize(expression), limit)
+
+
+def query_from_criteria(criteria: dict) -> Query:
+    """Query equivalente a search_nodes(**criteria): el AND de todos los criterios (más limit, si se indica)."""
+    criteria = {key.lower(): value for key, value in criteria.items()}
+    limit = criteria.pop('limit', None)
+    if limit is not None:
+        try: limit = int(limit)
+        except (TypeError, ValueError): raise QueryError(f"limit inválido: '{limit}'")
+    if not criteria:
+        raise QueryError("la consulta no tiene criterios")
+    predicates = [make_predicate(key, value) for key, value in criteria.items()]
+    return Query(optimize(predicates[0] if len(predicates) == 1 else And(predicates)), limit)
+
+
+def optimize(expression: Predicate) -> Predicate:
+    """Aplana AND/OR anidados, une los rangos de un mismo atributo dentro de cada AND y elimina dobles NOT."""
+    if isinstance(expression, Not):
+        child = optimize(expression.child)
+        return child.child if isinstance(child, Not) else Not(child)
+    if not isinstance(expression, (And, Or)):
+        return expression
+    children = []
+    for child in map(optimize, expression.children):
+        if type(child) is type(expression): children.extend(child.children) # (a AND b) AND c -> a AND b AND c
+        else: children.append(child)
+    if isinstance(expression, And):
+        # min_size=1KB max_size=1MB -> un solo rango (una sola consulta al índice ordenado)
+        merged: dict[type, RangePredicate] = {}
+        others = []
+        for child in children:
+            if isinstance(child, RangePredicate):
+                merged[type(child)] = merged[type(child)].intersect(child) if type(child) in merged else child
+            else:
+                others.append(child)
+        children = list(merged.values()) + others
+    return children[0] if len(children) == 1 else type(expression)(children)
+
+
+def predicates_of(expression: Predicate) -> Iterator[Predicate]:
+    """Todos los predicados simples (hojas) de la expresión."""
+    if isinstance(expression, (And, Or)):
+        for child in expression.children: yield from predicates_of(child)
+    elif isinstance(expression, Not):
+        yield from predicates_of(expression.child)
+    else:
+        yield expression
+
+
+# Un índice ofrece, para un predicado simple, (nº de candidatos, función que los materializa)
+IndexLookup = Callable[[Predicate], tuple[int, Callable[[], set[int]]] | None]
+
+
+def candidate_ids(expression: Predicate, lookup: IndexLookup) -> tuple[int, Callable[[], set[int]]] | None:
+    """
+    Conjunto de IDs (sin materializar) que contiene todos los resultados de la expresión, según los
+    índices disponibles, o None si hay que recorrer el árbol. Un AND usa el candidato más pequeño de
+    sus hijos; un OR solo tiene candidatos si todos sus hijos los tienen (su unión); un NOT, nunca.
+    """
+    if isinstance(expression, And):
+        options = [option for option in (candidate_ids(child, lookup) for child in expression.children) if option is not None]
+        return min(options, key=lambda option: option[0], default=None)
+    if isinstance(expression, Or):
+        options = [candidate_ids(child, lookup) for child in expression.children]
+        if any(option is None for option in options):
+            return None
+        return sum(count for count, _ in options), lambda: set().union(*(materialize() for _, materialize in options))
+    if isinstance(expression, Not):
+        return None
+    return lookup(expression)
+
+
+def order_predicates(expression: Predicate, total_nodes: int, lookup: IndexLookup) -> Predicate:
+    """
+    Copia de la expresión con los hijos de cada AND (y de cada OR) ordenados para evaluar primero
+    lo barato y decisivo. En un AND va antes el predicado con menor cost / (1 - selectivity): barato
+    y que descarta muchos nodos; en un OR, el de menor cost / selectivity: barato y que acepta
+    muchos. La selectividad se calcula con los índices cuando los hay (p. ej. cuántos archivos hay
+    en un rango de tamaños). La expresión original no se modifica, así que una Query puede
+    reutilizarse con otros índices (u otro árbol).
+    """
+    if isinstance(expression, Not):
+        return Not(order_predicates(expression.child, total_nodes, lookup))
+    if not isinstance(expression, (And, Or)):
+        ordered = copy.copy(expression)
+        if total_nodes > 0:
+            option = lookup(expression)
+            if option is not None:
+                ordered.selectivity = min(1.0, option[0] / total_nodes)
+        return ordered
+    children = [order_predicates(child, total_nodes, lookup) for child in expression.children]
+    if isinstance(expression, And):
+        children.sort(key=lambda child: child.cost / max(1e-9, 1.0 - child.selectivity))
+    else:
+        children.sort(key=lambda child: child.cost / max(1e-9, child.selectivity))
+    return type(expression)(children) # El constructor recalcula cost y selectivity con los hijos ordenados
@@ -0,0 +1,175 @@
+# src/scan_stats.py
+"""
+Métricas de un escaneo (j-scan --stats / --stats-json): tiempo por fase, nodos por segundo,
+bytes leídos y escritos, y los directorios que más tardaron en listarse.
+"""
+
+import sys
+import json
+import time
+import heapq
+import threading
+
+from .content_store import ContentStore
+
+# Fases medidas. Los tiempos de listing, stat, content_read y disk_write se suman entre todos
+# los hilos del escaneo paralelo, así que pueden superar el tiempo real transcurrido.
+PHASES = ('listing', 'stat', 'content_read', 'disk_write', 'indexing')
+
+
+class DirectoryTally:
+    """Tiempos y bytes acumulados mientras se lista un directorio (lo usa un solo hilo)."""
+    __slots__ = ('stat_seconds', 'read_seconds', 'files_read', 'bytes_read', 'errors')
+
+    def __init__(self):
+        self.stat_seconds = 0.0
+        self.read_seconds = 0.0 # Lectura del contenido, incluida la escritura en el almacén
+        self.files_read = 0
+        self.bytes_read = 0
+        self.errors = 0
+
+
+class ScanStats:
+    """
+    Contadores y temporizadores de un escaneo. Los hilos que listan directorios entregan un
+    DirectoryTally por directorio (record_directory, con lock); el enlazado de nodos, que solo
+    ocurre en el hilo principal, se mide con record_indexing. Los bytes y el tiempo de escritura
+    se toman de los almacenes de contenido registrados con watch_store.
+    """
+
+    def __init__(self, slowest_count: int = 10):
+        self.slowest_count = slowest_count
+        self.started = time.perf_counter()
+        self.finished: float | None = None
+        self.directories_listed = 0
+        self.entries_listed = 0
+        self.files_read = 0
+        self.bytes_read = 0
+        self.errors = 0
+        self.nodes_indexed = 0
+        self._phase_seconds = dict.fromkeys(PHASES, 0.0)
+        self._slowest: list[tuple[float, str, int]] = [] # Heap de mínimos con los directorios más lentos
+        self._stores: list[tuple[ContentStore, int, float, int]] = [] # (almacén, bytes, segundos, blobs al empezar)
+        self._lock = threading.Lock()
+        self._reporter: threading.Thread | None = None
+        self._stop_reporter = threading.Event()
+
+    def watch_store(self, store: ContentStore | None):
+        """Incluye en las métricas lo que se escriba a partir de ahora en este almacén."""
+        if store is not None:
+            self._stores.append((store, store.bytes_written, store.write_seconds, store.blobs_written))
+
+    def record_directory(self, path: str, seconds: float, entries: int, tally: DirectoryTally):
+        with self._lock:
+            self.directories_listed += 1
+            self.entries_listed += entries
+            self.files_read += tally.files_read
+            self.bytes_read += tally.bytes_read
+            self.errors += tally.errors
+            self._phase_seconds['listing'] += max(0.0, seconds - tally.stat_seconds - tally.read_seconds)
+            self._phase_seconds['stat'] += tally.stat_seconds
+            self._phase_seconds['content_read'] += tally.read_seconds
+            entry = (seconds, path, entries)
+            if len(self._slowest) < self.slowest_count:
+                heapq.heappush(self._slowest, entry)
+            elif seconds > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def record_indexing(self, seconds: float):
+        """Tiempo de enlazar un nodo (on_node_created e índice de contenido). Solo desde el hilo principal."""
+        self.nodes_indexed += 1
+        self._phase_seconds['indexing'] += seconds
+
+    def stop(self):
+        """Marca el final del escaneo y detiene el informe periódico, si lo hay."""
+        if self.finished is None:
+            self.finished = time.perf_counter()
+        if self._reporter is not None:
+            self._stop_reporter.set()
+            self._reporter.join()
+            self._reporter = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished if self.finished is not None else time.perf_counter()) - self.started
+
+    def _written(self) -> tuple[int, float, int]:
+        """(bytes escritos, segundos de escritura, blobs nuevos) en los almacenes vigilados."""
+        written = seconds = blobs = 0
+        for store, start_bytes, start_seconds, start_blobs in self._stores:
+            written += store.bytes_written - start_bytes
+            seconds += store.write_seconds - start_seconds
+            blobs += store.blobs_written - start_blobs
+        return written, seconds, blobs
+
+    def as_dict(self) -> dict:
+        """Las métricas como un diccionario serializable en JSON."""
+        elapsed = self.elapsed
+        bytes_written, write_seconds, blobs_written = self._written()
+        with self._lock:
+            phases = dict(self._phase_seconds)
+            slowest = sorted(self._slowest, reverse=True)
+        # La escritura en el almacén ocurre dentro de la lectura del contenido (put_file): separarlas
+        phases['disk_write'] = write_seconds
+        phases['content_read'] = max(0.0, phases['content_read'] - write_seconds)
+        nodes = max(self.nodes_indexed, self.entries_listed)
+        return {
+            'elapsed_seconds': round(elapsed, 6),
+            'finished': self.finished is not None,
+            'directories_listed': self.directories_listed,
+            'entries_listed': self.entries_listed,
+            'nodes_indexed': self.nodes_indexed,
+            'nodes_per_second': round(nodes / elapsed, 1) if elapsed > 0 else 0.0,
+            'files_read': self.files_read,
+            'bytes_read': self.bytes_read,
+            'bytes_written': bytes_written,
+            'blobs_written': blobs_written,
+            'errors': self.errors,
+            'phase_seconds': {phase: round(seconds, 6) for phase, seconds in phases.items()},
+            'slowest_directories': [
+                {'path': path, 'seconds': round(seconds, 6), 'entries': entries} for seconds, path, entries in slowest
+            ],
+        }
+
+    def save_json(self, filename: str):
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.as_dict(), f, indent=2, ensure_ascii=False)
+
+    def progress_line(self) -> str:
+        elapsed = self.elapsed
+        nodes = max(self.nodes_indexed, self.entries_listed)
+        bytes_written = self._written()[0]
+        return (f"[{elapsed:7.1f} s] {self.directories_listed} directorios, {nodes} nodos "
+                f"({nodes / elapsed if elapsed > 0 else 0:.0f}/s), "
+                f"{self.bytes_read / (1024 * 1024):.1f} MB leídos, {bytes_written / (1024 * 1024):.1f} MB escritos")
+
+    def start_reporter(self, interval: float = 2.0, stream=None):
+        """Imprime progress_line cada interval segundos desde un hilo en segundo plano hasta stop()."""
+        stream = stream or sys.stdout
+
+        def _report():
+            while not self._stop_reporter.wait(interval):
+                print(self.progress_line(), file=stream, flush=True)
+
+        self._stop_reporter.clear()
+        self._reporter = threading.Thread(target=_report, name="scan-stats", daemon=True)
+        self._reporter.start()
+
+    def print_report(self):
+        data = self.as_dict()
+        elapsed = data['elapsed_seconds']
+        print("\n--- Métricas del escaneo ---")
+        print(f"Tiempo total: {elapsed:.3f} s; {data['nodes_per_second']:.0f} nodos/s")
+        print(f"Directorios listados: {data['directories_listed']}, entradas: {data['entries_listed']}, "
+              f"nodos indexados: {data['nodes_indexed']}, errores: {data['errors']}")
+        print(f"Contenido leído: {data['files_read']} archivos, {data['bytes_read'] / (1024 * 1024):.2f} MB; "
+              f"escrito: {data['bytes_written'] / (1024 * 1024):.2f} MB ({data['blobs_written']} blobs)")
+        print("Tiempo por fase (sumado entre hilos):")
+        for phase, seconds in data['phase_seconds'].items():
+            share = f" ({seconds / elapsed * 100:5.1f} %)" if elapsed > 0 else ""
+            print(f"  {phase:<13}{seconds:10.3f} s{share}")
+        if data['slowest_directories']:
+            print("Directorios más lentos de listar:")
+            for entry in data['slowest_directories']:
+                print(f"  {entry['seconds'] * 1000:9.1f} ms  {entry['entries']:>7} entradas  {entry['path']}")
+        print("--- Fin de las métricas ---")
@@ -0,0 +1,38 @@
+# src/sorted_index.py
+
+from bisect import bisect_left, bisect_right
+from typing import Iterable
+
+
+class SortedAttributeIndex:
+    """
+    Índice secundario ordenado por un atributo numérico (p. ej. st_size o st_mtime).
+    Responde consultas de rango [low, high] con búsqueda binaria: O(log n) para contar
+    y O(log n + k) para obtener los k IDs del rango.
+
+    Es inmutable: DirectoryTree lo descarta cuando el árbol cambia y lo reconstruye
+    la próxima vez que una búsqueda lo necesita.
+    """
+
+    def __init__(self, pairs: Iterable[tuple[float, int]]):
+        """
+        Args:
+            pairs (Iterable[tuple[float, int]]): Pares (valor del atributo, ID del nodo).
+        """
+        ordered = sorted(pairs)
+        self._keys = [key for key, _ in ordered]
+        self._ids = [node_id for _, node_id in ordered]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _bounds(self, low: float, high: float) -> tuple[int, int]:
+        return bisect_left(self._keys, low), bisect_right(self._keys, high)
+
+    def count_range(self, low: float, high: float) -> int:
+        start, end = self._bounds(low, high)
+        return max(0, end - start)
+
+    def ids_in_range(self, low: float, high: float) -> list[int]:
+        start, end = self._bounds(low, high)
+        return self._ids[start:end]
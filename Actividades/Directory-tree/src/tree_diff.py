@@ -0,0 +1,154 @@
+# src/tree_diff.py
+"""
+Diferencias entre dos árboles escaneados (p. ej. dos snapshots del mismo directorio tomados
+en fechas distintas), sin volcarlos a texto.
+"""
+
+from typing import Iterator, NamedTuple
+
+from .filesystem_node import FileSystemNode, SubtreeStats
+from .content_store import blob_digest
+
+
+class TreeChange(NamedTuple):
+    """
+    Un cambio entre el árbol antiguo y el nuevo. kind es 'added', 'removed', 'modified' o 'moved'.
+    Las rutas son relativas a la raíz de cada árbol; para 'moved', path es la ruta antigua y
+    new_path la nueva (en los demás casos coinciden).
+    """
+    kind: str
+    path: str
+    new_path: str
+    old_node: FileSystemNode | None
+    new_node: FileSystemNode | None
+
+
+def _join(parent_path: str, name: str) -> str:
+    return f"{parent_path}/{name}" if parent_path else name
+
+
+def _sort_key(node: FileSystemNode) -> tuple:
+    return (not node.is_directory, node.name) # El mismo orden que get_children
+
+
+def _dir_signature(node: FileSystemNode, stats: dict[int, SubtreeStats] | None) -> tuple | None:
+    """
+    Firma de un directorio: su fecha, su número de hijos y los totales de su subárbol.
+    Dos directorios con la misma firma se consideran idénticos y no se recorren.
+    None si no hay datos suficientes para compararlos sin recorrerlos.
+    """
+    if stats is None or node.metadata is None or node.node_id not in stats:
+        return None
+    return (node.metadata.st_mtime, len(node.children)) + tuple(stats[node.node_id])
+
+
+def _file_modified(old: FileSystemNode, new: FileSystemNode) -> bool:
+    if old.metadata is None or new.metadata is None: # Escaneos --names-only: no hay con qué comparar
+        return False
+    if (old.metadata.st_size, old.metadata.st_mtime) != (new.metadata.st_size, new.metadata.st_mtime):
+        return True
+    # Con el contenido guardado en el almacén, el hash del blob detecta cambios que conservan tamaño y fecha
+    old_digest = blob_digest(old.saved_content_path) if old.saved_content_path else None
+    new_digest = blob_digest(new.saved_content_path) if new.saved_content_path else None
+    return old_digest is not None and new_digest is not None and old_digest != new_digest
+
+
+def _move_key(node: FileSystemNode, stats: dict[int, SubtreeStats] | None) -> tuple | None:
+    """
+    Clave para emparejar una baja con un alta como movimiento (o renombrado): mismo contenido
+    aparente, es decir, tamaño y fecha del archivo o totales del subárbol de un directorio.
+    Un archivo vacío no tiene contenido que lo identifique, así que además debe conservar el nombre.
+    """
+    if node.metadata is None:
+        return None
+    if node.is_directory:
+        if stats is None or node.node_id not in stats or stats[node.node_id].file_count == 0:
+            return None
+        return (True,) + tuple(stats[node.node_id])
+    if node.metadata.st_size == 0:
+        return (False, 0, node.metadata.st_mtime, node.name)
+    return (False, node.metadata.st_size, node.metadata.st_mtime)
+
+
+def diff_trees(
+    old_root: FileSystemNode,
+    new_root: FileSystemNode,
+    old_stats: dict[int, SubtreeStats] | None = None,
+    new_stats: dict[int, SubtreeStats] | None = None
+) -> Iterator[TreeChange]:
+    """
+    Genera los cambios entre dos árboles a medida que los encuentra.
+
+    Recorre ambos árboles a la vez, directorio por directorio, con un merge-join sobre los hijos
+    ya ordenados (get_children): un nombre solo en el antiguo es una baja, solo en el nuevo un
+    alta, y en ambos se compara. Los directorios cuya firma coincide (fecha, número de hijos y
+    totales del subárbol, ver DirectoryTree.get_subtree_stats) se dan por idénticos sin recorrerlos.
+    De un directorio añadido o eliminado solo se informa el propio directorio, no su contenido.
+
+    Los movimientos se detectan emparejando bajas y altas con la misma clave (_move_key). Para
+    no retener toda la salida, solo se guardan las bajas y altas aún sin pareja; las que no
+    pueden ser movimientos se emiten de inmediato y las demás al terminar el recorrido.
+
+    Args:
+        old_root (FileSystemNode): Raíz del árbol antiguo.
+        new_root (FileSystemNode): Raíz del árbol nuevo.
+        old_stats, new_stats (dict[int, SubtreeStats] | None, optional): Totales por directorio de
+            cada árbol. Sin ellos no se podan subárboles ni se detectan directorios movidos.
+
+    Yields:
+        TreeChange: Cada cambio encontrado.
+    """
+    pending_removed: dict[tuple, list[tuple[str, FileSystemNode]]] = {}
+    pending_added: dict[tuple, list[tuple[str, FileSystemNode]]] = {}
+
+    def _unmatched(kind: str, path: str, node: FileSystemNode, stats) -> Iterator[TreeChange]:
+        key = _move_key(node, stats)
+        removed = kind == 'removed'
+        if key is None:
+            yield TreeChange(kind, path, path, node if removed else None, None if removed else node)
+            return
+        counterpart = (pending_added if removed else pending_removed).get(key)
+        if counterpart:
+            other_path, other_node = counterpart.pop()
+            if removed:
+                yield TreeChange('moved', path, other_path, node, other_node)
+            else:
+                yield TreeChange('moved', other_path, path, other_node, node)
+            return
+        (pending_removed if removed else pending_added).setdefault(key, []).append((path, node))
+
+    stack = [(old_root, new_root, "")]
+    while stack:
+        old_dir, new_dir, dir_path = stack.pop()
+        old_signature = _dir_signature(old_dir, old_stats)
+        if old_signature is not None and old_signature == _dir_signature(new_dir, new_stats):
+            continue # Subárbol idéntico: no hace falta recorrerlo
+
+        old_children, new_children = old_dir.get_children(), new_dir.get_children()
+        i = j = 0
+        subdirs = []
+        while i < len(old_children) or j < len(new_children):
+            old_child = old_children[i] if i < len(old_children) else None
+            new_child = new_children[j] if j < len(new_children) else None
+            if new_child is None or (old_child is not None and _sort_key(old_child) < _sort_key(new_child)):
+                yield from _unmatched('removed', _join(dir_path, old_child.name), old_child, old_stats)
+                i += 1
+            elif old_child is None or _sort_key(new_child) < _sort_key(old_child):
+                yield from _unmatched('added', _join(dir_path, new_child.name), new_child, new_stats)
+                j += 1
+            else:
+                child_path = _join(dir_path, old_child.name)
+                if old_child.is_directory:
+                    subdirs.append((old_child, new_child, child_path))
+                elif _file_modified(old_child, new_child):
+                    yield TreeChange('modified', child_path, child_path, old_child, new_child)
+                i += 1
+                j += 1
+        stack.extend(reversed(subdirs)) # Seguir en orden alfabético
+
+    for removed in pending_removed.values():
+        for path, node in removed:
+            yield TreeChange('removed', path, path, node, None)
+    for added in pending_added.values():
+        for path, node in added:
+            yield TreeChange('added', path, path, None, node)
@@ -1,45 +1,27 @@
 # src/tree_printer.py
 
-from .filesystem_node import FileSystemNode # Importar la clase FileSystemNode
+from .filesystem_node import FileSystemNode, SubtreeStats # Importar la clase FileSystemNode
 import datetime
+from typing import Iterator, TextIO
 
-def build_tree_string(node: FileSystemNode, max_depth: int = -1, indent: str = "", is_last: bool = True, show_metadata: bool = True) -> list[str]:
-    """
-    Construye una lista de cadenas representando visualmente la estructura del árbol
-    de directorios de forma recursiva, respetando un límite de profundidad.
-
-    Args:
-        node (FileSystemNode): El nodo actual a procesar.
-        max_depth (int, optional): La profundidad máxima a imprimir (-1 = ilimitado, 0 = solo nodo actual, 1 = actual + hijos, etc.). Defaults to -1.
-        indent (str, optional): La cadena de indentación acumulada. Defaults to "".
-        is_last (bool, optional): Indica si este nodo es el último hijo de su padre. Defaults to True.
-        show_metadata (bool, optional): Si es True, muestra metadatos básicos (tamaño y fecha). Defaults to True.
-
-    Returns:
-        list[str]: Una lista de cadenas, donde cada cadena es una línea de la salida visual.
-    """
-    lines = []
-    node_level = node.get_level() # Obtener el nivel del nodo
 
-    # Detener la recursión si excede la profundidad máxima (excepto si es el nodo raíz y max_depth es 0)
-    # Si max_depth es 0, solo imprimimos la raíz y detenemos.
-    if max_depth >= 0 and node_level > max_depth:
-         return [] # No añadir líneas y detener la recursión para esta rama
-
-    # Símbolos para dibujar el árbol
-    if node_level == 0: # El nodo raíz (nivel 0) no tiene prefijo de rama
-        branch_prefix = ""
-        # Ajustar la indentación base para los hijos de la raíz
-        child_indent_base = ""
-    else:
-        branch_prefix = '└── ' if is_last else '├── '
-        # La indentación para los hijos se basa en la indentación actual y el prefijo del padre
-        child_indent_base = indent + ('    ' if is_last else '│   ')
+def format_size(size_bytes: float) -> str:
+    """Tamaño legible (B, KB, MB, GB o TB)."""
+    if size_bytes < 1024:
+        return f"{int(size_bytes)} B"
+    for unit in ('KB', 'MB', 'GB'):
+        size_bytes /= 1024
+        if size_bytes < 1024:
+            return f"{size_bytes:.2f} {unit}"
+    return f"{size_bytes / 1024:.2f} TB"
 
 
+def _format_node_line(node: FileSystemNode, indent: str, branch_prefix: str, show_metadata: bool,
+                      subtree_stats: dict[int, SubtreeStats] | None = None) -> str:
+    """Construye la línea visual de un nodo (prefijo de rama, ID, nombre y metadatos opcionales)."""
     print_str = f"{indent}{branch_prefix}[{node.node_id}] {node.name}" # Incluir ID del nodo
 
-    if show_metadata:
+    if show_metadata and node.metadata is not None: # Sin metadatos en escaneos --names-only
         # Formatear metadatos básicos
         size_kb = node.metadata.st_size / 1024
         try:
@@ -47,20 +29,112 @@ def build_tree_string(node: FileSystemNode, max_depth: int = -1, indent: str = "
         except Exception:
              mod_time = "Fecha desconocida"
 
-        meta_info = f" ({'Dir' if node.is_directory else f'{size_kb:.2f} KB'}, Mod: {mod_time})"
+        if node.is_directory and subtree_stats is not None and node.node_id in subtree_stats:
+            # Totales acumulados del subárbol en lugar de solo "Dir"
+            stats = subtree_stats[node.node_id]
+            files_info = f"{stats.file_count} {'archivo' if stats.file_count == 1 else 'archivos'}"
+            size_info = f"Dir, {format_size(stats.total_size)} en {files_info}" if stats.total_size is not None else f"Dir, {files_info}"
+        else:
+            size_info = 'Dir' if node.is_directory else f'{size_kb:.2f} KB'
+        meta_info = f" ({size_info}, Mod: {mod_time})"
         print_str += meta_info
 
-    lines.append(print_str)
+    return print_str
+
+
+def iter_tree_lines(node: FileSystemNode, max_depth: int = -1, indent: str = "", is_last: bool = True, show_metadata: bool = True,
+                    subtree_stats: dict[int, SubtreeStats] | None = None) -> Iterator[str]:
+    """
+    Genera, una a una, las líneas que representan visualmente la estructura del árbol
+    de directorios, respetando un límite de profundidad.
+
+    Usa una pila explícita de iteradores en lugar de recursión, de modo que no depende
+    del límite de recursión de Python y solo mantiene en memoria una rama del árbol.
+
+    Args:
+        node (FileSystemNode): El nodo desde el que empezar.
+        max_depth (int, optional): La profundidad máxima a imprimir (-1 = ilimitado, 0 = solo nodo actual, 1 = actual + hijos, etc.). Defaults to -1.
+        indent (str, optional): La cadena de indentación inicial. Defaults to "".
+        is_last (bool, optional): Indica si el nodo inicial es el último hijo de su padre. Defaults to True.
+        show_metadata (bool, optional): Si es True, muestra metadatos básicos (tamaño y fecha). Defaults to True.
+        subtree_stats (dict[int, SubtreeStats], optional): Totales por directorio (DirectoryTree.get_subtree_stats);
+            si se dan, los directorios muestran su tamaño acumulado y su número de archivos. Defaults to None.
+
+    Yields:
+        str: Cada línea de la salida visual, sin salto de línea final.
+    """
+    # Cada entrada de la pila: (iterador de hijos restantes, número de hijos, indentación para esos hijos)
+    stack = []
+    pending = [(node, indent, is_last)]
+
+    while pending or stack:
+        if pending:
+            current, current_indent, current_is_last = pending.pop()
+        else:
+            children_iter, child_count, child_indent = stack[-1]
+            position_child = next(children_iter, None)
+            if position_child is None:
+                stack.pop()
+                continue
+            position, current = position_child
+            current_indent, current_is_last = child_indent, (position == child_count - 1)
+
+        node_level = current.get_level() # Obtener el nivel del nodo
+
+        # No imprimir (ni descender) si excede la profundidad máxima
+        if max_depth >= 0 and node_level > max_depth:
+            continue
+
+        # Símbolos para dibujar el árbol
+        if node_level == 0: # El nodo raíz (nivel 0) no tiene prefijo de rama
+            branch_prefix = ""
+            # Ajustar la indentación base para los hijos de la raíz
+            child_indent_base = ""
+        else:
+            branch_prefix = '└── ' if current_is_last else '├── '
+            # La indentación para los hijos se basa en la indentación actual y el prefijo del padre
+            child_indent_base = current_indent + ('    ' if current_is_last else '│   ')
+
+        yield _format_node_line(current, current_indent, branch_prefix, show_metadata, subtree_stats)
+
+        # Si es un directorio y no hemos alcanzado la profundidad máxima de impresión (o si es ilimitada)
+        if current.is_directory and (max_depth < 0 or node_level < max_depth):
+            sorted_children = current.get_children() # get_children ya ordena
+            if sorted_children:
+                stack.append((iter(enumerate(sorted_children)), len(sorted_children), child_indent_base))
+
 
-    # Si es un directorio y no hemos alcanzado la profundidad máxima de impresión (o si es ilimitada)
-    if node.is_directory and (max_depth < 0 or node_level < max_depth):
-        # Obtener hijos ordenados
-        sorted_children = node.get_children() # get_children ya ordena
+def write_tree(node: FileSystemNode, stream: TextIO, max_depth: int = -1, show_metadata: bool = True, batch_lines: int = 4096,
+               subtree_stats: dict[int, SubtreeStats] | None = None) -> int:
+    """
+    Escribe la representación del árbol directamente en un stream (archivo o sys.stdout),
+    agrupando las líneas en bloques para reducir el número de llamadas a write().
 
-        for i, child in enumerate(sorted_children):
-            child_is_last = (i == len(sorted_children) - 1)
-            # Llamada recursiva para los hijos, incrementando la indentación
-            child_lines = build_tree_string(child, max_depth, child_indent_base, child_is_last, show_metadata)
-            lines.extend(child_lines) # Usa extend para añadir todas las líneas de los hijos
+    Returns:
+        int: Número de líneas escritas.
+    """
+    batch = []
+    written = 0
+    for line in iter_tree_lines(node, max_depth=max_depth, show_metadata=show_metadata, subtree_stats=subtree_stats):
+        batch.append(line)
+        if len(batch) >= batch_lines:
+            stream.write('\n'.join(batch) + '\n')
+            written += len(batch)
+            batch.clear()
+    if batch:
+        stream.write('\n'.join(batch) + '\n')
+        written += len(batch)
+    return written
 
-    return lines
\ No newline at end of file
+
+def build_tree_string(node: FileSystemNode, max_depth: int = -1, indent: str = "", is_last: bool = True, show_metadata: bool = True,
+                      subtree_stats: dict[int, SubtreeStats] | None = None) -> list[str]:
+    """
+    Construye una lista de cadenas representando visualmente la estructura del árbol.
+    Equivale a list(iter_tree_lines(...)); para árboles grandes es preferible write_tree,
+    que no mantiene toda la salida en memoria.
+
+    Returns:
+        list[str]: Una lista de cadenas, donde cada cadena es una línea de la salida visual.
+    """
+    return list(iter_tree_lines(node, max_depth, indent, is_last, show_metadata, subtree_stats))
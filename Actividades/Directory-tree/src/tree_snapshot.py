@@ -0,0 +1,297 @@
+# src/tree_snapshot.py
+
+import os
+import json
+import mmap
+import time
+import struct
+from collections.abc import MutableMapping
+
+from .filesystem_node import FileSystemNode, NodeMetadata
+
+# --- Formato binario del snapshot ---
+# [HEADER][META (JSON utf-8)][RECORDS (tamaño fijo, ordenados por node_id)][HEAP de cadenas]
+#
+# Cada registro guarda los enlaces del árbol como índices de registro (no IDs), de modo que
+# el padre, el primer hijo y el siguiente hermano de un nodo se localizan en O(1) sin
+# construir ningún diccionario al cargar. Las cadenas (nombre, contenido, ruta de contenido
+# guardado) viven en el heap y se referencian por (offset, longitud).
+# Las rutas completas no se guardan: se reconstruyen como padre.path + nombre.
+
+SNAPSHOT_MAGIC = b"DTREESNP"
+SNAPSHOT_VERSION = 1
+
+# magic, versión, número de nodos, offset del heap, longitud del bloque META
+HEADER = struct.Struct('<8sIqqq')
+
+# node_id, padre, primer hijo, siguiente hermano, flags,
+# st_size, st_mtime, st_ctime, st_mode, st_ino, st_dev,
+# nombre (off, len), contenido (off, len), ruta guardada (off, len)
+RECORD = struct.Struct('<qqqqBqddIQQQIQQQI')
+
+FLAG_DIRECTORY = 1
+FLAG_METADATA = 2
+FLAG_CONTENT = 4
+FLAG_SAVED_PATH = 8
+FLAG_CONTENT_BYTES = 16 # El contenido era bytes (no str)
+
+_ENCODING_ERRORS = 'surrogatepass' # Los nombres de archivo pueden contener surrogates (os.fsdecode)
+
+
+def write_snapshot(filename: str, root: FileSystemNode, node_index, meta: dict | None = None) -> int:
+    """
+    Escribe el árbol en formato snapshot binario.
+
+    Args:
+        filename (str): Archivo de destino (se sobrescribe de forma atómica).
+        root (FileSystemNode): Nodo raíz del árbol.
+        node_index (Mapping[int, FileSystemNode]): Índice ID -> nodo del árbol.
+        meta (dict, optional): Datos adicionales a guardar en el bloque META. Defaults to None.
+
+    Returns:
+        int: Número de nodos escritos.
+    """
+    node_ids = sorted(node_index.keys())
+    record_of = {node_id: position for position, node_id in enumerate(node_ids)}
+
+    # Calcular primer hijo y siguiente hermano a partir de las listas de hijos
+    first_child: dict[int, int] = {}
+    next_sibling: dict[int, int] = {}
+    for node_id in node_ids:
+        node = node_index[node_id]
+        if not node.is_directory or not node.children:
+            continue
+        child_records = [record_of[child.node_id] for child in node.children]
+        first_child[node_id] = child_records[0]
+        for current, following in zip(child_records, child_records[1:]):
+            next_sibling[current] = following
+
+    heap = bytearray()
+
+    def _heap_add(value: str | bytes) -> tuple[int, int]:
+        data = value if isinstance(value, bytes) else value.encode('utf-8', _ENCODING_ERRORS)
+        offset = len(heap)
+        heap.extend(data)
+        return offset, len(data)
+
+    records = bytearray()
+    for position, node_id in enumerate(node_ids):
+        node = node_index[node_id]
+        flags = FLAG_DIRECTORY if node.is_directory else 0
+
+        metadata = node.metadata
+        if metadata is not None:
+            flags |= FLAG_METADATA
+            size = getattr(metadata, 'st_size', 0)
+            mtime = getattr(metadata, 'st_mtime', 0)
+            ctime = getattr(metadata, 'st_ctime', 0)
+            mode = getattr(metadata, 'st_mode', 0)
+            ino = getattr(metadata, 'st_ino', 0)
+            dev = getattr(metadata, 'st_dev', 0)
+        else:
+            size = mtime = ctime = mode = ino = dev = 0
+
+        name_off, name_len = _heap_add(node.name)
+        content_off = content_len = 0
+        if node.content is not None:
+            flags |= FLAG_CONTENT
+            if isinstance(node.content, bytes): flags |= FLAG_CONTENT_BYTES
+            content_off, content_len = _heap_add(node.content if isinstance(node.content, (str, bytes)) else str(node.content))
+        saved_off = saved_len = 0
+        if node.saved_content_path:
+            flags |= FLAG_SAVED_PATH
+            saved_off, saved_len = _heap_add(node.saved_content_path)
+
+        parent_record = record_of[node.parent.node_id] if node.parent is not None else -1
+        records += RECORD.pack(
+            node_id, parent_record, first_child.get(node_id, -1), next_sibling.get(position, -1), flags,
+            size, mtime, ctime, mode, ino, dev,
+            name_off, name_len, content_off, content_len, saved_off, saved_len
+        )
+
+    meta = dict(meta or {})
+    meta.setdefault('created', time.time())
+    meta['root_id'] = root.node_id
+    meta['root_path'] = root.path
+    meta_bytes = json.dumps(meta).encode('utf-8')
+
+    heap_offset = HEADER.size + len(meta_bytes) + len(records)
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, 'wb') as f:
+        f.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(node_ids), heap_offset, len(meta_bytes)))
+        f.write(meta_bytes)
+        f.write(records)
+        f.write(heap)
+    os.replace(tmp_filename, filename)
+    return len(node_ids)
+
+
+class SnapshotReader:
+    """
+    Acceso perezoso a un snapshot mapeado en memoria.
+    Los nodos se materializan (como _SnapshotNode) solo cuando se accede a ellos.
+    """
+    def __init__(self, filename: str):
+        with open(filename, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, heap_offset, meta_len = HEADER.unpack_from(self._mm, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"'{filename}' no es un snapshot de DirectoryTree.")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Versión de snapshot no soportada: {version} (se esperaba {SNAPSHOT_VERSION}).")
+
+        self.count = count
+        self.meta = json.loads(self._mm[HEADER.size:HEADER.size + meta_len].decode('utf-8'))
+        self._records_offset = HEADER.size + meta_len
+        self._heap_offset = heap_offset
+        self._nodes: dict[int, FileSystemNode] = {} # Caché: índice de registro -> nodo materializado
+
+    def record(self, position: int) -> tuple:
+        return RECORD.unpack_from(self._mm, self._records_offset + position * RECORD.size)
+
+    def _string(self, offset: int, length: int) -> bytes:
+        start = self._heap_offset + offset
+        return self._mm[start:start + length]
+
+    def node_id_at(self, position: int) -> int:
+        return struct.unpack_from('<q', self._mm, self._records_offset + position * RECORD.size)[0]
+
+    def find(self, node_id: int) -> int:
+        """Devuelve el índice de registro para node_id, o -1 si no existe (búsqueda binaria)."""
+        # Caso habitual: IDs contiguos desde 0, el registro está en la posición del ID
+        if 0 <= node_id < self.count and self.node_id_at(node_id) == node_id:
+            return node_id
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if self.node_id_at(mid) < node_id: low = mid + 1
+            else: high = mid
+        if low < self.count and self.node_id_at(low) == node_id:
+            return low
+        return -1
+
+    def node(self, position: int) -> FileSystemNode:
+        """
+        Materializa (o devuelve de la caché) el nodo del registro indicado. Un nodo necesita a su
+        padre (ruta y profundidad): se sube por los registros hasta el primer ancestro ya
+        materializado y se crean los que faltan de arriba abajo, sin recursión (un árbol puede
+        tener más niveles que el límite de recursión de Python).
+        """
+        node = self._nodes.get(position)
+        if node is not None:
+            return node
+
+        missing = [] # (posición, registro) desde el nodo pedido hacia la raíz
+        while position >= 0 and position not in self._nodes:
+            record = self.record(position)
+            missing.append((position, record))
+            position = record[1] # registro del padre
+        parent = self._nodes[position] if position >= 0 else None
+        for position, record in reversed(missing):
+            parent = self._materialize(position, record, parent)
+        return parent
+
+    def _materialize(self, position: int, record: tuple, parent: FileSystemNode | None) -> FileSystemNode:
+        (node_id, _parent_record, first_child, _next_sibling, flags,
+         size, mtime, ctime, mode, ino, dev,
+         name_off, name_len, content_off, content_len, saved_off, saved_len) = record
+
+        name = self._string(name_off, name_len).decode('utf-8', _ENCODING_ERRORS)
+        path = os.path.join(parent.path, name) if parent is not None else self.meta.get('root_path', name)
+        metadata = NodeMetadata(size, mtime, ctime, mode, ino, dev) if flags & FLAG_METADATA else None
+
+        content = None
+        if flags & FLAG_CONTENT:
+            content = self._string(content_off, content_len)
+            if not flags & FLAG_CONTENT_BYTES:
+                content = content.decode('utf-8', _ENCODING_ERRORS)
+
+        node = _SnapshotNode(self, first_child, node_id, name, path, bool(flags & FLAG_DIRECTORY), metadata, content)
+        if flags & FLAG_SAVED_PATH:
+            node.saved_content_path = self._string(saved_off, saved_len).decode('utf-8', _ENCODING_ERRORS)
+        node.parent = parent
+        if parent is not None:
+            node.depth = parent.depth + 1
+        self._nodes[position] = node
+        return node
+
+    def children_of(self, first_child: int) -> list[FileSystemNode]:
+        children = []
+        position = first_child
+        while position >= 0:
+            children.append(self.node(position))
+            position = self.record(position)[3] # siguiente hermano
+        return children
+
+
+class _SnapshotNode(FileSystemNode):
+    """FileSystemNode cuya lista de hijos se carga desde el snapshot en el primer acceso."""
+
+    def __init__(self, reader: SnapshotReader, first_child: int, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._reader = reader
+        self._first_child = first_child
+        self._loaded_children = None # FileSystemNode.__init__ asignó [], pero aún no se ha cargado nada
+
+    @property
+    def children(self):
+        if self._loaded_children is None:
+            self._loaded_children = self._reader.children_of(self._first_child)
+        return self._loaded_children
+
+    @children.setter
+    def children(self, value):
+        self._loaded_children = value
+
+
+class SnapshotNodeIndex(MutableMapping):
+    """
+    Índice ID -> nodo respaldado por un snapshot.
+    Materializa los nodos bajo demanda; las altas y bajas posteriores a la carga
+    se guardan aparte para no tener que copiar todo el snapshot a un dict.
+    """
+    def __init__(self, reader: SnapshotReader):
+        self._reader = reader
+        self._added: dict[int, FileSystemNode] = {} # Nodos que no están en el snapshot (o reemplazados)
+        self._removed: set[int] = set() # IDs del snapshot eliminados
+
+    def __getitem__(self, node_id: int) -> FileSystemNode:
+        node = self._added.get(node_id)
+        if node is not None:
+            return node
+        if node_id in self._removed:
+            raise KeyError(node_id)
+        position = self._reader.find(node_id)
+        if position < 0:
+            raise KeyError(node_id)
+        return self._reader.node(position)
+
+    def __setitem__(self, node_id: int, node: FileSystemNode):
+        self._added[node_id] = node
+        if self._reader.find(node_id) >= 0:
+            self._removed.add(node_id) # La versión del snapshot queda oculta por la nueva
+
+    def __delitem__(self, node_id: int):
+        if node_id in self._added:
+            del self._added[node_id]
+        elif node_id in self._removed or self._reader.find(node_id) < 0:
+            raise KeyError(node_id)
+        else:
+            self._removed.add(node_id)
+
+    def __iter__(self):
+        for position in range(self._reader.count):
+            node_id = self._reader.node_id_at(position)
+            if node_id not in self._removed:
+                yield node_id
+        yield from self._added
+
+    def __len__(self) -> int:
+        # Los IDs reemplazados están a la vez en _removed y en _added, así que se compensan
+        return self._reader.count - len(self._removed) + len(self._added)
+
+    def __contains__(self, node_id) -> bool:
+        if node_id in self._added:
+            return True
+        return node_id not in self._removed and self._reader.find(node_id) >= 0
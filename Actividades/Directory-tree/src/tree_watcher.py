@@ -0,0 +1,319 @@
+# src/tree_watcher.py
+"""
+Vigilancia de cambios en disco para mantener al día un DirectoryTree ya escaneado.
+
+En Linux se usa inotify (vía ctypes, sin dependencias): cada directorio del árbol tiene un
+watch y cada evento marca como "sucio" al directorio donde ocurrió. En otros sistemas, o si
+inotify no está disponible (p. ej. por el límite de watches), se usa un sondeo periódico
+que compara la fecha de cada directorio y el tamaño/fecha de cada archivo con los del árbol.
+
+Los directorios sucios se acumulan y se aplican en lote cuando los eventos se calman
+(debounce), así que una ráfaga (descomprimir un archivo, un git checkout...) se traduce en
+un solo re-listado por directorio afectado (ver DirectoryTree.refresh_directories).
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+
+from .filesystem_node import FileSystemNode
+
+# Constantes de <sys/inotify.h>
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+               | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR)
+_EVENT_HEADER = struct.Struct('iIII') # wd, mask, cookie, len (struct inotify_event)
+
+
+class _InotifyBackend:
+    """
+    Un watch de inotify por directorio del árbol; cada evento devuelve el directorio afectado.
+    inotify sigue los enlaces simbólicos: un directorio alcanzable por varias rutas del árbol
+    (p. ej. d0 y un enlace link_d0 -> d0) comparte watch, y el evento marca todos sus nodos.
+    """
+
+    name = 'inotify'
+
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify solo está disponible en Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falló")
+        self._nodes_of_wd: dict[int, set[FileSystemNode]] = {}
+        self._wd_of_node: dict[FileSystemNode, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._nodes_of_wd)
+
+    def add(self, dir_node: FileSystemNode):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dir_node.path), _WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC: # Límite fs.inotify.max_user_watches alcanzado
+                raise OSError(error, "se alcanzó el límite de watches de inotify (fs.inotify.max_user_watches)")
+            return # El directorio desapareció o no es accesible: su padre informará del cambio
+        if self._wd_of_node.get(dir_node, wd) != wd:
+            self.remove(dir_node) # El nodo apuntaba a otro inodo (directorio reemplazado)
+        # Mismo inodo con otro nodo: otra ruta al directorio (enlace simbólico) o un directorio
+        # movido cuyo origen aún no se dio de baja; el nodo sobrante se quita con remove()
+        self._nodes_of_wd.setdefault(wd, set()).add(dir_node)
+        self._wd_of_node[dir_node] = wd
+
+    def remove(self, dir_node: FileSystemNode):
+        wd = self._wd_of_node.pop(dir_node, None)
+        aliases = self._nodes_of_wd.get(wd) if wd is not None else None
+        if aliases is None:
+            return
+        aliases.discard(dir_node)
+        if not aliases: # Solo se quita el watch cuando ningún nodo lo usa
+            del self._nodes_of_wd[wd]
+            self._libc.inotify_rm_watch(self._fd, wd) # Puede fallar si el kernel ya lo quitó: no importa
+
+    def wait(self, timeout: float) -> tuple[set[FileSystemNode], bool]:
+        """
+        Espera eventos hasta timeout segundos y devuelve (directorios afectados, desbordamiento).
+        Si la cola del kernel se desbordó se perdieron eventos: hace falta un re-escaneo completo.
+        """
+        dirty: set[FileSystemNode] = set()
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return dirty, False
+        try:
+            data = os.read(self._fd, 1 << 16)
+        except BlockingIOError:
+            return dirty, False
+        overflow = False
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size + name_len
+            if mask & _IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            aliases = self._nodes_of_wd.get(wd)
+            if aliases is None:
+                continue
+            if mask & _IN_IGNORED: # El kernel quitó el watch (directorio eliminado o desmontado)
+                del self._nodes_of_wd[wd]
+                for dir_node in aliases:
+                    self._wd_of_node.pop(dir_node, None)
+                continue
+            for dir_node in aliases:
+                if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF) and dir_node.parent is not None:
+                    dirty.add(dir_node.parent) # La baja se aplica al re-listar el padre
+                else:
+                    dirty.add(dir_node)
+        return dirty, overflow
+
+    def close(self):
+        os.close(self._fd)
+
+
+class _PollingBackend:
+    """
+    Alternativa sin inotify: cada poll_interval segundos compara con el disco la fecha (e inodo)
+    de cada directorio y el tamaño/fecha de cada archivo del árbol. Cuesta un stat() por nodo
+    y vuelta, así que los cambios tardan hasta poll_interval en detectarse.
+    """
+
+    name = 'polling'
+
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+        self._dirs: set[FileSystemNode] = set()
+        self._next_poll = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._dirs)
+
+    def add(self, dir_node: FileSystemNode):
+        self._dirs.add(dir_node)
+
+    def remove(self, dir_node: FileSystemNode):
+        self._dirs.discard(dir_node)
+
+    @staticmethod
+    def _changed(node: FileSystemNode) -> bool:
+        try:
+            current = os.stat(node.path)
+        except OSError:
+            return True
+        metadata = node.metadata
+        if metadata is None: # Escaneo --names-only: sin metadatos con que comparar
+            return node.is_directory
+        if node.is_directory:
+            return metadata.st_mtime != current.st_mtime or getattr(metadata, 'st_ino', 0) != current.st_ino
+        return metadata.st_mtime != current.st_mtime or metadata.st_size != current.st_size
+
+    def wait(self, timeout: float) -> tuple[set[FileSystemNode], bool]:
+        remaining = self._next_poll - time.monotonic()
+        if remaining > 0:
+            time.sleep(min(remaining, timeout))
+            if time.monotonic() < self._next_poll:
+                return set(), False
+        self._next_poll = time.monotonic() + self.poll_interval
+        dirty: set[FileSystemNode] = set()
+        for dir_node in list(self._dirs):
+            if self._changed(dir_node):
+                dirty.add(dir_node.parent if dir_node.parent is not None and not os.path.isdir(dir_node.path) else dir_node)
+                continue
+            if any(not child.is_directory and self._changed(child) for child in dir_node.children):
+                dirty.add(dir_node)
+        return dirty, False
+
+    def close(self):
+        pass
+
+
+class TreeWatcher:
+    """
+    Mantiene un DirectoryTree sincronizado con el disco desde un hilo en segundo plano.
+
+    Los cambios se aplican en lotes con el lock del árbol (tree.lock) tomado, así que quien
+    consulte el árbol desde otro hilo debe tomarlo también (el bucle de main.py lo hace para
+    cada comando). Un lote se aplica cuando pasan debounce segundos sin eventos nuevos, o como
+    mucho max_delay segundos después del primero si los eventos no paran.
+    """
+
+    def __init__(self, tree, debounce: float = 0.5, max_delay: float = 5.0,
+                 use_polling: bool = False, poll_interval: float = 2.0):
+        self.tree = tree
+        self.debounce = debounce
+        self.max_delay = max(max_delay, debounce)
+        self.use_polling = use_polling
+        self.poll_interval = poll_interval
+        self._backend = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        # Estadísticas
+        self.batches_applied = 0
+        self.directories_refreshed = 0
+        self.nodes_added = 0
+        self.nodes_removed = 0
+        self.full_rescans = 0
+        self.last_batch_at: float | None = None
+        self.pending_directories = 0
+
+    @property
+    def backend_name(self) -> str | None:
+        return self._backend.name if self._backend is not None else None
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def watched_directories(self) -> int:
+        return len(self._backend) if self._backend is not None else 0
+
+    def _watch_all(self):
+        """Registra todos los directorios del árbol en el backend (si inotify se queda sin watches, pasa a sondeo)."""
+        directories = [node for node in self.tree.node_index.values() if node.is_directory]
+        try:
+            for dir_node in directories:
+                self._backend.add(dir_node)
+        except OSError as e:
+            print(f"Advertencia: {e}; se usará sondeo cada {self.poll_interval:g} s.")
+            self._backend.close()
+            self._backend = _PollingBackend(self.poll_interval)
+            for dir_node in directories:
+                self._backend.add(dir_node)
+
+    def start(self) -> bool:
+        if self.is_running():
+            return True
+        if self.tree.root is None or not self.tree.root.is_directory:
+            print("Árbol vacío. Escanee un directorio primero.")
+            return False
+        self._backend = None
+        if not self.use_polling:
+            try:
+                self._backend = _InotifyBackend()
+            except (OSError, AttributeError) as e: # AttributeError: libc sin inotify_init1
+                print(f"inotify no disponible ({e}); se usará sondeo cada {self.poll_interval:g} s.")
+        if self._backend is None:
+            self._backend = _PollingBackend(self.poll_interval)
+        with self.tree.lock:
+            self._watch_all()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="tree-watcher", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if self._backend is not None:
+            self._backend.close()
+            self._backend = None
+
+    def _run(self):
+        dirty: set[FileSystemNode] = set()
+        overflow = False
+        first_event_at = last_event_at = 0.0
+        while not self._stop.is_set():
+            events, lost = self._backend.wait(min(self.debounce, 0.2) if dirty or overflow else 0.5)
+            now = time.monotonic()
+            if events or lost:
+                if not dirty and not overflow:
+                    first_event_at = now
+                last_event_at = now
+                dirty |= events
+                overflow = overflow or lost
+                self.pending_directories = len(dirty)
+            if (dirty or overflow) and (now - last_event_at >= self.debounce or now - first_event_at >= self.max_delay):
+                if not self._acquire_tree_lock():
+                    break
+                try:
+                    self._apply(dirty, overflow)
+                finally:
+                    self.tree.lock.release()
+                dirty, overflow = set(), False
+                self.pending_directories = 0
+
+    def _acquire_tree_lock(self) -> bool:
+        """Espera el lock del árbol sin bloquear stop() (que puede llamarse con el lock tomado)."""
+        while not self._stop.is_set():
+            if self.tree.lock.acquire(timeout=0.2):
+                return True
+        return False
+
+    def _apply(self, dirty: set[FileSystemNode], overflow: bool):
+        if overflow:
+            # Se perdieron eventos: comparar la fecha de cada directorio con el disco, como j-scan
+            # --incremental, y re-listar solo los que cambiaron. Como en ese re-escaneo, un archivo
+            # modificado en el sitio cuyo evento se perdió no se detecta hasta que su directorio cambie.
+            self.full_rescans += 1
+        counters = self.tree.refresh_directories(
+            dirty,
+            on_directory_added=self._backend.add,
+            on_directory_removed=self._backend.remove,
+            rescan_all=overflow
+        )
+        self.batches_applied += 1
+        self.directories_refreshed += counters['relisted']
+        self.nodes_added += counters['added']
+        self.nodes_removed += counters['removed']
+        self.last_batch_at = time.time()